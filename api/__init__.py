@@ -1,32 +1,91 @@
+import asyncio
 from abc import ABC, abstractmethod
 from asyncio import Task
 from typing import Optional, Dict, Any, List, Tuple
 
-from aiohttp import ClientSession, client_exceptions
-from tenacity import stop_after_attempt, retry
+from aiohttp import ClientSession, TCPConnector, client_exceptions
+from tenacity import stop_after_attempt, retry, RetryError
 from models import Song
+from utils.cache import get_response_cache, ResponseCache
 
 
 class API(ABC):
+    def __init__(self, max_concurrency: int = 8, timeout: Optional[float] = 30, priority: int = 0):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.priority = priority
+        self.semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.session: Optional[ClientSession] = None
+
+    async def open(self) -> ClientSession:
+        # One keep-alive connection pool per provider, shared by every query of a run
+        if self.session is None or self.session.closed:
+            connector: TCPConnector = TCPConnector(limit_per_host=self.max_concurrency, ttl_dns_cache=300,
+                                                   keepalive_timeout=60)
+            self.session = ClientSession(connector=connector)
+
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
     @staticmethod
     @retry(stop=stop_after_attempt(2))
-    async def fetch(url: str, session: ClientSession) -> Optional[Dict[str, Any]]:
+    async def fetch(url: str, session: ClientSession, ttl: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        cache: ResponseCache = get_response_cache()
+        cached_response: Optional[Dict[str, Any]] = cache.get(url)
+        if cached_response is not None:
+            return cached_response
+
         try:
             async with session.get(url) as response:
-                return await response.json()
+                json_response: Optional[Dict[str, Any]] = await response.json()
         except client_exceptions.ContentTypeError as exception:
             print(f"Bad Url: {url}")
             print(exception)
 
             return None
 
+        # Writing commits to disk, which is kept off the event loop
+        if response.status == 200 and json_response is not None:
+            await asyncio.get_event_loop().run_in_executor(None, cache.set, url, json_response,
+                                                           cache.options.search_ttl if ttl is None else ttl)
+
+        return json_response
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        # Semaphores are bound to the loop they are first used on
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        if self.semaphore is None or self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphore_loop = loop
+
+        return self.semaphore
+
+    async def limited_fetch(self, url: str, session: ClientSession, ttl: Optional[int] = None) \
+            -> Optional[Dict[str, Any]]:
+        async with self.get_semaphore():
+            return await self.fetch(url, session, ttl)
+
+    async def fetch_detail(self, url: str, session: ClientSession) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.limited_fetch(url, session, get_response_cache().options.detail_ttl)
+        except (client_exceptions.ClientError, asyncio.TimeoutError, RetryError) as exception:
+            print(f"Bad Url: {url}")
+            print(exception)
+
+            return None
+
     @abstractmethod
     def query(self, user_query: str, session: ClientSession) -> Task:
         pass
 
     @abstractmethod
-    def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float) \
-            -> Tuple[float, Optional[Song]]:
+    async def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float,
+                    session: ClientSession) -> Tuple[float, Optional[Song]]:
         pass
 
     @abstractmethod
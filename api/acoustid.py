@@ -1,17 +1,172 @@
+import asyncio
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from utils.aidmatch import aidmatch
+import acoustid
+from aiohttp import ClientSession, client_exceptions
+from pydantic import BaseModel
+
+from utils.aidmatch import fingerprint
+from utils.fingerprint_store import FingerprintRecord, FingerprintStore, audio_hash, get_fingerprint_store
+
+
+class FingerprintResult(BaseModel):
+    path: str
+    record: Optional[FingerprintRecord] = None
+    error: Optional[str] = None
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second
+        self.next_slot: float = 0
+
+    async def wait(self):
+        now: float = asyncio.get_event_loop().time()
+        delay: float = max(0.0, self.next_slot - now)
+        self.next_slot = max(now, self.next_slot) + self.interval
+        await asyncio.sleep(delay)
+
+
+def fingerprint_file(path: Path) -> FingerprintResult:
+    store: FingerprintStore = get_fingerprint_store()
+
+    try:
+        content_hash: str = audio_hash(path)
+        record: Optional[FingerprintRecord] = store.get(content_hash)
+
+        # Files that were seen before skip the decode
+        if record is None:
+            duration, song_fingerprint = fingerprint(str(path.absolute()))
+            record = FingerprintRecord(content_hash=content_hash, duration=duration, fingerprint=song_fingerprint,
+                                       results=None)
+            store.set(record)
+    except (acoustid.NoBackendError, acoustid.FingerprintGenerationError, OSError) as exception:
+        return FingerprintResult(path=str(path), error=str(exception))
+
+    return FingerprintResult(path=str(path), record=record)
 
 
 class ACOUSTID:
-    def __init__(self, path: Path, api_key: str):
-        self.song_path = path
+    LOOKUP_URL = "https://api.acoustid.org/v2/lookup"
+
+    def __init__(self, api_key: Optional[str], batch_size: int = 10, requests_per_second: float = 3,
+                 batch_delay: float = 0.5):
         self.api_key = api_key
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.rate_limiter: RateLimiter = RateLimiter(requests_per_second)
+        self.pending: List[Tuple[FingerprintResult, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.session: Optional[ClientSession] = None
+
+    async def open(self) -> ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = ClientSession()
+
+        return self.session
+
+    async def close(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        self.resolve(self.pending, "closed before the lookup was sent")
+        self.pending = []
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def lookup(self, fingerprint_result: FingerprintResult) -> FingerprintResult:
+        assert fingerprint_result.record is not None
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        future: asyncio.Future = loop.create_future()
+        self.pending.append((fingerprint_result, future))
+
+        # Lookups are sent together once a batch is full or the first one has waited long enough
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_delay, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch: List[Tuple[FingerprintResult, asyncio.Future]] = self.pending[:self.batch_size]
+        self.pending = self.pending[self.batch_size:]
+        asyncio.ensure_future(self.send(batch))
+
+        if len(self.pending) > 0:
+            self.flush_handle = asyncio.get_event_loop().call_later(self.batch_delay, self.flush)
+
+    async def send(self, batch: List[Tuple[FingerprintResult, asyncio.Future]]):
+        data: Dict[str, str] = {
+            'client': str(self.api_key),
+            'meta': 'recordings',
+            'format': 'json'
+        }
+
+        for index, (fingerprint_result, _) in enumerate(batch):
+            assert fingerprint_result.record is not None
+            data[f"fingerprint.{index}"] = fingerprint_result.record.fingerprint.decode("ascii")
+            data[f"duration.{index}"] = str(int(fingerprint_result.record.duration))
+
+        error: Optional[str] = None
+        results_by_index: Dict[int, List[Dict[str, Any]]] = {}
+
+        try:
+            try:
+                await self.rate_limiter.wait()
+                session: ClientSession = await self.open()
+                async with session.post(self.LOOKUP_URL, data=data) as response:
+                    body: Dict[str, Any] = await response.json()
+
+                if body.get("status") != "ok":
+                    error = body.get("error", {}).get("message", "unknown error")
+                else:
+                    results_by_index = {int(element["index"]): element["results"]
+                                        for element in body["fingerprints"]}
+            except (client_exceptions.ClientError, asyncio.TimeoutError, ValueError, KeyError) as exception:
+                error = str(exception)
+
+            store: FingerprintStore = get_fingerprint_store()
+            for index, (fingerprint_result, future) in enumerate(batch):
+                if error is not None:
+                    fingerprint_result.error = f"web service request failed: {error}"
+                else:
+                    assert fingerprint_result.record is not None
+                    fingerprint_result.record.results = self.parse_results(results_by_index.get(index, []))
+                    store.set(fingerprint_result.record)
+
+                if not future.done():
+                    future.set_result(fingerprint_result)
+        finally:
+            # Whatever stopped the batch, the files waiting on it go on without a lookup
+            self.resolve(batch, "web service request was interrupted")
+
+    @staticmethod
+    def resolve(batch: List[Tuple[FingerprintResult, asyncio.Future]], error: str):
+        for fingerprint_result, future in batch:
+            if not future.done():
+                fingerprint_result.error = error
+                future.set_result(fingerprint_result)
+
+    @staticmethod
+    def parse_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        parsed_results = acoustid.parse_lookup_result({'status': 'ok', 'results': results})
+        return [{'score': s, 'rid': r, 'title': t, 'artist': a} for s, r, t, a in parsed_results]
+
+    @staticmethod
+    def best_match(fingerprint_result: FingerprintResult) -> Optional[Dict[str, Union[str, float]]]:
+        if fingerprint_result.record is None or fingerprint_result.record.results is None:
+            return None
 
-    def inference(self) -> Optional[Dict[str, Union[str, float]]]:
-        absolute_path: str = str(self.song_path.absolute())
-        results = aidmatch(absolute_path, self.api_key)
+        results = fingerprint_result.record.results
 
         if len(results) < 1:
             return None
@@ -3,16 +3,17 @@ import urllib.parse
 from asyncio import Task
 from typing import Any, Dict, Optional, List, Tuple
 
-import requests
 from aiohttp import ClientSession
 
 from api import API
 from models import Song
-from utils.text_processing import clean_string, calculate_similarity
+from utils.similarity import BatchScorer
+from utils.text_processing import clean_string
 
 
 class GENIUS(API):
     def __init__(self, token: Optional[str]):
+        super().__init__()
         self.token = token
         self.BASE_URL = "https://api.genius.com"
 
@@ -23,21 +24,22 @@ class GENIUS(API):
         return f"{self.BASE_URL}{api}?access_token={self.token}"
 
     def query(self, user_query: str, session: ClientSession) -> Task:
-        return asyncio.create_task(self.fetch(f"{self.SEARCH_URL}&q={user_query}", session))
+        return asyncio.create_task(self.limited_fetch(f"{self.SEARCH_URL}&q={user_query}", session))
 
-    def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float) \
-            -> Tuple[float, Optional[Song]]:
+    async def song_request(self, api_path: str, session: ClientSession) -> Optional[Dict[str, Any]]:
+        return await self.fetch_detail(self.get_song_url(api_path), session)
+
+    async def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float,
+                    session: ClientSession) -> Tuple[float, Optional[Song]]:
 
         song_name: Optional[str] = None
         artists: Optional[str] = None
         album_art: Optional[str] = None
         album_name: Optional[str] = None
-        index: int = -1
         results: List[Tuple[float, Optional[str], Optional[str], Optional[str]]] = []
+        song_results: List[Dict[str, Any]] = []
 
         for response in response_list:
-            index += 1
-
             # Check for empty response
             if response is None:
                 continue
@@ -50,55 +52,61 @@ class GENIUS(API):
             if len(response["response"]["hits"]) < 1:
                 continue
 
-            for song in response["response"]["hits"]:
-                similarity: Optional[float] = None
+            song_results.extend(song["result"] for song in response["response"]["hits"]
+                                if song.get("result") is not None)
 
-                if song.get("result") is None:
-                    continue
+        # Fetch the details of every hit at the same time
+        api_paths: List[str] = list(dict.fromkeys(song_result["api_path"] for song_result in song_results
+                                                  if song_result.get("api_path") is not None))
+        api_results: Dict[str, Optional[Dict[str, Any]]] = dict(zip(api_paths, await asyncio.gather(
+            *[self.song_request(api_path, session) for api_path in api_paths])))
 
-                song_result: Dict[str, Any] = song["result"]
+        # Score every title against the query in one go
+        titles: List[str] = [song_result["title"] for song_result in song_results
+                             if song_result.get("title") is not None]
+        similarities: Dict[str, float] = dict(zip(titles, BatchScorer(initial_query).score_many(titles)))
 
-                if song_result.get("api_path") is not None:
-                    print(song_result.get("title"))
-                    print(song_result["api_path"])
-                    api_path = song_result["api_path"]
-                    api_result: Dict[str, Any] = requests.get(self.get_song_url(api_path)).json()
-                    if api_result is None:
-                        continue
+        for song_result in song_results:
+            similarity: Optional[float] = None
 
-                    if api_result["meta"]["status"] != 200:
-                        continue
+            if song_result.get("api_path") is not None:
+                api_result: Optional[Dict[str, Any]] = api_results[song_result["api_path"]]
+                if api_result is None:
+                    continue
 
-                    try:
-                        if api_result["response"]["song"]["album"]["name"] is not None:
-                            album_name = api_result["response"]["song"]["album"]["name"]
-                        else:
-                            continue
-                    except (KeyError, TypeError):
+                if api_result["meta"]["status"] != 200:
+                    continue
+
+                try:
+                    if api_result["response"]["song"]["album"]["name"] is not None:
+                        album_name = api_result["response"]["song"]["album"]["name"]
+                    else:
                         continue
+                except (KeyError, TypeError):
+                    continue
 
-                if song_result.get("title") is not None:
-                    song_name = song_result["title"]
+            if song_result.get("title") is not None:
+                song_name = song_result["title"]
 
-                    assert song_name is not None
-                    similarity = calculate_similarity(song_name, initial_query)
+                assert song_name is not None
+                similarity = similarities[song_name]
 
-                    assert similarity is not None
-                    if similarity < best_similarity:
-                        continue
+                assert similarity is not None
+                if similarity < best_similarity:
+                    continue
 
-                if song_result.get("primary_artist") is not None and \
-                        song_result["primary_artist"].get("name") is not None:
-                    artists = song_result["primary_artist"]["name"]
+            if song_result.get("primary_artist") is not None and \
+                    song_result["primary_artist"].get("name") is not None:
+                artists = song_result["primary_artist"]["name"]
 
-                    if 'genius' in clean_string(artists) or 'eddie van der meer' in clean_string(artists):
-                        continue
+                if 'genius' in clean_string(artists) or 'eddie van der meer' in clean_string(artists):
+                    continue
 
-                if song_result.get("header_image_url") is not None:
-                    album_art = song_result["header_image_url"]
+            if song_result.get("header_image_url") is not None:
+                album_art = song_result["header_image_url"]
 
-                if song_name is not None and artists is not None and album_art is not None and similarity is not None:
-                    results.append((similarity, song_name, artists, album_art))
+            if song_name is not None and artists is not None and album_art is not None and similarity is not None:
+                results.append((similarity, song_name, artists, album_art))
 
         if len(results) < 1:
             return 0, None
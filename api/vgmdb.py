@@ -4,38 +4,36 @@ import urllib.parse
 from asyncio import Task
 from typing import List, Optional, Dict, Any, Tuple
 
-import requests
 from aiohttp import ClientSession
-from tenacity import retry, stop_after_attempt, retry_if_result
 
 from api import API
 from models import Song
-from utils.text_processing import calculate_similarity
+from utils.similarity import BatchScorer
 
 
 class VGMDB(API):
     def __init__(self):
+        super().__init__()
         self.BASE_URL = "https://vgmdb.info"
         self.SEARCH_URL = f"{self.BASE_URL}/search"
 
     def query(self, user_query: str, session: ClientSession) -> Task:
-        return asyncio.create_task(self.fetch(f"{self.SEARCH_URL}/{user_query}?format=json", session))
+        return asyncio.create_task(self.limited_fetch(f"{self.SEARCH_URL}/{user_query}?format=json", session))
 
-    @retry(stop=stop_after_attempt(2), retry_error_callback=lambda state: None)
-    def album_request(self, album_code: str) -> Optional[Dict[str, str]]:
-        return requests.get(f"{self.BASE_URL}/{album_code}?format=json").json()
+    async def album_request(self, album_code: str, session: ClientSession) -> Optional[Dict[str, Any]]:
+        return await self.fetch_detail(f"{self.BASE_URL}/{album_code}?format=json", session)
 
-    def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float) \
-            -> Tuple[float, Optional[Song]]:
+    async def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float,
+                    session: ClientSession) -> Tuple[float, Optional[Song]]:
 
         song_name: Optional[str] = None
         artists: Optional[str] = None
         album_name: Optional[str] = None
-        index: int = -1
         best_song: Optional[Song] = None
+        album_codes: List[str] = []
+        candidates: List[Song] = []
 
         for search_result in response_list:
-            index += 1
             if search_result is None:
                 continue
 
@@ -44,74 +42,78 @@ class VGMDB(API):
             if len(albums) < 1:
                 continue
 
-            for album in albums:
-                album_code: str = album["link"]
-                try:
-                    album_details: Dict[str, Any] = self.album_request(album_code)
-                    if album_details is None:
-                        continue
-                except requests.exceptions.ChunkedEncodingError:
-                    print("Bad Url")
-                    continue
+            album_codes.extend(album["link"] for album in albums)
 
-                album_art = album_details["picture_full"]
-                album_name = album_details["name"]
+        # Fetch every album once, all at the same time
+        unique_album_codes: List[str] = list(dict.fromkeys(album_codes))
+        album_details_list: List[Optional[Dict[str, Any]]] = await asyncio.gather(
+            *[self.album_request(album_code, session) for album_code in unique_album_codes])
 
-                if album_name is None:
-                    continue
+        for album_details in album_details_list:
+            if album_details is None:
+                continue
+
+            album_art = album_details["picture_full"]
+            album_name = album_details["name"]
+
+            if album_name is None:
+                continue
 
-                # Ignore albums with no album art or track listings
-                assert album_art is not None and len(album_art) > 0 and album_details["discs"] is not None
-                if "nocover" in album_art or len(album_details["discs"]) < 1:
-                    continue
+            # Ignore albums with no album art or track listings
+            assert album_art is not None and len(album_art) > 0 and album_details["discs"] is not None
+            if "nocover" in album_art or len(album_details["discs"]) < 1:
+                continue
 
-                track_names: List[Dict[str, Any]] = [track["names"] for track in album_details["discs"][0]["tracks"]]
+            track_names: List[Dict[str, Any]] = [track["names"] for track in album_details["discs"][0]["tracks"]]
 
-                # If english name exists, make that the song name
-                romaji_existed: bool = False
-                for track in track_names:
-                    romaji_name: Optional[str] = track.get("Romaji")
+            # If english name exists, make that the song name
+            romaji_existed: bool = False
+            for track in track_names:
+                romaji_name: Optional[str] = track.get("Romaji")
 
-                    if romaji_name is not None:
-                        romaji_existed = True
-                        song_name = romaji_name
-                        break
+                if romaji_name is not None:
+                    romaji_existed = True
+                    song_name = romaji_name
+                    break
 
-                    english_name: Optional[str] = track.get("English")
+                english_name: Optional[str] = track.get("English")
 
-                    if english_name is not None:
-                        romaji_existed = True
-                        song_name = english_name
-                        break
+                if english_name is not None:
+                    romaji_existed = True
+                    song_name = english_name
+                    break
 
-                # Else make the japanese name as the title of the song
-                if not romaji_existed:
-                    song_name = track_names[0].get("Japanese")
+            # Else make the japanese name as the title of the song
+            if not romaji_existed:
+                song_name = track_names[0].get("Japanese")
 
-                if song_name is None:
-                    continue
+            if song_name is None:
+                continue
 
-                performers: List[Dict[str, Any]] = album_details["performers"]
-                artist_list: List[str] = []
+            performers: List[Dict[str, Any]] = album_details["performers"]
+            artist_list: List[str] = []
 
-                for performer in performers:
-                    names: Dict[str, str] = performer["names"]
-                    english_name = names.get("en")
+            for performer in performers:
+                names: Dict[str, str] = performer["names"]
+                english_name = names.get("en")
 
-                    # Add japanese name if there is no english name for the artist
-                    if english_name is None:
-                        name = names["ja"]
-                    else:
-                        name = english_name
+                # Add japanese name if there is no english name for the artist
+                if english_name is None:
+                    name = names["ja"]
+                else:
+                    name = english_name
 
-                    artist_list.append(name)
+                artist_list.append(name)
 
-                artists = ", ".join(artist_list)
+            artists = ", ".join(artist_list)
+            candidates.append(Song(song_name=song_name, artists=artists, album_art=album_art, album_name=album_name))
 
-                current_similarity: float = calculate_similarity(song_name, initial_query)
-                if current_similarity > best_similarity:
-                    best_song = Song(song_name=song_name, artists=artists, album_art=album_art, album_name=album_name)
-                    best_similarity = current_similarity
+        # Score every candidate against the query in one go
+        scores: List[float] = BatchScorer(initial_query).score_many([candidate.song_name for candidate in candidates])
+        for candidate, current_similarity in zip(candidates, scores):
+            if current_similarity > best_similarity:
+                best_song = candidate
+                best_similarity = current_similarity
 
         if song_name is None or artists is None or album_name is None:
             return best_similarity, None
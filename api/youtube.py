@@ -0,0 +1,83 @@
+import asyncio
+from os import getenv
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession, TCPConnector, client_exceptions
+
+from utils.cache import ResponseCache, get_response_cache
+
+
+class YOUTUBE:
+    VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
+    MAX_BATCH_SIZE = 50
+
+    def __init__(self, api_key: Optional[str], batch_size: int = MAX_BATCH_SIZE, max_concurrency: int = 4,
+                 ttl: int = 24 * 60 * 60, videos_url: Optional[str] = None):
+        self.api_key = api_key
+        self.batch_size = min(batch_size, self.MAX_BATCH_SIZE)
+        self.max_concurrency = max_concurrency
+        self.ttl = ttl
+        self.videos_url = videos_url if videos_url is not None else getenv("YOUTUBE_VIDEOS_URL", self.VIDEOS_URL)
+        self.session: Optional[ClientSession] = None
+
+    async def open(self) -> ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(connector=TCPConnector(limit_per_host=self.max_concurrency))
+
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def cache_key(self, video_id: str) -> str:
+        return f"{self.videos_url}?part=id&id={video_id}"
+
+    async def fetch_batch(self, video_ids: List[str], semaphore: asyncio.Semaphore) -> Dict[str, Optional[bool]]:
+        url: str = f"{self.videos_url}?part=id&id={','.join(video_ids)}&key={self.api_key}"
+
+        try:
+            async with semaphore:
+                session: ClientSession = await self.open()
+                async with session.get(url) as response:
+                    body: Dict[str, Any] = await response.json()
+                    status: int = response.status
+        except (client_exceptions.ClientError, asyncio.TimeoutError, ValueError) as exception:
+            print(f"Could not check the health of {len(video_ids)} videos: {exception}")
+            return {video_id: None for video_id in video_ids}
+
+        if status != 200 or "items" not in body:
+            print(f"Could not check the health of {len(video_ids)} videos: {body.get('error', status)}")
+            return {video_id: None for video_id in video_ids}
+
+        # Videos that were removed or made private are simply missing from the items
+        available_ids = {item["id"] for item in body["items"]}
+        cache: ResponseCache = get_response_cache()
+        health: Dict[str, Optional[bool]] = {video_id: video_id in available_ids for video_id in video_ids}
+        await asyncio.get_event_loop().run_in_executor(
+            None, cache.set_many, [(self.cache_key(video_id), available) for video_id, available in health.items()],
+            self.ttl)
+
+        return health
+
+    async def check(self, video_ids: List[str]) -> Dict[str, Optional[bool]]:
+        cache: ResponseCache = get_response_cache()
+        health: Dict[str, Optional[bool]] = {}
+        unknown_ids: List[str] = []
+
+        for video_id in dict.fromkeys(video_ids):
+            cached_health: Optional[bool] = cache.get(self.cache_key(video_id))
+            if cached_health is None:
+                unknown_ids.append(video_id)
+            else:
+                health[video_id] = cached_health
+
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches: List[List[str]] = [unknown_ids[index:index + self.batch_size]
+                                    for index in range(0, len(unknown_ids), self.batch_size)]
+
+        for batch_health in await asyncio.gather(*[self.fetch_batch(batch, semaphore) for batch in batches]):
+            health.update(batch_health)
+
+        return health
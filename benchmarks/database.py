@@ -0,0 +1,111 @@
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+import mongomock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tests.counting_collection import CountingCollection  # noqa: E402
+from utils.database import DatabaseHandler, indexed_databases, name_key  # noqa: E402
+from utils.text_processing import clean_string  # noqa: E402
+from utils.video_ids import video_id  # noqa: E402
+
+
+def create_handler(counter: Counter) -> DatabaseHandler:
+    database: Any = mongomock.MongoClient()["benchmark"]
+    handler: DatabaseHandler = DatabaseHandler.__new__(DatabaseHandler)
+    handler.database = database
+    handler.download_collection = database["downloaded"]
+    handler.blacklist_collection = database["blacklist"]
+    handler.playlist_collection = database["playlists"]
+    # Every measurement starts from a new in-memory database
+    indexed_databases.discard(database.name)
+    handler.ensure_indexes()
+
+    handler.download_collection = CountingCollection(handler.download_collection, counter)
+    handler.blacklist_collection = CountingCollection(handler.blacklist_collection, counter)
+    handler.playlist_collection = CountingCollection(handler.playlist_collection, counter)
+
+    return handler
+
+
+# How the handler worked before, one existence check per url and whole collections for membership
+def legacy_add_many(collection: Any, urls: List[str], names: List[str]):
+    existing_urls: List[str] = [url for url in urls if len(list(collection.find({'url': url}))) > 0]
+    collection.insert_many([{'url': url, 'video_id': video_id(url), 'name': name} for url, name in zip(urls, names)
+                            if url not in existing_urls])
+
+
+def legacy_select(handler: DatabaseHandler, urls: List[str]) -> List[str]:
+    blacklist_urls: List[str] = [element['url'] for element in handler.blacklist_collection.find({})]
+    downloaded_urls: List[str] = [element['url'] for element in handler.download_collection.find({})]
+
+    return [url for url in urls if url not in blacklist_urls and url not in downloaded_urls]
+
+
+def legacy_rename(handler: DatabaseHandler, renames: List[Tuple[str, str]]):
+    for old_name, new_name in renames:
+        for download in handler.download_collection.find({}):
+            if clean_string(old_name) == clean_string(download['name']):
+                handler.download_collection.find_one_and_update({'_id': download['_id']},
+                                                                {'$set': {'new_name': new_name}})
+                break
+
+
+def bulk_select(handler: DatabaseHandler, urls: List[str]) -> List[str]:
+    ids: List[str] = [video_id(url) for url in urls]
+    known_ids: Set[str] = handler.find_video_ids(ids, handler.blacklist_collection) | \
+        handler.find_video_ids(ids, handler.download_collection)
+
+    return [url for url in urls if video_id(url) not in known_ids]
+
+
+def measure(name: str, run: Callable[[DatabaseHandler], Any], library_size: int):
+    counter: Counter = Counter()
+    handler: DatabaseHandler = create_handler(counter)
+
+    library: List[str] = [f"https://youtu.be/library{index:06d}" for index in range(library_size)]
+    handler.download_collection.collection.insert_many([{'url': url, 'video_id': video_id(url), 'name': url[-13:],
+                                                         'name_key': name_key(url[-13:])} for url in library])
+    handler.blacklist_collection.collection.insert_many([{'url': url, 'video_id': video_id(url)}
+                                                         for url in library[:library_size // 10]])
+
+    start: float = time.perf_counter()
+    run(handler)
+    elapsed: float = time.perf_counter() - start
+
+    # mongomock runs in process, so against a real server the round trips are what the time is spent on
+    counts: Dict[str, int] = dict(counter)
+    print(f"  {name}: {counts.get('round trips', 0)} round trips, {counts.get('documents read', 0)} documents read, "
+          f"{elapsed * 1000:.1f}ms")
+
+
+def main():
+    library_size: int = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    playlist: List[str] = [f"https://youtu.be/library{index:06d}" for index in range(0, library_size, 10)] + \
+                          [f"https://youtu.be/new{index:06d}" for index in range(100)]
+    names: List[str] = [url[-13:] for url in playlist]
+
+    print(f"select new videos from a {len(playlist)} item playlist, {library_size} songs in the library")
+    measure("before", lambda handler: legacy_select(handler, playlist), library_size)
+    measure("after", lambda handler: bulk_select(handler, playlist), library_size)
+
+    print(f"record {len(playlist)} downloads, {len(playlist) - 100} of them already known")
+    measure("before", lambda handler: legacy_add_many(handler.download_collection, playlist, names), library_size)
+    measure("after", lambda handler: handler.add_many_to_downloaded(playlist, names), library_size)
+
+    print(f"blacklist {len(playlist)} videos")
+    measure("before", lambda handler: legacy_add_many(handler.blacklist_collection, playlist, names), library_size)
+    measure("after", lambda handler: handler.add_many_to_blacklist(playlist), library_size)
+
+    renames: List[Tuple[str, str]] = [(name, f"Tagged {name}") for name in names[:50]] + [("missing", "Missing")]
+    print(f"apply {len(renames)} renames from a tagging run")
+    measure("before", lambda handler: legacy_rename(handler, renames), library_size)
+    measure("after", lambda handler: handler.rename_downloaded(renames), library_size)
+
+
+if __name__ == "__main__":
+    main()
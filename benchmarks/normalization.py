@@ -0,0 +1,55 @@
+import re
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import normalization  # noqa: E402
+
+LEGACY_STOPWORDS: List[str] = ["amv", "hd", 'lyrics']
+
+TITLES: List[str] = [
+    "Naruto Shippuden Opening 16 | Silhouette (HD)",
+    "【MAD】Tokyo Ghoul - unravel [Full Lyrics]",
+    "Shingeki no Kyojin OP - Guren no Yumiya (AMV)",
+    "ＬｉＳＡ「紅蓮華」Music Video",
+    "Fullmetal Alchemist: Brotherhood OP 4 - Period",
+    "Sword Art Online - Crossing Field (Lyrics/Romaji/English)",
+]
+
+
+# The clean_string pipeline before utils.normalization existed
+def legacy_clean_string(text: str) -> str:
+    removed_punctuation: str = re.sub('[%s]' % re.escape(string.punctuation), ' ', text).lower()
+    removed_spaces: str = re.sub(' +', ' ', removed_punctuation)
+    return ' '.join([word for word in removed_spaces.split(' ') if word not in LEGACY_STOPWORDS])
+
+
+def strings_per_second(clean: Callable[[str], str], strings: List[str]) -> float:
+    start: float = time.perf_counter()
+    for text in strings:
+        clean(text)
+
+    return len(strings) / (time.perf_counter() - start)
+
+
+def main():
+    repeat: int = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # A batch cleans the same titles over and over, plus a share of strings it has never seen
+    strings: List[str] = [f"{title} {index % 500}" for index in range(repeat) for title in TITLES]
+
+    legacy: float = strings_per_second(legacy_clean_string, strings)
+    normalization.normalize.cache_clear()
+    cold: float = strings_per_second(normalization.normalize.__wrapped__, strings)
+    memoized: float = strings_per_second(normalization.normalize, strings)
+
+    print(f"legacy clean_string: {legacy:,.0f} strings/s")
+    print(f"normalize (no memo): {cold:,.0f} strings/s ({cold / legacy:.1f}x)")
+    print(f"normalize (memo): {memoized:,.0f} strings/s ({memoized / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
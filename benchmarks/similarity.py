@@ -0,0 +1,49 @@
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tests.test_similarity import GOLDEN_SET  # noqa: E402
+from utils.similarity import BatchScorer, fuzz  # noqa: E402
+from utils.text_processing import calculate_similarity  # noqa: E402
+
+# Suffixes VGMDB puts on the other tracks of a release, every one of them makes a distinct candidate
+VARIANTS: List[str] = ["", " (TV size)", " (Instrumental)", " -Acoustic Version-", " (Off Vocal)", " Remix"]
+
+
+def candidate_pool() -> List[str]:
+    titles: List[str] = [candidate for _, candidates in GOLDEN_SET for candidate in candidates]
+    return [f"{title}{variant}" for title in titles for variant in VARIANTS]
+
+
+def candidates_per_second(score: Callable[[str, List[str]], List[float]], repeat: int) -> float:
+    pool: List[str] = candidate_pool()
+    candidates: int = 0
+    start: float = time.perf_counter()
+    for _ in range(repeat):
+        for query, _ in GOLDEN_SET:
+            score(query, pool)
+            candidates += len(pool)
+
+    return candidates / (time.perf_counter() - start)
+
+
+def main():
+    repeat: int = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    backends: List[str] = ["difflib"] + (["rapidfuzz"] if fuzz is not None else [])
+    print(f"{len(candidate_pool())} distinct candidates per query")
+
+    baseline: float = candidates_per_second(
+        lambda query, batch: [calculate_similarity(candidate, query) for candidate in batch], repeat)
+    print(f"calculate_similarity: {baseline:,.0f} candidates/s")
+
+    for backend in backends:
+        throughput: float = candidates_per_second(
+            lambda query, batch: BatchScorer(query, backend).score_many(batch), repeat)
+        print(f"BatchScorer[{backend}]: {throughput:,.0f} candidates/s ({throughput / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import List
+
+ROOT: Path = Path(__file__).resolve().parent.parent
+
+SERVE = "import uvicorn, server; uvicorn.run(server.app, host='127.0.0.1', port={port}, log_level='warning')"
+
+# What server.py used to import before anything could be served
+EAGER = "import fetchvids, tagger, utils.google_drive, pyfcm; "
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def time_until_served(code: str, timeout: float = 60) -> float:
+    port: int = free_port()
+    start: float = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code.format(port=port)], cwd=str(ROOT))
+
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+
+        raise TimeoutError(f"/ was not served within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    runs: int = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    lazy_times: List[float] = [time_until_served(SERVE) for _ in range(runs)]
+    print(f"lazy startup: {min(lazy_times):.3f}s best, {sum(lazy_times) / runs:.3f}s mean until / is served")
+
+    eager_times: List[float] = [time_until_served(EAGER + SERVE) for _ in range(runs)]
+    print(f"eager startup: {min(eager_times):.3f}s best, {sum(eager_times) / runs:.3f}s mean until / is served")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import eyed3
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.tag_writer import TagWriter  # noqa: E402
+
+# MPEG 1 layer III, 128 kbit/s, 44.1 kHz, every frame is 417 bytes long
+FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+ALBUM_ART = os.urandom(48 * 1024)
+WORKERS = 4
+
+
+def written_bytes() -> int:
+    try:
+        with open("/proc/self/io") as io_stats:
+            for line in io_stats:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return 0
+
+
+def create_library(directory: Path, file_count: int, audio_bytes: int):
+    audio: bytes = FRAME * (audio_bytes // len(FRAME))
+
+    for index in range(file_count):
+        path: Path = directory / f"Song {index:04d} (Official Video).mp3"
+        path.write_bytes(audio)
+
+        # What youtube-dl leaves behind, a small tag with the video title
+        audio_file = eyed3.load(str(path))
+        audio_file.initTag()
+        audio_file.tag.title = f"Song {index:04d} (Official Video)"
+        audio_file.tag.artist = "Uploader"
+        audio_file.tag.save()
+
+
+def set_tags(path: Path, first_pass: bool):
+    audio_file = eyed3.load(str(path))
+    if first_pass:
+        audio_file.tag.title = path.stem.replace(" (Official Video)", "")
+        audio_file.tag.artist = "Artist"
+        audio_file.tag.album = "Album"
+        audio_file.tag.images.set(3, ALBUM_ART, "image/jpeg", "Album")
+    else:
+        # A second run that only adds a few hundred bytes of text
+        audio_file.tag.comments.set("x" * 300)
+
+    return audio_file
+
+
+# How tagger.write_song saved the file before
+def legacy_write(path: Path, first_pass: bool):
+    audio_file = set_tags(path, first_pass)
+    audio_file.tag.save()
+
+    os.rename(str(path), str(path.parent / f"{audio_file.tag.title}.mp3"))
+    for file_to_remove in glob.glob(str(path.parent) + "/*.mp3.mp3"):
+        os.remove(file_to_remove)
+
+
+def tag_writer_write(tag_writer: TagWriter) -> Callable[[Path, bool], None]:
+    def write(path: Path, first_pass: bool):
+        audio_file = set_tags(path, first_pass)
+        tag_writer.write(audio_file.tag, audio_file.tag.title)
+
+    return write
+
+
+def run(directory: Path, write: Callable[[Path, bool], None], first_pass: bool) -> Dict[str, float]:
+    paths: List[Path] = sorted(directory.iterdir())
+    bytes_before: int = written_bytes()
+    start: float = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        list(pool.map(write, paths, [first_pass] * len(paths)))
+
+    return {
+        'seconds': time.perf_counter() - start,
+        'written MB': (written_bytes() - bytes_before) / 1024 / 1024
+    }
+
+
+def main():
+    file_count: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    audio_bytes: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1024 * 1024
+
+    # eyed3 warns about every synthetic frame it does not recognise
+    eyed3.log.setLevel("ERROR")
+
+    root: Path = Path(tempfile.mkdtemp())
+    try:
+        library: Path = root / "library"
+        library.mkdir()
+        create_library(library, file_count, audio_bytes)
+        print(f"{file_count} files of {audio_bytes // 1024} KB")
+
+        for name, write in (("legacy", legacy_write), ("tag writer", tag_writer_write(TagWriter()))):
+            directory: Path = root / name
+            shutil.copytree(str(library), str(directory))
+
+            for run_name, first_pass in (("first run", True), ("second run", False)):
+                result: Dict[str, float] = run(directory, write, first_pass)
+                print(f"{name}, {run_name}: {result['seconds']:.2f}s, {result['written MB']:.0f} MB written")
+    finally:
+        shutil.rmtree(str(root), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Keeps the benchmark away from the real response cache
+os.environ.setdefault("CACHE_PATH", str(Path(tempfile.mkdtemp()) / "responses.sqlite"))
+
+from api.youtube import YOUTUBE  # noqa: E402
+from tests.youtube_stub import YouTubeStub  # noqa: E402
+
+
+async def main():
+    video_count: int = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    video_ids: List[str] = [f"video{index:04d}" for index in range(video_count)]
+    stub: YouTubeStub = YouTubeStub({video_id for index, video_id in enumerate(video_ids) if index % 10 != 0})
+    runner: web.AppRunner = await stub.start()
+    youtube: YOUTUBE = YOUTUBE("stub-key", videos_url=stub.url(runner))
+    try:
+        for run in ("cold", "cached"):
+            requests_before: int = stub.requests
+            start: float = time.perf_counter()
+            health: Dict[str, Optional[bool]] = await youtube.check(video_ids)
+            elapsed: float = time.perf_counter() - start
+
+            unavailable: int = sum(1 for is_available in health.values() if not is_available)
+            print(f"{run}: {len(health)} videos, {unavailable} unavailable, "
+                  f"{stub.requests - requests_before} requests in {elapsed:.3f}s")
+
+        # What one request per video costs against the same stub latency
+        print(f"one request per video would take at least {video_count * stub.latency:.1f}s")
+    finally:
+        await youtube.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,21 @@
+import asyncio
 import os
 import shutil
 import subprocess
 from os import getenv
 from pathlib import Path
 from subprocess import Popen, PIPE
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 
-import json
+from api.youtube import YOUTUBE
 from models import DatabaseOptions
 from utils.database import DatabaseHandler
+from utils.downloader import Downloader, DownloadResult
+from utils.tag_writer import claim_name
+from utils.video_ids import video_id
+from utils.workspace import Workspace, get_workspace_manager
 
 
 def get_vid_list(cookie_path: Path, playlist_url: str) -> List[str]:
@@ -23,101 +28,154 @@ def get_vid_list(cookie_path: Path, playlist_url: str) -> List[str]:
     return filtered_urls
 
 
-def download_vids(download_path: Path, url_list: List[str], db: DatabaseHandler, max_number: Optional[int] = None) \
-        -> List[str]:
+async def check_vid_health(youtube_key: str, video_ids: List[str]) -> Dict[str, Optional[bool]]:
+    youtube: YOUTUBE = YOUTUBE(youtube_key)
+
+    try:
+        return await youtube.check(video_ids)
+    finally:
+        await youtube.close()
+
+
+def select_vids(url_list: List[str], db: DatabaseHandler, max_number: Optional[int] = None) \
+        -> Tuple[List[str], List[str]]:
 
     if max_number is None:
         max_number = len(url_list)
 
-    blacklist_urls: List[str] = list(db.get_all_blacklist_urls())
-    already_downloaded_list: List[str] = list(db.get_all_downloaded_urls())
+    # Only the ids of this batch are looked up, instead of loading both collections
+    batch_ids: List[str] = list(dict.fromkeys(video_id(url) for url in url_list))
+    blacklisted_ids: Set[str] = db.find_video_ids(batch_ids, db.blacklist_collection)
+    downloaded_ids: Set[str] = db.find_video_ids(batch_ids, db.download_collection)
     urls_to_be_blacklisted: List[str] = []
     number_of_vids_downloaded: int = 0
     downloading_url_list: List[str] = []
 
+    candidate_urls: List[str] = []
     for url in url_list:
-        if url in blacklist_urls:
+        url_video_id: str = video_id(url)
+
+        if url_video_id in blacklisted_ids:
             print(f"Not executing url {url} since it is in blacklist")
             continue
 
-        if url in already_downloaded_list:
+        if url_video_id in downloaded_ids:
             print(f"{url} has already been downloaded")
             continue
 
-        assert len(url) > 18
-        youtube_key = getenv("YOUTUBE_KEY")
+        # Playlists can share videos, each one is only downloaded once
+        downloaded_ids.add(url_video_id)
+        candidate_urls.append(url)
+
+    youtube_key = getenv("YOUTUBE_KEY")
+    assert youtube_key is not None
 
-        assert youtube_key is not None
-        vid_health = subprocess.run(["sh", "scripts/get_vid_health.sh", url[17:], youtube_key], stdout=PIPE)
+    # Every candidate is checked up front, a few requests of up to 50 ids each
+    vid_health: Dict[str, Optional[bool]] = asyncio.run(
+        check_vid_health(youtube_key, [video_id(url) for url in candidate_urls]))
 
-        try:
-            items = json.loads(vid_health.stdout.decode('utf-8').rstrip())['items']
-        except json.decoder.JSONDecodeError:
-            print("Unknown Error")
+    for url in candidate_urls:
+        is_available: Optional[bool] = vid_health.get(video_id(url))
+
+        if is_available is None:
+            print(f"Could not check the health of {url}")
             continue
 
-        if len(items) == 0:
+        if not is_available:
             urls_to_be_blacklisted.append(url)
             continue
 
+        # Every candidate was checked anyway, so the unavailable ones past the limit are still blacklisted
         if number_of_vids_downloaded >= max_number:
-            break
+            continue
 
         number_of_vids_downloaded += 1
         downloading_url_list.append(url)
 
-    batch_path = Path(Path.cwd() / "batch_file.txt")
-    with open(batch_path, "w") as f:
-        f.write('\n'.join(downloading_url_list))
+    return downloading_url_list, urls_to_be_blacklisted
 
-    download = subprocess.Popen(["sh", "scripts/download_vids.sh", str(batch_path), str(download_path.absolute()) +
-                                 "/%(title)s.%(ext)s", "--verbose"], stdout=PIPE)
 
-    names: List[str] = download.stdout.read().decode('utf-8').split('\n')
-    outputs = list(zip(downloading_url_list, names))
-    os.remove(batch_path)
-    print(f"Added songs {outputs}")
+def download_vids(download_path: Path, url_list: List[str], db: DatabaseHandler, max_number: Optional[int] = None) \
+        -> List[str]:
 
-    downloaded_songs: List[Tuple[str, str]] = [(url, output) for url, output in outputs
-                                               if output is not None and url not in urls_to_be_blacklisted]
+    downloading_url_list, urls_to_be_blacklisted = select_vids(url_list, db, max_number)
+
+    if len(urls_to_be_blacklisted) > 0:
+        db.add_many_to_blacklist(urls_to_be_blacklisted)
+
+    results: List[DownloadResult] = asyncio.run(Downloader().download_many(downloading_url_list, download_path))
+
+    downloaded_songs: List[DownloadResult] = []
+    download_names: List[str] = []
+    for result in results:
+        if result.path is None:
+            print(f"Could not download {result.url}: {result.error}")
+            continue
+
+        # The tagger expects every song directly inside the download directory, two videos can share a title
+        song_path: Path = claim_name(download_path, result.path.stem, result.path.suffix)
+        os.replace(str(result.path), str(song_path))
+        shutil.rmtree(str(result.path.parent), ignore_errors=True)
+        result.path = song_path
+        downloaded_songs.append(result)
+        download_names.append(song_path.stem)
+
+    print(f"Added songs {[(result.url, result.title) for result in downloaded_songs]}")
 
     if len(downloaded_songs) < 1:
         return ["Null"]
 
-    download_urls, download_names = zip(*downloaded_songs)
-    clean_download_names = [name.rstrip() for name in download_names]
+    db.add_many_to_downloaded([result.url for result in downloaded_songs], download_names)
 
-    if len(urls_to_be_blacklisted) > 0:
-        db.add_many_to_blacklist(urls_to_be_blacklisted)
+    return download_names
 
-    if len(downloaded_songs) > 0:
-        db.add_many_to_downloaded(download_urls, clean_download_names)
 
-    return clean_download_names
+def get_database() -> DatabaseHandler:
+    load_dotenv()
+    return DatabaseHandler(DatabaseOptions(database_user=getenv("MONGO_USER"),
+                                           database_password=getenv("MONGO_PASS"),
+                                           database_uri=getenv("MONGO_URI"),
+                                           database_name=getenv("DB_NAME"),
+                                           port=getenv("DB_PORT")))
 
 
-def start(vid: Optional[str] = None, number: Optional[int] = None) -> List[str]:
-    shutil.rmtree("./music", ignore_errors=True)
-    load_dotenv()
-    database = DatabaseHandler(DatabaseOptions(database_user=getenv("MONGO_USER"),
-                                               database_password=getenv("MONGO_PASS"),
-                                               database_uri=getenv("MONGO_URI"),
-                                               database_name=getenv("DB_NAME"),
-                                               port=getenv("DB_PORT")))
+def get_candidate_urls(database: DatabaseHandler, vid: Optional[str] = None) -> List[str]:
+    if vid is not None:
+        return [vid]
 
     cookie: Path = Path("cookies.txt")
+    vid_list: List[str] = []
+    for playlist in database.get_all_playlist_urls():
+        playlist_urls: List[str] = get_vid_list(cookie, playlist)
+        last_seen: Set[str] = database.get_playlist_last_seen(playlist)
+        new_urls: List[str] = [url for url in playlist_urls if video_id(url) not in last_seen]
+
+        # Entries are only remembered once they are downloaded or blacklisted, so a failed or skipped one is retried
+        new_ids: List[str] = [video_id(url) for url in new_urls]
+        settled_ids: Set[str] = database.find_video_ids(new_ids, database.download_collection) | \
+            database.find_video_ids(new_ids, database.blacklist_collection)
+        playlist_ids: Set[str] = set(video_id(url) for url in playlist_urls)
+        database.set_playlist_last_seen(playlist, (last_seen & playlist_ids) | settled_ids)
+
+        unsettled_urls: List[str] = [url for url in new_urls if video_id(url) not in settled_ids]
+        print(f"{playlist}: {len(unsettled_urls)} new entries out of {len(playlist_urls)}")
+        vid_list += unsettled_urls
+
+    return vid_list
+
 
-    if vid is None:
-        youtube_urls: List[str] = database.get_all_playlist_urls()
+def start(vid: Optional[str] = None, number: Optional[int] = None, workspace: Optional[Workspace] = None) -> List[str]:
+    # Songs go to a workspace of their own, so a concurrent job never has its downloads deleted by this one
+    if workspace is None:
+        workspace = get_workspace_manager().acquire()
 
-        vid_list: List[str] = []
-        for playlist in youtube_urls:
-            vid_list += get_vid_list(cookie, playlist)
-    else:
-        vid_list = [vid]
+    database = get_database()
 
-    return download_vids(Path("./music"), vid_list, database, number)
+    return download_vids(workspace.songs, get_candidate_urls(database, vid), database, number)
 
 
 if __name__ == "__main__":
-    start()
+    songs_workspace: Workspace = get_workspace_manager().acquire()
+    start(workspace=songs_workspace)
+    # Kept for whatever runs next, remove_orphans cleans it up once this process has exited
+    print(f"Downloaded songs are in {songs_workspace.songs}")
@@ -1,3 +1,4 @@
+from multiprocessing import cpu_count
 from typing import Optional, List, Dict
 
 from pydantic import BaseModel
@@ -8,14 +9,19 @@ class Song(BaseModel):
     artists: str
     album_art: Optional[str]
     album_name: str
+    confidence: Optional[float] = None
 
 
 class CommandLineOptions(BaseModel):
     flag_maps: Dict[str, str] = {
         "p": "progress",
+        "i": "incremental",
         "h": "help"
     }
     progress: bool = False
+    profile_imports: bool = False
+    incremental: bool = False
+    retag_below: Optional[float] = None
     command_list: List[str]
 
 
@@ -25,3 +31,41 @@ class DatabaseOptions(BaseModel):
     database_uri: str
     database_name: str
     port: int
+
+
+class CacheOptions(BaseModel):
+    path: str = ".cache/responses.sqlite"
+    max_bytes: int = 256 * 1024 * 1024
+    search_ttl: int = 24 * 60 * 60
+    detail_ttl: int = 30 * 24 * 60 * 60
+
+
+class PipelineOptions(BaseModel):
+    fingerprint_workers: int = cpu_count()
+    search_workers: int = 32
+    write_workers: int = 4
+    query_planner: str = "best-first"
+    query_budget: Optional[int] = 48
+    race_providers: bool = True
+    provider_timeouts: Dict[str, Optional[float]] = {}
+    provider_priorities: Dict[str, int] = {
+        "VGMDB": 1,
+        "GENIUS": 0
+    }
+    acoustid_batch_size: int = 10
+    acoustid_requests_per_second: float = 3
+    art_cache_bytes: int = 64 * 1024 * 1024
+    art_max_dimension: Optional[int] = None
+    tag_padding: int = 4096
+    incremental: bool = False
+    retag_below: Optional[float] = None
+
+
+class StreamingOptions(BaseModel):
+    download_workers: int = 4
+    download_queue_size: int = 4
+    upload_queue_size: int = 4
+    tag_workers: int = 4
+    upload_workers: int = 4
+    # Tagged songs whose upload failed wait here for the next run
+    failed_upload_path: str = ".cache/failed_uploads"
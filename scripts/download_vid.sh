@@ -0,0 +1 @@
+youtube-dl -x --audio-format mp3 $1 -o $2 --add-metadata --print-json
@@ -1,10 +1,12 @@
+# Imported first so that the startup report covers every other import
+from utils import lazy
+
+import asyncio
 import json
-import os
-import shutil
+import sys
 import threading
 from os import getenv
-from pathlib import Path
-from typing import Optional, Dict
+from typing import Any, Dict, List, Optional
 
 import uvicorn
 from dotenv import load_dotenv
@@ -12,13 +14,16 @@ from fastapi import FastAPI
 from pydantic import BaseModel, UrlStr
 from starlette.middleware.cors import CORSMiddleware
 
-import fetchvids
-import tagger
 from models import DatabaseOptions
-from utils.database import DatabaseHandler
-from utils.google_drive import DriveHandler
+from utils.database import AsyncDatabaseHandler, DatabaseHandler
+from utils.jobs import ACTIVE_STATES, DONE, Job, JobQueue, JobStore, ProgressCallback
+from utils.workspace import Workspace, get_workspace_manager
 from starlette.websockets import WebSocket
-from pyfcm import FCMNotification
+
+# Heavy subsystems are only imported once a request needs them, so / answers as soon as uvicorn is up
+streaming = lazy.lazy_import("streaming")
+google_drive = lazy.lazy_import("utils.google_drive")
+pyfcm = lazy.lazy_import("pyfcm")
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=['*'])
@@ -32,32 +37,53 @@ class Payload(BaseModel):
 
 
 def send_notification(title: str, body: str, token: str):
-    push_service = FCMNotification(api_key=getenv("FCM_KEY"))
+    push_service = pyfcm.FCMNotification(api_key=getenv("FCM_KEY"))
     push_service.notify_single_device(registration_id=token, message_title=title, message_body=body)
 
 
-def full_update(num: Optional[int]):
-    fetchvids.start(number=num)
-    tagger.start(Path("./music"))
-    drive = DriveHandler()
-    drive.copy_dir(Path("./music"), getenv("MUSIC_DRIVE_ID"))
-    shutil.rmtree("./music")
-    os.makedirs("./music")
+def full_update(job: Job, progress: ProgressCallback, cancelled: threading.Event) -> List[str]:
+    # Songs are downloaded, tagged and uploaded one by one instead of a whole stage at a time
+    return streaming.start(number=job.number, workspace_name=job.id, progress=progress, cancelled=cancelled)
 
 
-def add_one(payload: Payload):
-    assert payload.fcm_token is not None
-
+def add_one(job: Job, progress: ProgressCallback, cancelled: threading.Event) -> List[str]:
     try:
-        name = fetchvids.start(payload.url)
-        tagger.start(Path("./music"))
-        drive = DriveHandler()
-        drive.copy_dir(Path("./music"), getenv("MUSIC_DRIVE_ID"))
-        shutil.rmtree("./music")
-        os.makedirs("./music")
-        send_notification("Successful", f"Added song {name[0]}", payload.fcm_token)
+        name = streaming.start(job.url, workspace_name=job.id, progress=progress, cancelled=cancelled)
+        if len(name) < 1:
+            raise RuntimeError(f"Could not add {job.url}")
+
+        if job.fcm_token is not None:
+            send_notification("Successful", f"Added song {name[0]}", job.fcm_token)
     except Exception as e:
-        send_notification("Attempt unsuccessful", str(e), payload.fcm_token)
+        if job.fcm_token is not None:
+            send_notification("Attempt unsuccessful", str(e), job.fcm_token)
+
+        raise
+
+    return name
+
+
+def run_job(job: Job, progress: ProgressCallback, cancelled: threading.Event) -> List[str]:
+    if job.kind == "add":
+        return add_one(job, progress, cancelled)
+
+    return full_update(job, progress, cancelled)
+
+
+def describe_job(job: Job) -> Dict[str, Any]:
+    workspace: Optional[Workspace] = get_workspace_manager().get(job.id)
+
+    return {
+        **job.dict(exclude={'fcm_token'}),
+        'disk_usage': workspace.disk_usage() if workspace is not None else 0
+    }
+
+
+def job_response(job: Job, created: bool = True) -> Dict[str, Any]:
+    return {
+        'message': 'success' if created else 'already queued',
+        'job': describe_job(job)
+    }
 
 
 @app.head("/")
@@ -74,23 +100,14 @@ async def test():
 
 @app.get("/update")
 async def update_db(number: int = None):
-    global gtask
-    if gtask.is_alive():
-        return {
-            'message': 'already running'
-        }
-
-    gtask = threading.Thread(target=full_update, args=(number,))
-    gtask.start()
+    job, created = jobs.submit("update", number=number)
 
-    return {
-        'message': 'success'
-    }
+    return job_response(job, created)
 
 
 @app.get("/search/{name}")
 async def search(name: str):
-    search_result = db.search_collection_by_name(name, db.download_collection)
+    search_result = await async_db.search_collection_by_name(name, db.download_collection)
 
     return {
         'message': 'No result matched' if len(search_result) == 0 else 'Success',
@@ -101,7 +118,7 @@ async def search(name: str):
 @app.post("/remove")
 async def remove_from_blacklist(payload: Payload):
     if payload.name is not None:
-        search_result = db.search_collection_by_name(payload.name, db.blacklist_collection)
+        search_result = await async_db.search_collection_by_name(payload.name, db.blacklist_collection)
         best_result = max(search_result, key=lambda element: element['similarity'])
         url_to_remove = best_result['url']
         details = best_result
@@ -109,7 +126,7 @@ async def remove_from_blacklist(payload: Payload):
         url_to_remove = payload.url
         details = None
 
-    db.remove_from_blacklist_with_url(url_to_remove)
+    await async_db.remove_from_blacklist_with_url(url_to_remove)
 
     return {
         'message': f"Removed result {url_to_remove}",
@@ -119,30 +136,58 @@ async def remove_from_blacklist(payload: Payload):
 
 @app.post("/blacklist")
 async def blacklist_song(payload: Payload):
-    db.add_to_blacklist(payload.url)
+    await async_db.add_to_blacklist(payload.url)
 
 
 @app.post("/add")
 async def add_song(payload: Payload):
-    global gtask
-    if gtask.is_alive():
+    print(payload)
+    job, created = jobs.submit("add", url=payload.url, fcm_token=payload.fcm_token)
+
+    return job_response(job, created)
+
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None):
+    found_jobs: List[Job] = jobs.store.list((status,) if status is not None else None)
+
+    return {
+        'message': 'Success',
+        'jobs': [describe_job(job) for job in found_jobs]
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job: Optional[Job] = jobs.get(job_id)
+    if job is None:
         return {
-            'message': 'already running'
+            'message': f"{job_id} doesn't exist"
         }
 
-    print(payload)
+    return {
+        'message': 'Success',
+        'job': describe_job(job)
+    }
+
 
-    gtask = threading.Thread(target=add_one, args=(payload,))
-    gtask.start()
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job: Optional[Job] = jobs.cancel(job_id)
+    if job is None:
+        return {
+            'message': f"{job_id} doesn't exist"
+        }
 
     return {
-        'message': 'success'
+        'message': 'Success',
+        'job': describe_job(job)
     }
 
 
 @app.post("/playlist")
 async def add_playlist(payload: Payload):
-    if db.add_to_playlists(payload.url) is None:
+    if await async_db.add_to_playlists(payload.url) is None:
         return {
             'message': 'Playlist already exists'
         }
@@ -154,7 +199,7 @@ async def add_playlist(payload: Payload):
 
 @app.post("/remove/playlist")
 async def delete_playlist(payload: Payload):
-    if db.remove_from_playlists_with_url(payload.url) is None:
+    if await async_db.remove_from_playlists_with_url(payload.url) is None:
         return {
             'message': f"{payload.url} doesn't exist in the playlist database"
         }
@@ -166,7 +211,7 @@ async def delete_playlist(payload: Payload):
 
 @app.get("/delete")
 async def delete_downloaded():
-    db.download_collection.delete_many({})
+    await async_db.delete_all_downloaded()
 
     return {
         'message': 'delete successful'
@@ -175,19 +220,19 @@ async def delete_downloaded():
 
 @app.get("/delete/{oid}")
 async def delete_song(oid: str, blacklist: bool = False):
-    to_be_deleted: Dict[str, str] = db.get_download_by_id(oid)
+    to_be_deleted: Dict[str, str] = await async_db.get_download_by_id(oid)
     print(to_be_deleted)
-    drive = DriveHandler()
+    drive = google_drive.DriveHandler()
     if to_be_deleted.get("new_name") is not None:
         file_name = to_be_deleted["new_name"]
     else:
         file_name = to_be_deleted["name"]
 
     drive.delete_file(file_name, getenv("MUSIC_DRIVE_ID"))
-    db.delete_from_downloaded(oid)
+    await async_db.delete_from_downloaded(oid)
 
     if blacklist:
-        db.add_to_blacklist(to_be_deleted["url"])
+        await async_db.add_to_blacklist(to_be_deleted["url"])
 
     return {
         'message': 'Success'
@@ -196,10 +241,11 @@ async def delete_song(oid: str, blacklist: bool = False):
 
 @app.get("/check")
 async def check_upload_state():
-    global gtask
-    if gtask.is_alive():
+    running_jobs: List[Job] = jobs.running()
+    if len(running_jobs) > 0:
         return {
-            'message': 'already running'
+            'message': 'already running',
+            'jobs': [job.id for job in running_jobs]
         }
 
     return {
@@ -207,10 +253,22 @@ async def check_upload_state():
     }
 
 
+@app.get("/workspaces")
+async def workspace_usage():
+    return {
+        'message': 'Success',
+        'disk_usage': get_workspace_manager().usage()
+    }
+
+
 @app.get("/rem")
 async def rem():
-    shutil.rmtree("./music")
-    os.makedirs("./music")
+    # Only directories that no job is using are removed
+    removed: int = get_workspace_manager().remove_orphans()
+
+    return {
+        'message': f"Removed {removed} workspaces"
+    }
 
 
 @app.websocket_route("/ws_add")
@@ -224,14 +282,24 @@ async def socket_add(websocket: WebSocket):
     json_data = json.loads(data)
     payload: Payload = Payload(url=json_data["url"])
     print(payload)
-    add_one(payload)
+    job, _ = jobs.submit("add", url=payload.url)
+
+    # The song is added by the job workers, this only waits for it without holding up the event loop
+    while job.status in ACTIVE_STATES:
+        await asyncio.sleep(1)
+        job = jobs.get(job.id)
+
     print("done")
     await websocket.send_json({
-        'message': 'Success'
+        'message': 'Success' if job.status == DONE else f"Attempt unsuccessful: {job.error}",
+        'job': describe_job(job)
     })
 
 
 if __name__ == "__main__":
+    if "--profile-imports" in sys.argv:
+        print('\n'.join(lazy.profile_report()))
+
     load_dotenv()
     mongo_user, mongo_pass, mongo_uri, db_name, db_port = getenv("MONGO_USER"), getenv("MONGO_PASS"), \
                                                           getenv("MONGO_URI"), getenv("DB_NAME"), getenv("DB_PORT")
@@ -241,8 +309,12 @@ if __name__ == "__main__":
 
     db = DatabaseHandler(DatabaseOptions(database_user=mongo_user, database_password=mongo_pass, database_uri=mongo_uri,
                                          database_name=db_name, port=db_port))
+    async_db = AsyncDatabaseHandler(db)
 
-    gtask = threading.Thread(target=full_update)
+    jobs = JobQueue(JobStore(getenv("JOBS_PATH", ".cache/jobs.sqlite")), run_job,
+                    workers=int(getenv("JOB_WORKERS", "2")))
+    get_workspace_manager().remove_orphans()
+    jobs.start()
 
     env_port = getenv("PORT")
     uvicorn.run(app, host="0.0.0.0", port=int(env_port) if env_port is not None else 8000)
@@ -0,0 +1,251 @@
+import asyncio
+import itertools
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+import fetchvids
+from models import PipelineOptions, StreamingOptions
+from tagger import TaggingPipeline, tag_song
+from utils import lazy
+from utils.database import DatabaseHandler
+from utils.downloader import Downloader, DownloadResult
+from utils.drive_sync import DriveSync, UploadResult
+from utils.video_ids import video_id
+from utils.workspace import Workspace, get_workspace_manager
+
+google_drive = lazy.lazy_import("utils.google_drive")
+
+ProgressCallback = Callable[[str], None]
+
+RETRY_FILE = "song.json"
+
+
+class StreamedSong(BaseModel):
+    url: str
+    directory: Path
+    file: Path
+    rename: Optional[Tuple[str, str]] = None
+
+
+async def download_stage(url_list: List[str], download_path: Path, downloaded: asyncio.Queue, consumers: int,
+                         downloader: Downloader, progress: ProgressCallback, cancelled: threading.Event):
+    remaining_urls: Iterator[str] = iter(url_list)
+
+    async def download_worker():
+        # The workers share one iterator, so every url is downloaded exactly once
+        for url in remaining_urls:
+            # A cancelled run stops taking new songs, the ones already downloaded still go through
+            if cancelled.is_set():
+                return
+
+            result: DownloadResult = await downloader.download(url, download_path)
+
+            if result.path is None:
+                print(f"Could not download {url}: {result.error}")
+                progress("failed")
+                continue
+
+            progress("downloaded")
+
+            # Waits while the taggers are behind, so downloads never run far ahead of the uploads
+            await downloaded.put(StreamedSong(url=url, directory=result.path.parent, file=result.path))
+
+    try:
+        await asyncio.gather(*[download_worker() for _ in range(downloader.workers)])
+    finally:
+        for _ in range(consumers):
+            await downloaded.put(None)
+
+
+async def tag_stage(downloaded: asyncio.Queue, tagged: asyncio.Queue, pipeline: TaggingPipeline,
+                    counter: Iterator[int], progress: ProgressCallback):
+    while True:
+        song: Optional[StreamedSong] = await downloaded.get()
+        if song is None:
+            return
+
+        try:
+            song.rename = await tag_song(song.directory, song.file.name, pipeline.api_list, next(counter), pipeline)
+        except Exception as exception:
+            # Untagged songs are still uploaded, like the batch mode does
+            print(f"Cannot tag file {song.file.name}: {exception}")
+
+        progress("tagged")
+        await tagged.put(song)
+
+
+def keep_for_retry(song: StreamedSong, retry_path: Path):
+    # The song is already downloaded and tagged, the next run uploads it instead of downloading it again
+    if song.directory.parent != retry_path:
+        retry_path.mkdir(parents=True, exist_ok=True)
+        target: Path = retry_path / song.directory.name
+        shutil.rmtree(str(target), ignore_errors=True)
+        shutil.move(str(song.directory), str(target))
+        song.file = target / song.file.name
+        song.directory = target
+
+    (song.directory / RETRY_FILE).write_text(song.json())
+    print(f"Kept {song.file.name} in {song.directory} to upload it on the next run")
+
+
+def claim_retries(retry_path: Path, songs_path: Path) -> List[StreamedSong]:
+    if not retry_path.is_dir():
+        return []
+
+    songs: List[StreamedSong] = []
+    for directory in sorted(retry_path.iterdir()):
+        if directory.name.startswith(".") or not (directory / RETRY_FILE).is_file():
+            continue
+
+        # Renaming is atomic, when two runs start together only one of them gets the song
+        claimed: Path = directory.with_name(f".{directory.name}.{uuid.uuid4().hex}")
+        try:
+            os.rename(str(directory), str(claimed))
+        except FileNotFoundError:
+            continue
+
+        target: Path = songs_path / directory.name
+        shutil.move(str(claimed), str(target))
+        song: StreamedSong = StreamedSong.parse_raw((target / RETRY_FILE).read_text())
+        (target / RETRY_FILE).unlink()
+        song.file = target / song.file.name
+        song.directory = target
+        songs.append(song)
+
+    return songs
+
+
+def upload_song(song: StreamedSong, drive_sync: DriveSync, parent_id: str, db: DatabaseHandler,
+                retry_path: Path) -> Optional[str]:
+    # Tagging renames the file, so it is looked up again
+    song_files: List[Path] = sorted(song.directory.glob("*.mp3"))
+    if len(song_files) < 1:
+        print(f"{song.file.name} disappeared before it could be uploaded")
+        shutil.rmtree(str(song.directory), ignore_errors=True)
+        return None
+
+    try:
+        upload_result: UploadResult = drive_sync.upload(song_files[0], parent_id)
+    except Exception:
+        keep_for_retry(song, retry_path)
+        raise
+
+    if upload_result.error is not None:
+        keep_for_retry(song, retry_path)
+        return None
+
+    try:
+        db.add_many_to_downloaded([song.url], [song.file.stem])
+        if song.rename is not None and not db.update_downloaded(*song.rename):
+            print(f"{song.rename[0]} is not in the database, it was not renamed to {song.rename[1]}")
+    finally:
+        # The local copy is only needed until Drive has it
+        shutil.rmtree(str(song.directory), ignore_errors=True)
+
+    return song_files[0].stem
+
+
+async def upload_stage(tagged: asyncio.Queue, executor: ThreadPoolExecutor, drive_sync: DriveSync, parent_id: str,
+                       db: DatabaseHandler, retry_path: Path, names: List[str], progress: ProgressCallback):
+    loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+
+    while True:
+        song: Optional[StreamedSong] = await tagged.get()
+        if song is None:
+            return
+
+        try:
+            name: Optional[str] = await loop.run_in_executor(executor, upload_song, song, drive_sync, parent_id, db,
+                                                             retry_path)
+        except Exception as exception:
+            print(f"Could not upload {song.file.name}: {exception}")
+            progress("failed")
+            continue
+
+        if name is not None:
+            names.append(name)
+            progress("uploaded")
+        else:
+            progress("failed")
+
+
+async def stream(url_list: List[str], workspace: Workspace, db: DatabaseHandler, drive_sync: DriveSync,
+                 parent_id: str, options: StreamingOptions, pipeline_options: Optional[PipelineOptions] = None,
+                 progress: Optional[ProgressCallback] = None, cancelled: Optional[threading.Event] = None) \
+        -> List[str]:
+    report: ProgressCallback = progress if progress is not None else lambda stage: None
+    stop: threading.Event = cancelled if cancelled is not None else threading.Event()
+    downloaded: asyncio.Queue = asyncio.Queue(maxsize=options.download_queue_size)
+    tagged: asyncio.Queue = asyncio.Queue(maxsize=options.upload_queue_size)
+    pipeline: TaggingPipeline = TaggingPipeline(pipeline_options if pipeline_options is not None
+                                                else PipelineOptions())
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=options.upload_workers)
+    counter: Iterator[int] = itertools.count()
+    names: List[str] = []
+    retry_path: Path = Path(options.failed_upload_path)
+
+    # Songs whose upload failed last time skip the download and tagging
+    retries: List[StreamedSong] = claim_retries(retry_path, workspace.songs)
+    retried_ids: Set[str] = set(song.directory.name for song in retries)
+    url_list = [url for url in url_list if video_id(url) not in retried_ids]
+
+    async def queue_retries():
+        for song in retries:
+            await tagged.put(song)
+
+    async def tag_all():
+        try:
+            await asyncio.gather(queue_retries(), *[tag_stage(downloaded, tagged, pipeline, counter, report)
+                                                    for _ in range(options.tag_workers)])
+        finally:
+            for _ in range(options.upload_workers):
+                await tagged.put(None)
+
+    try:
+        await asyncio.get_event_loop().run_in_executor(executor, drive_sync.load_index, parent_id)
+        await asyncio.gather(download_stage(url_list, workspace.songs, downloaded, options.tag_workers,
+                                            Downloader(options.download_workers), report, stop), tag_all(),
+                             *[upload_stage(tagged, executor, drive_sync, parent_id, db, retry_path, names, report)
+                               for _ in range(options.upload_workers)])
+    finally:
+        await pipeline.close()
+        executor.shutdown()
+
+    print(f"Streamed {len(names)} of {len(url_list) + len(retries)} songs to Drive")
+
+    return names
+
+
+def start(vid: Optional[str] = None, number: Optional[int] = None, options: Optional[StreamingOptions] = None,
+          workspace_name: Optional[str] = None, progress: Optional[ProgressCallback] = None,
+          cancelled: Optional[threading.Event] = None) -> List[str]:
+    if options is None:
+        options = StreamingOptions()
+
+    database: DatabaseHandler = fetchvids.get_database()
+    url_list, urls_to_be_blacklisted = fetchvids.select_vids(fetchvids.get_candidate_urls(database, vid), database,
+                                                             number)
+
+    if len(urls_to_be_blacklisted) > 0:
+        database.add_many_to_blacklist(urls_to_be_blacklisted)
+
+    drive_sync: DriveSync = google_drive.DriveHandler().get_sync(options.upload_workers)
+    music_drive_id: Optional[str] = getenv("MUSIC_DRIVE_ID")
+    assert music_drive_id is not None
+
+    # Every run works in its own scratch directory, so concurrent jobs never clean up each other's songs
+    with get_workspace_manager().workspace(workspace_name) as workspace:
+        return asyncio.run(stream(url_list, workspace, database, drive_sync, music_drive_id, options,
+                                  progress=progress, cancelled=cancelled))
+
+
+if __name__ == "__main__":
+    start()
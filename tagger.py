@@ -1,158 +1,228 @@
+# Imported first so that the startup report covers every other import
+from utils import lazy
+
 import asyncio
-import glob
-import multiprocessing as mp
 import os
 import sys
 from asyncio.tasks import Task
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os import getenv
 from pathlib import Path
-from shutil import rmtree
-from typing import Dict, List, Any, Optional, Union, Tuple
+from typing import Dict, List, Any, Optional, Union, Tuple, Set
 
 import eyed3
 from aiohttp import ClientSession
 from dotenv import load_dotenv
 from eyed3.id3 import TagFile
 from eyed3.mp3 import Mp3AudioFile
-from tqdm import tqdm
 
 from api import API
-from api.acoustid import ACOUSTID
+from api.acoustid import ACOUSTID, FingerprintResult, fingerprint_file
 from api.genius import GENIUS
 from api.vgmdb import VGMDB
-from models import Song, CommandLineOptions, DatabaseOptions
+from models import Song, CommandLineOptions, DatabaseOptions, PipelineOptions
+from utils.art_cache import AlbumArt, ArtCache
+from utils.cache import get_response_cache
 from utils.console import command_line_parser
-from utils.database import DatabaseHandler
-from utils.image_handler import download_image
-from utils.text_processing import clean_string, remove_slashes, detect_language, remove_punctuation
+from utils.database import DatabaseHandler, RenameReport
+from utils.query_planner import QueryPlanner, get_planner
+from utils.tag_manifest import Provenance, TagManifest, get_tag_manifest, write_provenance
+from utils.tag_writer import TagWriteResult, TagWriter
+from utils.text_processing import remove_slashes, detect_language
 
 
-class Counter(object):
-    def __init__(self, initval=0):
-        self.val = mp.Value('i', initval)
-        self.lock = mp.Lock()
+tqdm = lazy.lazy_import("tqdm")
 
-    def increment(self):
-        with self.lock:
-            self.val.value += 1
+CONFIDENCE_THRESHOLD = 0.8
+# Recorded with every tagged file, bump it when matching changes enough to be worth tagging again
+MATCHER_VERSION = "1"
+command_line_options: Optional[CommandLineOptions] = None
 
-    def value(self):
-        with self.lock:
-            return self.val.value
 
+async def query_databases(initial_query: str, query_list: List[str], query_api: API, best_similarity: float) \
+        -> Optional[Tuple[float, Optional[Song]]]:
+    parsed_query_list: List[str] = [query_api.url_encode(query) for query in query_list]
 
-ALBUM_DIR = "albums"
-command_line_options: Optional[CommandLineOptions] = None
-counter = Counter(0)
-queue: mp.Queue = mp.Queue()
+    if len(parsed_query_list) == 0:
+        return None
 
+    session: ClientSession = await query_api.open()
+    tasks: List[Task] = []
+    for query in parsed_query_list:
+        task: Task = query_api.query(query, session)
+        tasks.append(task)
 
-async def query_databases(initial_query: str, query_list: List[List[str]], query_api: API, best_similarity: float) \
-        -> Optional[Tuple[float, Optional[Song]]]:
-    def filter_criteria(query: str) -> bool:
-        tokens: List[str] = query.split(" ")
-        return not all(len(token) < 3 for token in tokens)
+    response_list: List[Optional[Dict[str, Any]]] = await asyncio.gather(*tasks)
 
-    def remove_empty(query: str) -> str:
-        tokens: List[str] = query.split(" ")
-        return ' '.join([token for token in tokens if len(token) > 0])
+    similarity, song = await query_api.album(response_list, initial_query, best_similarity, session)
 
-    concatenated_query_list: List[str] = [' '.join(query) for query in query_list]
-    filtered_query_list: List[str] = [remove_empty(query) for query in concatenated_query_list if
-                                      filter_criteria(query)]
-    parsed_query_list: List[str] = [query_api.url_encode(query) for query in filtered_query_list]
+    if song is None:
+        return None
 
-    if len(parsed_query_list) == 0:
+    if (song.song_name is None) or (song.artists is None) or (song.album_name is None):
         return None
 
-    tasks: List[Task] = []
-    async with ClientSession() as session:
-        for query in parsed_query_list:
-            task: Task = query_api.query(query, session)
-            tasks.append(task)
+    if similarity > best_similarity:
+        song.confidence = similarity
+        return similarity, song
 
-        response_list: List[Optional[Dict[str, Any]]] = await asyncio.gather(*tasks)
+    return best_similarity, None
 
-        similarity, song = query_api.album(response_list, initial_query, best_similarity)
 
-        if song is None:
-            return None
+async def query_provider(initial_query: str, query_list: List[str], query_api: API, best_similarity: float) \
+        -> Optional[Tuple[float, Optional[Song]]]:
+    try:
+        return await asyncio.wait_for(query_databases(initial_query, query_list, query_api, best_similarity),
+                                      query_api.timeout)
+    except asyncio.TimeoutError:
+        print(f"{type(query_api).__name__} timed out while searching for {initial_query}")
+        return None
+    except asyncio.CancelledError:
+        # Still an Exception on Python 3.7, a provider that lost the race has to stop
+        raise
+    except Exception as exception:
+        # One provider failing, even on a response it cannot parse, must not take the others down with it
+        print(f"{type(query_api).__name__} failed while searching for {initial_query}: "
+              f"{type(exception).__name__}: {exception}")
+        return None
 
-        if (song.song_name is None) or (song.artists is None) or (song.album_name is None):
-            return None
 
-        if similarity > best_similarity:
-            return similarity, song
+async def race_databases(initial_query: str, query_list: List[str], api_list: List[API], best_similarity: float) \
+        -> List[Tuple[float, int, Song]]:
+    tasks: Dict[asyncio.Future, API] = {
+        asyncio.ensure_future(query_provider(initial_query, query_list, api, best_similarity)): api
+        for api in api_list
+    }
+    pending: Set[asyncio.Future] = set(tasks)
+    candidates: List[Tuple[float, int, Song]] = []
 
-        return best_similarity, None
+    try:
+        while len(pending) > 0:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
 
+            for task in done:
+                async_result: Optional[Tuple[float, Optional[Song]]] = task.result()
 
-def get_all_possible_subs(query: List[str], length: int) -> List[List[str]]:
-    subs: List[List[str]] = []
-    query_length: int = len(query)
+                if async_result is not None and async_result[1] is not None:
+                    candidates.append((async_result[0], tasks[task].priority, async_result[1]))
 
-    assert query_length >= length
-    for start_index in range(query_length - length + 1):
-        subs.append(query[start_index:start_index + length])
+            # Stop waiting for slower providers once a candidate is good enough
+            if any(candidate[0] > CONFIDENCE_THRESHOLD for candidate in candidates):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
 
-    return subs
+    return candidates
 
 
-def construct_query(query: str, api_list: List[API]) -> Optional[Song]:
+async def construct_query(query: str, api_list: List[API], planner: QueryPlanner, budget: Optional[int] = None,
+                          race: bool = True) -> Tuple[Optional[Song], int]:
     global command_line_options
 
-    cleaned_query: str = clean_string(query)
-    filtered_query: List[str] = [token for token in cleaned_query.split(" ") if len(token) > 0]
-
-    longest_query: List[List[str]] = [filtered_query]
-    initial_length: int = len(filtered_query)
+    query_batches: List[List[str]] = planner.plan(query)
+    prioritised_api_list: List[API] = sorted(api_list, key=lambda api: api.priority, reverse=True)
     best_similarity: float = -1
     best_result: Optional[Song] = None
+    query_count: int = 0
 
     if command_line_options is not None and command_line_options.progress:
-        iterate_over = tqdm(range(initial_length - 1, -1, -1))
+        iterate_over = tqdm.tqdm(query_batches)
     else:
-        iterate_over = range(initial_length - 1, -1, -1)
+        iterate_over = query_batches
+
+    for query_batch in iterate_over:
+        if race:
+            budget_batch: List[str] = query_batch if budget is None else \
+                query_batch[:(budget - query_count) // len(api_list)]
+            if len(budget_batch) == 0:
+                return best_result, query_count
+
+            query_count += len(budget_batch) * len(api_list)
+            candidates: List[Tuple[float, int, Song]] = await race_databases(query, budget_batch,
+                                                                             prioritised_api_list, best_similarity)
+
+            # Ties between providers go to the one with the higher priority
+            if len(candidates) > 0:
+                current_sim, _, result = max(candidates, key=lambda candidate: candidate[:2])
+                if current_sim > best_similarity:
+                    best_result = result
+                    best_similarity = current_sim
+
+            if best_similarity > CONFIDENCE_THRESHOLD:
+                return best_result, query_count
+
+            continue
+
+        for api_tag in prioritised_api_list:
+            if budget is not None and query_count >= budget:
+                return best_result, query_count
 
-    for length in iterate_over:
-        for api_tag in api_list:
-            async_result = asyncio.run(query_databases(query, longest_query, api_tag, best_similarity))
+            budget_batch = query_batch if budget is None else query_batch[:budget - query_count]
+            query_count += len(budget_batch)
+            async_result = await query_provider(query, budget_batch, api_tag, best_similarity)
 
             if async_result is not None:
-                current_sim, result = async_result
+                current_sim, provider_result = async_result
 
-                if result is not None:
+                if provider_result is not None:
                     if current_sim > best_similarity:
-                        best_result = result
+                        best_result = provider_result
 
                     best_similarity = current_sim
-                    if best_similarity > 0.8:
-                        return best_result
+                    if best_similarity > CONFIDENCE_THRESHOLD:
+                        return best_result, query_count
 
-        longest_query = get_all_possible_subs(filtered_query, length)
+    return best_result, query_count
 
-    return best_result
 
+class TaggingPipeline:
+    def __init__(self, options: PipelineOptions):
+        self.options = options
+        self.fingerprint_pool: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=options.fingerprint_workers)
+        self.write_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=options.write_workers)
+        self.search_semaphore: asyncio.Semaphore = asyncio.Semaphore(options.search_workers)
+        self.planner: QueryPlanner = get_planner(options.query_planner)
+        self.acoustid: ACOUSTID = ACOUSTID(os.getenv("AC_KEY"), options.acoustid_batch_size,
+                                           options.acoustid_requests_per_second)
+        self.api_list: List[API] = [VGMDB(), GENIUS(os.getenv("GENIUS_TOKEN"))]
 
-def tag_song(path: Path, song: str, api_list: List[API], number: int):
-    print(f"File NO: {number}")
-    print(f"{song} is being processed")
+        for api in self.api_list:
+            provider_name: str = type(api).__name__
+            api.timeout = options.provider_timeouts.get(provider_name, api.timeout)
+            api.priority = options.provider_priorities.get(provider_name, api.priority)
 
-    audio_file: Union[Mp3AudioFile, TagFile, None] = eyed3.load(str(path / song))
+        # Album art is shared by every track of the batch that belongs to the same album
+        self.art_cache: ArtCache = ArtCache(options.art_cache_bytes, options.art_max_dimension)
+        self.tag_writer: TagWriter = TagWriter(options.tag_padding)
+        self.manifest: Optional[TagManifest] = get_tag_manifest() if options.incremental else None
+
+    async def close(self):
+        for api in self.api_list:
+            await api.close()
+
+        await self.acoustid.close()
+        await self.art_cache.close()
+
+        self.fingerprint_pool.shutdown()
+        self.write_pool.shutdown()
+
+
+def fingerprint_song(song_path: Path) -> Tuple[Optional[str], FingerprintResult]:
+    audio_file: Union[Mp3AudioFile, TagFile, None] = eyed3.load(str(song_path))
     assert audio_file is not None
     if isinstance(audio_file, TagFile):
         raise TypeError("Invalid Data Format")
 
-    metadata: Optional[Song] = None
-    title: Optional[str] = audio_file.tag.title
+    return audio_file.tag.title, fingerprint_file(song_path)
 
-    # Use acoustid to get details
-    acoust_api_key: str = os.getenv("AC_KEY")
-    fingerprint: ACOUSTID = ACOUSTID(path / song, acoust_api_key)
-    fingerprint_result: Optional[Dict[str, Union[str, float]]] = fingerprint.inference()
-    fingerprint_success: bool = False
+
+async def search_song(song: str, title: Optional[str], fingerprint_result: Optional[Dict[str, Union[str, float]]],
+                      api_list: List[API], planner: QueryPlanner, budget: Optional[int] = None, race: bool = True) \
+        -> Optional[Song]:
+    metadata: Optional[Song] = None
+    total_query_count: int = 0
     fingerprint_title: Optional[str] = None
-    fingerprint_artist: Optional[str] = None
 
     file_base: Union[bytes, str] = os.path.splitext(song)[0]
     try:
@@ -161,9 +231,7 @@ def tag_song(path: Path, song: str, api_list: List[API], number: int):
         file_name = file_base
 
     if fingerprint_result is not None:
-        fingerprint_success = True
         fingerprint_title = fingerprint_result["title"]
-        fingerprint_artist = fingerprint_result["artist"]
 
     possibilities: List[Optional[str]] = [fingerprint_title]
     title_lang: Optional[int] = detect_language(title)
@@ -182,45 +250,47 @@ def tag_song(path: Path, song: str, api_list: List[API], number: int):
         if possibility is None:
             continue
 
-        metadata = construct_query(possibility, api_list)
+        # The query budget is shared by every possibility of the same file
+        remaining_budget: Optional[int] = None if budget is None else budget - total_query_count
+        if remaining_budget is not None and remaining_budget <= 0:
+            break
+
+        metadata, query_count = await construct_query(possibility, api_list, planner, remaining_budget, race)
+        total_query_count += query_count
 
         if metadata is not None:
             break
 
-    if metadata is None:
-        print(f"Cannot tag file {song}")
-        return
+    print(f"{song} needed {total_query_count} queries")
 
-    if fingerprint_success:
-        assert fingerprint_artist is not None and fingerprint_title is not None
-        audio_file.tag.title = fingerprint_title
-        audio_file.tag.artist = fingerprint_artist
+    return metadata
+
+
+def write_song(path: Path, song: str, metadata: Song, fingerprint_result: Optional[Dict[str, Union[str, float]]],
+               album_art: Optional[AlbumArt], provenance: Provenance, tag_writer: TagWriter) -> Tuple[str, str]:
+    audio_file: Union[Mp3AudioFile, TagFile, None] = eyed3.load(str(path / song))
+    assert audio_file is not None and not isinstance(audio_file, TagFile)
+
+    if audio_file.tag is None:
+        audio_file.initTag()
+
+    if fingerprint_result is not None:
+        audio_file.tag.title = fingerprint_result["title"]
+        audio_file.tag.artist = fingerprint_result["artist"]
     else:
         audio_file.tag.title = metadata.song_name
         audio_file.tag.artist = metadata.artists
 
     audio_file.tag.album = metadata.album_name
 
-    audio_tag_filename: str = remove_punctuation(remove_slashes(audio_file.tag.title)).replace(' ', '_')
-    img_path: Path = Path(f"{ALBUM_DIR}/{audio_tag_filename}.jpg")
-
-    # Save all the changes to the tags
-    if metadata.album_art is not None:
-        download_image(metadata.album_art, img_path)
-        print(str(img_path.absolute()))
-        with open(str(img_path.absolute()), "rb") as img:
-            imgdata = img.read()
-            audio_file.tag.images.set(3, imgdata, "image/jpg", metadata.album_name)
+    if album_art is not None:
+        audio_file.tag.images.set(3, album_art.data, album_art.mime_type, metadata.album_name)
 
-    audio_file.tag.save()
+    write_provenance(audio_file.tag, provenance)
 
-    # Rename the file so that it matches the title
-    queue.put((song[:-4].rstrip(), remove_slashes(audio_file.tag.title).rstrip()))
-    os.rename(str(path / song), str(path / f"{remove_slashes(audio_file.tag.title)}.mp3"))
-
-    # Remove old files
-    for file_to_remove in glob.glob(str(path) + "/*.mp3.mp3"):
-        os.remove(file_to_remove)
+    # Save the tags and rename the file so that it matches the title
+    result: TagWriteResult = tag_writer.write(audio_file.tag, remove_slashes(audio_file.tag.title))
+    rename: Tuple[str, str] = (song[:-4].rstrip(), Path(result.path).stem)
 
     final_metadata: Dict[str, Optional[str]] = {
         'song': audio_file.tag.title,
@@ -229,22 +299,110 @@ def tag_song(path: Path, song: str, api_list: List[API], number: int):
         'album art': metadata.album_art
     }
     print(f"{song} will now have the metadata: {final_metadata}")
+
+    return rename
+
+
+async def tag_song(path: Path, song: str, api_list: List[API], number: int, pipeline: TaggingPipeline) \
+        -> Optional[Tuple[str, str]]:
+    print(f"File NO: {number}")
+    print(f"{song} is being processed")
+
+    # Each stage is bounded by its own pool so a slow stage never starves the others
+    loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+    title, fingerprint = await loop.run_in_executor(pipeline.fingerprint_pool, fingerprint_song, path / song)
+
+    # Use acoustid to get details, lookups of concurrent files are batched together
+    if fingerprint.record is not None and fingerprint.record.results is None:
+        fingerprint = await pipeline.acoustid.lookup(fingerprint)
+
+    if fingerprint.error is not None:
+        print(f"Could not fingerprint {song}: {fingerprint.error}")
+
+    fingerprint_result: Optional[Dict[str, Union[str, float]]] = ACOUSTID.best_match(fingerprint)
+
+    async with pipeline.search_semaphore:
+        metadata: Optional[Song] = await search_song(song, title, fingerprint_result, api_list, pipeline.planner,
+                                                     pipeline.options.query_budget, pipeline.options.race_providers)
+
+    if metadata is None:
+        # Not recorded in the manifest, so the next run tries again
+        print(f"Cannot tag file {song}")
+        return None
+
+    album_art: Optional[AlbumArt] = None
+    if metadata.album_art is not None:
+        album_art = await pipeline.art_cache.get(metadata.album_art)
+
+    provenance: Provenance = Provenance(matcher=MATCHER_VERSION,
+                                        confidence=metadata.confidence if metadata.confidence is not None else 0)
+    rename: Tuple[str, str] = await loop.run_in_executor(pipeline.write_pool, write_song, path, song, metadata,
+                                                         fingerprint_result, album_art, provenance, pipeline.tag_writer)
+
+    if pipeline.manifest is not None:
+        await loop.run_in_executor(pipeline.write_pool, pipeline.manifest.record, path / f"{rename[1]}.mp3",
+                                   provenance)
     print(f"{number} done")
 
-    counter.increment()
+    return rename
+
+
+async def tag_directory(path_name: Path, options: Optional[PipelineOptions] = None) -> List[Tuple[str, str]]:
+    files: List[str] = os.listdir(str(path_name))
+
+    if len(files) < 1:
+        return []
 
-    print(f"Total {counter.value()}")
+    pipeline: TaggingPipeline = TaggingPipeline(options if options is not None else PipelineOptions())
+    renames: List[Tuple[str, str]] = []
+
+    async def collect_tag_song(file: str, index: int):
+        rename: Optional[Tuple[str, str]] = await tag_song(path_name, file, pipeline.api_list, index, pipeline)
+
+        if rename is not None:
+            renames.append(rename)
+            print(f"Total {len(renames)}")
+
+    try:
+        if pipeline.manifest is not None:
+            manifest: TagManifest = pipeline.manifest
+            retag_below: Optional[float] = pipeline.options.retag_below
+
+            def select_files() -> List[str]:
+                return [file for file in files
+                        if manifest.needs_tagging(path_name / file, MATCHER_VERSION, retag_below)]
+
+            file_count: int = len(files)
+            files = await asyncio.get_event_loop().run_in_executor(pipeline.write_pool, select_files)
+            print(f"{file_count - len(files)} of {file_count} files are already tagged")
+
+        outcomes: List[Any] = await asyncio.gather(*[collect_tag_song(file, index) for index, file in enumerate(files)],
+                                                   return_exceptions=True)
+
+        # A broken file should not stop the rest of the batch
+        for file, outcome in zip(files, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Cannot tag file {file}: {outcome}")
+    finally:
+        await pipeline.close()
+
+    print(f"Response cache: {get_response_cache().stats()}")
+    print(f"Album art cache: {pipeline.art_cache.stats()}")
+
+    return renames
 
 
 def start(path_dir: Optional[Path] = None):
     load_dotenv()
     global command_line_options
 
-    os.makedirs(ALBUM_DIR, exist_ok=True)
-
     if path_dir is None:
         command_line_options = command_line_parser(sys.argv)
         assert command_line_options is not None
+
+        if command_line_options.profile_imports:
+            print('\n'.join(lazy.profile_report()))
+
         path_name: Union[Path, Any] = Path(command_line_options.command_list[1])
     else:
         path_name = path_dir
@@ -255,33 +413,18 @@ def start(path_dir: Optional[Path] = None):
                                                database_name=getenv("DB_NAME"),
                                                port=getenv("DB_PORT")))
 
-    api_list: List[API] = [VGMDB(), GENIUS(os.getenv("GENIUS_TOKEN"))]
+    options: PipelineOptions = PipelineOptions()
+    if command_line_options is not None:
+        options.incremental = command_line_options.incremental
+        options.retag_below = command_line_options.retag_below
 
     assert isinstance(path_name, Path)
-    files: List[str] = os.listdir(str(path_name))
-    total_files: int = len(files)
-
-    if total_files < 1:
-        return None
-
-    cores = mp.cpu_count()
-
-    with mp.Pool(cores) as pool:
-        pool.starmap(tag_song, [(path_name, file, api_list, index) for index, file in enumerate(files)])
-
-    rmtree(ALBUM_DIR)
-    queue.put("DONE")
-
-    results = []
-    while True:
-        result = queue.get()
-        if result == "DONE":
-            break
-
-        results.append(result)
+    results: List[Tuple[str, str]] = asyncio.run(tag_directory(path_name, options))
 
-    for result in results:
-        database.update_downloaded(*result)
+    rename_report: RenameReport = database.rename_downloaded(results)
+    print(f"Renamed {len(rename_report.renamed)} songs in the database")
+    for old_name, new_name in rename_report.unmatched:
+        print(f"{old_name} is not in the database, it was not renamed to {new_name}")
 
 
 if __name__ == "__main__":
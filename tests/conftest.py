@@ -0,0 +1,34 @@
+from typing import Any
+
+import mongomock
+import pytest
+
+import utils.cache
+from models import CacheOptions
+from utils.cache import ResponseCache
+from utils.database import DatabaseHandler, indexed_databases, search_indexes
+
+
+@pytest.fixture
+def database() -> DatabaseHandler:
+    mongo_database: Any = mongomock.MongoClient()["animetagger"]
+    handler: DatabaseHandler = DatabaseHandler.__new__(DatabaseHandler)
+    handler.database = mongo_database
+    handler.download_collection = mongo_database["downloaded"]
+    handler.blacklist_collection = mongo_database["blacklist"]
+    handler.playlist_collection = mongo_database["playlists"]
+    handler.ensure_indexes()
+
+    yield handler
+
+    search_indexes.clear()
+    indexed_databases.clear()
+
+
+@pytest.fixture(autouse=True)
+def response_cache(tmp_path, monkeypatch) -> ResponseCache:
+    # Every test gets an empty cache of its own instead of the one in .cache
+    cache: ResponseCache = ResponseCache(CacheOptions(path=str(tmp_path / "responses.sqlite")))
+    monkeypatch.setattr(utils.cache, "response_cache", cache)
+
+    return cache
@@ -0,0 +1,31 @@
+from collections import Counter
+from typing import Any
+
+ROUND_TRIPS = frozenset(["find", "find_one", "insert_one", "insert_many", "update_one", "update_many", "bulk_write",
+                         "delete_one", "delete_many", "find_one_and_update"])
+
+
+class CountingCollection:
+    # Counts every call that is a round trip to the server and how many documents came back
+    def __init__(self, collection: Any, counter: Counter):
+        self.collection = collection
+        self.counter = counter
+
+    def __getattr__(self, attribute: str) -> Any:
+        collection_attribute: Any = getattr(self.collection, attribute)
+        if attribute not in ROUND_TRIPS:
+            return collection_attribute
+
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            self.counter["round trips"] += 1
+            result: Any = collection_attribute(*args, **kwargs)
+
+            if attribute == "find":
+                result = list(result)
+                self.counter["documents read"] += len(result)
+            elif attribute == "find_one" and result is not None:
+                self.counter["documents read"] += 1
+
+            return result
+
+        return counted
@@ -0,0 +1,79 @@
+import asyncio
+import sqlite3
+from typing import Any, Dict
+
+import api.acoustid
+from api.acoustid import ACOUSTID, FingerprintResult
+from utils.fingerprint_store import FingerprintRecord
+
+
+class FakeResponse:
+    def __init__(self, body: Dict[str, Any]):
+        self.body = body
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *args: Any):
+        pass
+
+    async def json(self) -> Dict[str, Any]:
+        return self.body
+
+
+class FakeSession:
+    closed = False
+
+    def post(self, url: str, data: Dict[str, str]) -> FakeResponse:
+        return FakeResponse({'status': 'ok', 'fingerprints': [{'index': '0', 'results': []}]})
+
+    async def close(self):
+        pass
+
+
+class FailingStore:
+    def set(self, record: FingerprintRecord):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def fingerprint_result() -> FingerprintResult:
+    return FingerprintResult(path="song.mp3", record=FingerprintRecord(content_hash="hash", duration=1,
+                                                                       fingerprint=b"AQAA", results=None))
+
+
+def lookup(client: ACOUSTID) -> FingerprintResult:
+    async def run() -> FingerprintResult:
+        return await asyncio.wait_for(client.lookup(fingerprint_result()), 1)
+
+    return asyncio.run(run())
+
+
+def test_lookup_is_resolved_when_the_rate_limiter_fails():
+    client: ACOUSTID = ACOUSTID("key", batch_size=1)
+
+    async def broken_wait():
+        raise RuntimeError("no slot")
+
+    client.rate_limiter.wait = broken_wait
+
+    assert lookup(client).error == "web service request was interrupted"
+
+
+def test_lookup_is_resolved_when_the_store_fails(monkeypatch):
+    monkeypatch.setattr(api.acoustid, "get_fingerprint_store", FailingStore)
+    client: ACOUSTID = ACOUSTID("key", batch_size=1)
+    client.session = FakeSession()
+
+    assert lookup(client).error == "web service request was interrupted"
+
+
+def test_pending_lookups_are_resolved_on_close():
+    async def run() -> FingerprintResult:
+        client: ACOUSTID = ACOUSTID("key", batch_size=10, batch_delay=60)
+        waiting: asyncio.Future = asyncio.ensure_future(client.lookup(fingerprint_result()))
+        await asyncio.sleep(0)
+        await client.close()
+
+        return await asyncio.wait_for(waiting, 1)
+
+    assert asyncio.run(run()).error == "closed before the lookup was sent"
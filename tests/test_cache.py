@@ -0,0 +1,70 @@
+import sqlite3
+import time
+from pathlib import Path
+
+from models import CacheOptions
+from utils.cache import ACCESS_FLUSH_SIZE, ResponseCache
+
+
+def stored_size(cache: ResponseCache) -> int:
+    return cache.connect().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_running_total_follows_every_change(response_cache: ResponseCache):
+    response_cache.set("https://vgmdb.info/search?q=a", {'a': "x" * 100}, 60)
+    response_cache.set("https://vgmdb.info/search?q=b", {'b': "x" * 200}, 60)
+    # Replacing an entry only counts the new value
+    response_cache.set("https://vgmdb.info/search?q=a", {'a': "x" * 50}, 60)
+    response_cache.set_many([("https://vgmdb.info/album/1", 1), ("https://vgmdb.info/album/2", 2)], -1)
+
+    # Reading an expired entry removes it
+    assert response_cache.get("https://vgmdb.info/album/1") is None
+    assert ResponseCache.total_size(response_cache.connect()) == stored_size(response_cache)
+
+    response_cache.clear()
+    assert ResponseCache.total_size(response_cache.connect()) == 0
+
+
+def test_least_recently_used_entries_are_evicted_over_budget(tmp_path: Path):
+    cache: ResponseCache = ResponseCache(CacheOptions(path=str(tmp_path / "responses.sqlite"), max_bytes=1000))
+    for index in range(4):
+        cache.set(f"https://vgmdb.info/album/{index}", "x" * 200, 60)
+        time.sleep(0.01)
+
+    # A hit makes the oldest entry the most recently used one
+    assert cache.get("https://vgmdb.info/album/0") == "x" * 200
+    cache.set("https://vgmdb.info/album/4", "x" * 200, 60)
+
+    assert cache.get("https://vgmdb.info/album/1") is None
+    assert cache.get("https://vgmdb.info/album/0") is not None
+    assert ResponseCache.total_size(cache.connect()) == stored_size(cache) <= 1000
+
+
+def test_hits_are_written_in_batches(response_cache: ResponseCache):
+    response_cache.set("https://vgmdb.info/album/1", 1, 60)
+    connection: sqlite3.Connection = response_cache.connect()
+    written: float = connection.execute("SELECT accessed FROM responses").fetchone()[0]
+
+    for _ in range(ACCESS_FLUSH_SIZE - 1):
+        response_cache.get("https://vgmdb.info/album/1")
+    assert connection.execute("SELECT accessed FROM responses").fetchone()[0] == written
+
+    response_cache.get("https://vgmdb.info/album/1")
+    assert connection.execute("SELECT accessed FROM responses").fetchone()[0] > written
+    assert response_cache.stats() == {'hits': ACCESS_FLUSH_SIZE, 'misses': 0}
+
+
+def test_caches_with_the_old_layout_start_over(tmp_path: Path):
+    path: Path = tmp_path / "responses.sqlite"
+    connection: sqlite3.Connection = sqlite3.connect(str(path))
+    connection.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires REAL, "
+                       "accessed REAL)")
+    connection.execute("INSERT INTO responses VALUES ('https://vgmdb.info/album/1', '1', 1, 1e12, 0)")
+    connection.commit()
+    connection.close()
+
+    cache: ResponseCache = ResponseCache(CacheOptions(path=str(path)))
+    cache.set("https://vgmdb.info/album/2", {'value': 2}, 60)
+
+    assert cache.get("https://vgmdb.info/album/1") is None
+    assert cache.get("https://vgmdb.info/album/2") == {'value': 2}
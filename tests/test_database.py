@@ -0,0 +1,136 @@
+from collections import Counter
+from typing import Any, Dict, List
+
+import pymongo.errors
+import pytest
+
+from tests.counting_collection import CountingCollection
+from utils.database import DatabaseHandler, RenameReport, indexed_databases, name_key
+
+
+def legacy_download(url: str, name: str) -> Dict[str, Any]:
+    return {'url': url, 'name': name}
+
+
+def test_backfill_runs_once_per_database(database: DatabaseHandler):
+    collection: Any = database.download_collection
+    indexed_databases.clear()
+    database.database["migrations"].delete_many({})
+    collection.insert_one(legacy_download("https://youtu.be/aaaaaaaaaaa", "Old Song"))
+
+    database.ensure_indexes()
+    backfilled: Dict[str, Any] = collection.find_one({'url': "https://youtu.be/aaaaaaaaaaa"})
+    assert backfilled['video_id'] == "aaaaaaaaaaa"
+    assert backfilled['name_key'] == name_key("Old Song")
+
+    # Neither a second handler in this process nor a new process scans the collections again
+    collection.insert_one(legacy_download("https://youtu.be/bbbbbbbbbbb", "Other Song"))
+    database.ensure_indexes()
+    indexed_databases.clear()
+    database.ensure_indexes()
+
+    untouched: Dict[str, Any] = collection.find_one({'url': "https://youtu.be/bbbbbbbbbbb"})
+    assert 'video_id' not in untouched and 'name_key' not in untouched
+    index_keys: List[str] = [index['key'][0][0] for index in collection.index_information().values()]
+    assert sorted(index_keys) == ["_id", "name_key", "url", "video_id"]
+
+
+def counting(database: DatabaseHandler) -> Counter:
+    counter: Counter = Counter()
+    database.download_collection = CountingCollection(database.download_collection, counter)
+    database.blacklist_collection = CountingCollection(database.blacklist_collection, counter)
+
+    return counter
+
+
+def test_add_to_blacklist_is_a_single_upsert_per_video(database: DatabaseHandler):
+    counter: Counter = counting(database)
+
+    assert database.add_to_blacklist("https://www.youtube.com/watch?v=aaaaaaaaaaa") is not None
+    # The same video under another url is not added twice
+    assert database.add_to_blacklist("https://youtu.be/aaaaaaaaaaa") is None
+
+    assert counter["round trips"] == 2
+    assert database.get_all_blacklist_urls() == ["https://www.youtube.com/watch?v=aaaaaaaaaaa"]
+
+
+def test_add_many_to_downloaded_is_one_bulk_write(database: DatabaseHandler):
+    database.add_many_to_downloaded(["https://youtu.be/aaaaaaaaaaa"], ["First Name"])
+    database.search_collection_by_name("anything", database.download_collection)
+    counter: Counter = counting(database)
+
+    # mongomock numbers upserted ids among the upserts rather than among all operations, the new video goes first
+    database.add_many_to_downloaded(["https://youtu.be/bbbbbbbbbbb", "https://www.youtube.com/watch?v=aaaaaaaaaaa",
+                                     "https://www.youtube.com/watch?v=bbbbbbbbbbb"],
+                                    ["New Song", "Second Name", "New Song Again"])
+
+    assert counter["round trips"] == 1
+    documents: List[Dict[str, Any]] = list(database.download_collection.find({}, {'_id': 0}))
+    # Videos that were already downloaded keep their document, the last url of a new video wins
+    assert sorted((document['video_id'], document['name'], document['name_key']) for document in documents) == [
+        ("aaaaaaaaaaa", "First Name", name_key("First Name")),
+        ("bbbbbbbbbbb", "New Song Again", name_key("New Song Again"))
+    ]
+    assert [match['name'] for match in database.search_collection_by_name("New Song Again",
+                                                                         database.download_collection)][:1] == \
+        ["New Song Again"]
+
+
+def test_lookups_only_read_the_projected_fields(database: DatabaseHandler):
+    database.add_many_to_downloaded([f"https://youtu.be/video{index:06d}" for index in range(5)],
+                                    [f"Song {index}" for index in range(5)])
+    counter: Counter = counting(database)
+
+    assert database.find_video_ids(["video000001", "video000003", "missing0000"], database.download_collection) == \
+        {"video000001", "video000003"}
+    assert database.check_if_url_exists("https://youtu.be/video000004", database.download_collection)
+    assert len(database.get_all_downloaded_urls()) == 5
+
+    assert counter["round trips"] == 3
+    assert counter["documents read"] == 2 + 1 + 5
+    assert list(database.download_collection.collection.find({'video_id': {'$in': ["video000001"]}},
+                                                             {'video_id': 1, '_id': 0})) == \
+        [{'video_id': "video000001"}]
+
+
+def test_rename_downloaded_is_one_find_and_one_bulk_write(database: DatabaseHandler):
+    database.add_many_to_downloaded(["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb"],
+                                    ["Old Song (Lyrics)", "Other Song"])
+    counter: Counter = counting(database)
+
+    report: RenameReport = database.rename_downloaded([("Old Song (Lyrics) ", "New Song"),
+                                                       ("Other Song", "Renamed"), ("Unknown", "Nothing")])
+
+    assert counter["round trips"] == 2
+    assert report.renamed == [("Old Song (Lyrics) ", "New Song"), ("Other Song", "Renamed")]
+    assert report.unmatched == [("Unknown", "Nothing")]
+    assert sorted(document['new_name'] for document in database.download_collection.find({})) == \
+        ["New Song", "Renamed"]
+
+
+def test_video_id_and_url_are_unique(database: DatabaseHandler):
+    collection: Any = database.download_collection
+    collection.insert_one({'url': "https://youtu.be/aaaaaaaaaaa", 'video_id': "aaaaaaaaaaa"})
+
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        collection.insert_one({'url': "https://www.youtube.com/watch?v=aaaaaaaaaaa", 'video_id': "aaaaaaaaaaa"})
+
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        collection.insert_one({'url': "https://youtu.be/aaaaaaaaaaa"})
+
+    # Documents the backfill left without an id do not collide with each other
+    collection.insert_many([{'url': "https://youtu.be/duplicate01"}, {'url': "https://youtu.be/duplicate02"}])
+
+
+def test_duplicate_urls_fall_back_to_a_plain_index(database: DatabaseHandler):
+    collection: Any = database.playlist_collection
+    collection.drop_indexes()
+    collection.insert_many([{'url': "https://youtube.com/playlist?list=a"},
+                            {'url': "https://youtube.com/playlist?list=a"}])
+    indexed_databases.clear()
+
+    database.ensure_indexes()
+
+    url_indexes: List[Dict[str, Any]] = [index for index in collection.index_information().values()
+                                         if index['key'][0][0] == 'url']
+    assert len(url_indexes) == 1 and not url_indexes[0].get('unique', False)
@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+from typing import List
+
+from utils.drive_sync import DriveSync, FakeDriveBackend, UploadResult, file_md5
+
+CHUNK = 1024
+
+
+def write_song(directory: Path, name: str, size: int) -> Path:
+    path: Path = directory / name
+    path.write_bytes(os.urandom(size))
+
+    return path
+
+
+def test_failed_chunk_resumes_from_the_acknowledged_offset(tmp_path: Path):
+    song: Path = write_song(tmp_path, "song.mp3", 4 * CHUNK)
+    backend: FakeDriveBackend = FakeDriveBackend(tmp_path / "drive", CHUNK, fail_chunks={2, 3})
+    sync: DriveSync = DriveSync(backend, backoff=0)
+
+    result: UploadResult = sync.upload(song, "folder")
+
+    assert result.error is None
+    # Only the interrupted chunk is sent again, not the whole file
+    assert backend.sent_bytes == 4 * CHUNK + 2 * CHUNK
+    assert backend.files[result.file_id].md5 == file_md5(song)
+
+
+def test_upload_gives_up_after_the_attempts(tmp_path: Path):
+    song: Path = write_song(tmp_path, "song.mp3", 2 * CHUNK)
+    backend: FakeDriveBackend = FakeDriveBackend(tmp_path / "drive", CHUNK, fail_chunks={2, 3, 4})
+    sync: DriveSync = DriveSync(backend, attempts=3, backoff=0)
+
+    result: UploadResult = sync.upload(song, "folder")
+
+    assert result.file_id is None
+    assert "interrupted" in result.error
+    assert backend.files == {}
+
+
+def test_sync_dir_skips_unchanged_and_replaces_changed_files(tmp_path: Path):
+    songs: Path = tmp_path / "songs"
+    songs.mkdir()
+    for index in range(3):
+        write_song(songs, f"song {index}.mp3", 3 * CHUNK + index)
+
+    backend: FakeDriveBackend = FakeDriveBackend(tmp_path / "drive", CHUNK)
+    sync: DriveSync = DriveSync(backend, workers=2, backoff=0)
+
+    first_run: List[UploadResult] = sync.sync_dir(songs, "folder")
+    assert [result.skipped for result in first_run] == [False, False, False]
+    replaced_id: str = first_run[1].file_id
+
+    write_song(songs, "song 1.mp3", CHUNK)
+    second_run: List[UploadResult] = sync.sync_dir(songs, "folder")
+
+    assert [result.skipped for result in second_run] == [True, False, True]
+    assert backend.trashed == [replaced_id]
+    assert backend.list_calls == 2
+    assert sorted(file.title for file in backend.list_folder("folder")) == ["song 0.mp3", "song 1.mp3", "song 2.mp3"]
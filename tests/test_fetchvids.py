@@ -0,0 +1,47 @@
+from pathlib import Path
+from typing import List
+
+import fetchvids
+from utils.database import DatabaseHandler
+from utils.downloader import DownloadResult
+from utils.workspace import Workspace, WorkspaceManager
+
+
+class FakeDownloader:
+    async def download_many(self, urls: List[str], download_path: Path) -> List[DownloadResult]:
+        results: List[DownloadResult] = []
+        for index, url in enumerate(urls):
+            song_path: Path = download_path / f"video{index}" / "Same Title.mp3"
+            song_path.parent.mkdir(parents=True)
+            song_path.write_bytes(url.encode())
+            results.append(DownloadResult(url=url, id=f"video{index}", title="Same Title", path=song_path))
+
+        return results
+
+
+def test_songs_with_the_same_title_keep_both_files(tmp_path: Path, monkeypatch, database: DatabaseHandler):
+    monkeypatch.setattr(fetchvids, "Downloader", FakeDownloader)
+    monkeypatch.setattr(fetchvids, "select_vids", lambda url_list, db, max_number: (url_list, []))
+    urls: List[str] = ["https://www.youtube.com/watch?v=aaaaaaaaaaa", "https://www.youtube.com/watch?v=bbbbbbbbbbb"]
+
+    names: List[str] = fetchvids.download_vids(tmp_path, urls, database)
+
+    assert names == ["Same Title", "Same Title (2)"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["Same Title (2).mp3", "Same Title.mp3"]
+    assert (tmp_path / "Same Title (2).mp3").read_bytes() == urls[1].encode()
+    assert sorted(download['name'] for download in database.download_collection.find({})) == names
+
+
+def test_start_downloads_into_its_own_workspace(tmp_path: Path, monkeypatch, database: DatabaseHandler):
+    monkeypatch.setattr(fetchvids, "Downloader", FakeDownloader)
+    monkeypatch.setattr(fetchvids, "select_vids", lambda url_list, db, max_number: (url_list, []))
+    monkeypatch.setattr(fetchvids, "get_database", lambda: database)
+    manager: WorkspaceManager = WorkspaceManager(tmp_path / "workspaces")
+    other_job: Workspace = manager.acquire()
+    (other_job.songs / "Other Song.mp3").write_bytes(b"other")
+
+    with manager.workspace() as workspace:
+        assert fetchvids.start("https://www.youtube.com/watch?v=aaaaaaaaaaa", workspace=workspace) == ["Same Title"]
+        assert [path.name for path in workspace.songs.iterdir()] == ["Same Title.mp3"]
+
+    assert (other_job.songs / "Other Song.mp3").read_bytes() == b"other"
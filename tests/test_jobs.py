@@ -0,0 +1,107 @@
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+from utils.jobs import CANCELLED, DONE, Job, JobQueue, JobStore, ProgressCallback
+
+
+def wait_for(job_queue: JobQueue, job_id: str, status: str) -> Job:
+    deadline: float = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job: Job = job_queue.get(job_id)
+        if job.status == status:
+            return job
+
+        time.sleep(0.01)
+
+    raise AssertionError(f"job {job_id} is {job_queue.get(job_id).status}, not {status}")
+
+
+def test_cancelled_queued_job_is_never_started(tmp_path: Path):
+    started: List[str] = []
+    gate: threading.Event = threading.Event()
+
+    def runner(job: Job, report: ProgressCallback, cancelled: threading.Event) -> List[str]:
+        started.append(job.url)
+        gate.wait(5)
+        return []
+
+    job_queue: JobQueue = JobQueue(JobStore(tmp_path / "jobs.sqlite"), runner, workers=1)
+    job_queue.start()
+    running_job, _ = job_queue.submit("add", url="https://youtu.be/aaaaaaaaaaa")
+    queued_job, _ = job_queue.submit("add", url="https://youtu.be/bbbbbbbbbbb")
+
+    assert job_queue.cancel(queued_job.id).status == CANCELLED
+    gate.set()
+
+    wait_for(job_queue, running_job.id, DONE)
+    assert started == ["https://youtu.be/aaaaaaaaaaa"]
+    assert job_queue.store.get(queued_job.id).status == CANCELLED
+    assert job_queue.cancel_events == {}
+
+
+def test_cancelling_a_finished_job_leaves_it_alone(tmp_path: Path):
+    job_queue: JobQueue = JobQueue(JobStore(tmp_path / "jobs.sqlite"), lambda job, report, cancelled: ["song"],
+                                   workers=1)
+    job_queue.start()
+    job, _ = job_queue.submit("add", url="https://youtu.be/aaaaaaaaaaa")
+    wait_for(job_queue, job.id, DONE)
+
+    assert job_queue.cancel(job.id).status == DONE
+    assert job_queue.store.get(job.id).result == ["song"]
+
+
+def test_progress_is_handed_out_as_copies_and_saved_now_and_then(tmp_path: Path):
+    reported: threading.Event = threading.Event()
+    gate: threading.Event = threading.Event()
+
+    def runner(job: Job, report: ProgressCallback, cancelled: threading.Event) -> List[str]:
+        for _ in range(1000):
+            report("download")
+        reported.set()
+        gate.wait(5)
+        return ["song"]
+
+    job_queue: JobQueue = JobQueue(JobStore(tmp_path / "jobs.sqlite"), runner, workers=1)
+    saved: List[Job] = []
+    save = job_queue.store.save
+    job_queue.store.save = lambda job: (saved.append(job), save(job))
+    job_queue.start()
+    job, _ = job_queue.submit("add", url="https://youtu.be/aaaaaaaaaaa")
+    reported.wait(5)
+
+    running_job: Job = job_queue.get(job.id)
+    assert running_job.progress == {'download': 1000}
+    running_job.progress["download"] = 0
+    assert job_queue.get(job.id).progress == {'download': 1000}
+    gate.set()
+
+    finished_job: Job = wait_for(job_queue, job.id, DONE)
+    assert finished_job.progress == {'download': 1000}
+    # Queued, running and finished, the progress events in between do not each reach the store
+    assert len(saved) < 10
+
+
+def test_jobs_can_be_described_while_they_report_progress(tmp_path: Path):
+    done: threading.Event = threading.Event()
+
+    def runner(job: Job, report: ProgressCallback, cancelled: threading.Event) -> List[str]:
+        index: int = 0
+        while not done.is_set():
+            report(f"stage {index % 500}")
+            index += 1
+        return []
+
+    job_queue: JobQueue = JobQueue(JobStore(tmp_path / "jobs.sqlite"), runner, workers=1)
+    job_queue.start()
+    job, _ = job_queue.submit("update", number=1)
+
+    try:
+        for _ in range(2000):
+            for running_job in job_queue.running():
+                running_job.dict()
+    finally:
+        done.set()
+
+    wait_for(job_queue, job.id, DONE)
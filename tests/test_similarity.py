@@ -0,0 +1,69 @@
+from typing import List, Tuple
+
+import pytest
+
+from utils.similarity import BatchScorer, default_backend, fuzz
+from utils.text_processing import calculate_similarity
+
+# Queries as they come out of YouTube titles, with the candidates VGMDB and Genius return for them
+GOLDEN_SET: List[Tuple[str, List[str]]] = [
+    ("Naruto Shippuden Opening 16 Silhouette", [
+        "Silhouette", "Blue Bird", "Sign", "Silhouette (TV size)", "Hero's Come Back!!", "Kanashimi wo Yasashisa ni"
+    ]),
+    ("Unravel Tokyo Ghoul OP", [
+        "unravel", "Unravel (Acoustic Version)", "Munou", "Asphyxia", "Glassy Sky", "Katharsis"
+    ]),
+    ("Shinzou wo Sasageyo Attack on Titan", [
+        "Shinzou wo Sasageyo!", "Guren no Yumiya", "Jiyuu no Tsubasa", "Red Swan", "Shoukei to Shikabane no Michi"
+    ]),
+    ("Again - YUI Fullmetal Alchemist Brotherhood", [
+        "again", "Hologram", "Golden Time Lover", "Period", "Rain", "Ready Steady Go"
+    ]),
+    ("Gurenge LiSA Kimetsu no Yaiba", [
+        "Gurenge", "Homura", "Akeboshi", "Zankyou Sanka", "Shirogane", "From the Edge"
+    ]),
+    ("Sorairo Days Tengen Toppa Gurren Lagann", [
+        "Sorairo Days", "Underground", "Happy Tomorrow", "Nijiiro Days", "Days", "Sora Iro Days (Instrumental)"
+    ]),
+]
+
+requires_rapidfuzz = pytest.mark.skipif(fuzz is None, reason="rapidfuzz is not installed")
+
+
+def ranking(scores: List[float]) -> List[int]:
+    return sorted(range(len(scores)), key=lambda index: -scores[index])
+
+
+@pytest.mark.parametrize("query,candidates", GOLDEN_SET)
+def test_difflib_keeps_the_ranking(query: str, candidates: List[str]):
+    expected: List[float] = [calculate_similarity(candidate, query) for candidate in candidates]
+
+    assert BatchScorer(query, "difflib").score_many(candidates) == pytest.approx(expected)
+
+
+def test_difflib_is_the_default(monkeypatch):
+    # CONFIDENCE_THRESHOLD and the search cutoff were tuned on difflib scores
+    monkeypatch.delenv("SIMILARITY_BACKEND", raising=False)
+
+    assert default_backend() == "difflib"
+    assert BatchScorer("query").backend == "difflib"
+
+
+@requires_rapidfuzz
+@pytest.mark.parametrize("query,candidates", GOLDEN_SET)
+def test_rapidfuzz_picks_the_same_match(query: str, candidates: List[str]):
+    # Weak candidates may swap places, the one that gets picked may not
+    expected: List[int] = ranking([calculate_similarity(candidate, query) for candidate in candidates])
+    actual: List[int] = ranking(BatchScorer(query, "rapidfuzz").score_many(candidates))
+
+    assert actual[0] == expected[0]
+
+
+@requires_rapidfuzz
+def test_rapidfuzz_batch_matches_single_scores():
+    query, candidates = GOLDEN_SET[0]
+    scorer: BatchScorer = BatchScorer(query, "rapidfuzz")
+
+    assert scorer.score_many(candidates + candidates[:2]) == pytest.approx(
+        [scorer.score(candidate) for candidate in candidates + candidates[:2]])
+    assert scorer.score_many([]) == []
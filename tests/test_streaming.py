@@ -0,0 +1,45 @@
+from pathlib import Path
+from typing import List
+
+from streaming import StreamedSong, claim_retries, upload_song
+from utils.database import DatabaseHandler
+from utils.drive_sync import DriveSync, FakeDriveBackend
+
+
+def downloaded_song(songs_path: Path, video: str, title: str) -> StreamedSong:
+    directory: Path = songs_path / video
+    directory.mkdir(parents=True)
+    song_file: Path = directory / f"{title}.mp3"
+    song_file.write_bytes(title.encode() * 1024)
+
+    return StreamedSong(url=f"https://youtu.be/{video}", directory=directory, file=song_file)
+
+
+def test_uploaded_song_is_removed_and_recorded(tmp_path: Path, database: DatabaseHandler):
+    song: StreamedSong = downloaded_song(tmp_path / "songs", "aaaaaaaaaaa", "Song")
+    sync: DriveSync = DriveSync(FakeDriveBackend(tmp_path / "drive"), backoff=0)
+
+    assert upload_song(song, sync, "folder", database, tmp_path / "retry") == "Song"
+    assert not song.directory.exists()
+    assert database.get_all_downloaded_urls() == ["https://youtu.be/aaaaaaaaaaa"]
+
+
+def test_failed_upload_is_kept_and_retried(tmp_path: Path, database: DatabaseHandler):
+    retry_path: Path = tmp_path / "retry"
+    song: StreamedSong = downloaded_song(tmp_path / "songs", "aaaaaaaaaaa", "Song")
+    failing_sync: DriveSync = DriveSync(FakeDriveBackend(tmp_path / "drive", fail_chunks={1, 2}), attempts=2,
+                                        backoff=0)
+
+    assert upload_song(song, failing_sync, "folder", database, retry_path) is None
+    assert database.get_all_downloaded_urls() == []
+    assert (retry_path / "aaaaaaaaaaa" / "Song.mp3").is_file()
+
+    # The next run takes the song over and uploads it without downloading it again
+    retries: List[StreamedSong] = claim_retries(retry_path, tmp_path / "next run")
+    assert [retry.url for retry in retries] == [song.url]
+    assert list(retry_path.iterdir()) == [] and claim_retries(retry_path, tmp_path / "another run") == []
+
+    sync: DriveSync = DriveSync(FakeDriveBackend(tmp_path / "drive"), backoff=0)
+    assert upload_song(retries[0], sync, "folder", database, retry_path) == "Song"
+    assert not retries[0].directory.exists()
+    assert database.get_all_downloaded_urls() == ["https://youtu.be/aaaaaaaaaaa"]
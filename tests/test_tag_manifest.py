@@ -0,0 +1,87 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import eyed3
+import pytest
+
+from utils.tag_manifest import Provenance, TagManifest, read_provenance, write_provenance
+
+AUDIO = (b"\xff\xfb\x90\x00" + b"\x01" * 413) * 50
+
+
+def create_song(path: Path, audio: bytes = AUDIO, provenance: Optional[Provenance] = None) -> Path:
+    eyed3.log.setLevel("ERROR")
+    path.write_bytes(audio)
+
+    audio_file = eyed3.load(str(path))
+    audio_file.initTag()
+    audio_file.tag.title = path.stem
+    if provenance is not None:
+        write_provenance(audio_file.tag, provenance)
+    audio_file.tag.save()
+
+    return path
+
+
+@pytest.fixture
+def manifest(tmp_path: Path) -> TagManifest:
+    return TagManifest(tmp_path / "manifest.sqlite")
+
+
+def test_recorded_song_is_skipped_until_the_matcher_changes(tmp_path: Path, manifest: TagManifest):
+    song: Path = create_song(tmp_path / "Song.mp3")
+    manifest.record(song, Provenance(matcher="1", confidence=0.8))
+
+    assert not manifest.needs_tagging(song, "1")
+    assert not manifest.needs_tagging(song, "1", retag_below=0.5)
+    assert manifest.needs_tagging(song, "1", retag_below=0.9)
+    assert manifest.needs_tagging(song, "2")
+
+
+def test_edited_tags_keep_the_entry_but_new_audio_does_not(tmp_path: Path, manifest: TagManifest):
+    song: Path = create_song(tmp_path / "Song.mp3")
+    manifest.record(song, Provenance(matcher="1", confidence=0.8))
+
+    audio_file = eyed3.load(str(song))
+    audio_file.tag.artist = "Artist"
+    audio_file.tag.save()
+    os.utime(str(song), (0, 0))
+    assert not manifest.needs_tagging(song, "1")
+
+    create_song(song, AUDIO[:-417])
+    assert manifest.needs_tagging(song, "1")
+
+
+def test_moved_song_takes_its_entry_along(tmp_path: Path, manifest: TagManifest):
+    song: Path = create_song(tmp_path / "Song.mp3")
+    manifest.record(song, Provenance(matcher="1", confidence=0.8))
+    moved: Path = song.rename(tmp_path / "Renamed.mp3")
+
+    assert not manifest.needs_tagging(moved, "1")
+    assert manifest.get(song.resolve()) is None
+    assert manifest.get(moved.resolve()).confidence == 0.8
+
+
+def test_copied_song_is_not_adopted(tmp_path: Path, manifest: TagManifest):
+    song: Path = create_song(tmp_path / "Song.mp3")
+    manifest.record(song, Provenance(matcher="1", confidence=0.8))
+    copy: Path = Path(shutil.copy(str(song), str(tmp_path / "Copy.mp3")))
+
+    # The copy carries no marker of its own, so it is tagged like any other file
+    assert manifest.needs_tagging(copy, "1")
+    assert manifest.get(song.resolve()) is not None
+
+
+def test_provenance_frames_stand_in_for_a_lost_manifest(tmp_path: Path, manifest: TagManifest):
+    song: Path = create_song(tmp_path / "Song.mp3", provenance=Provenance(matcher="1", confidence=0.75))
+
+    assert read_provenance(song) == Provenance(matcher="1", confidence=0.75)
+    assert not manifest.needs_tagging(song, "1")
+    assert manifest.get(song.resolve()).matcher == "1"
+    assert manifest.needs_tagging(song, "2")
+
+    untagged: Path = create_song(tmp_path / "Untagged.mp3", AUDIO[:-417])
+    assert read_provenance(untagged) is None
+    assert manifest.needs_tagging(untagged, "1")
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+import eyed3
+import pytest
+
+from utils.fingerprint_store import audio_bounds
+from utils.tag_writer import TagWriteResult, TagWriter
+
+# MPEG 1 layer III, 128 kbit/s, 44.1 kHz, every frame is 417 bytes long
+AUDIO = (b"\xff\xfb\x90\x00" + b"\x01" * 413) * 50
+
+
+@pytest.fixture
+def song(tmp_path: Path) -> Path:
+    eyed3.log.setLevel("ERROR")
+    path: Path = tmp_path / "Song (Official Video).mp3"
+    path.write_bytes(AUDIO)
+
+    audio_file = eyed3.load(str(path))
+    audio_file.initTag()
+    audio_file.tag.title = "Song (Official Video)"
+    audio_file.tag.save()
+
+    return path
+
+
+def audio(path: Path) -> bytes:
+    start, end = audio_bounds(path)
+    return path.read_bytes()[start:end]
+
+
+def test_small_edit_is_written_in_place(song: Path):
+    size: int = song.stat().st_size
+    audio_file = eyed3.load(str(song))
+    audio_file.tag.title = "Song"
+    audio_file.tag.artist = "Artist"
+
+    result: TagWriteResult = TagWriter().write(audio_file.tag, "Song")
+
+    assert not result.rewritten
+    assert result.path == str(song.parent / "Song.mp3") and not song.exists()
+    assert Path(result.path).stat().st_size == size
+    assert audio(Path(result.path)) == AUDIO
+    assert [path.name for path in song.parent.iterdir()] == ["Song.mp3"]
+
+    # The tag follows the file, saving it again goes to the renamed song
+    assert audio_file.tag.file_info.name == result.path
+    audio_file.tag.album = "Album"
+    audio_file.tag.save()
+    assert eyed3.load(result.path).tag.album == "Album"
+
+
+def test_grown_tag_is_rewritten_with_padding(song: Path):
+    audio_file = eyed3.load(str(song))
+    audio_file.tag.images.set(3, os.urandom(8 * 1024), "image/jpeg", "Album")
+    tag_writer: TagWriter = TagWriter(padding=1024)
+
+    result: TagWriteResult = tag_writer.write(audio_file.tag, "Song")
+
+    assert result.rewritten
+    assert audio(Path(result.path)) == AUDIO
+    assert audio_file.tag.file_info.name == result.path
+    assert audio_file.tag.file_info.tag_padding_size == 1024
+
+    # The padding leaves room for the next run
+    audio_file = eyed3.load(result.path)
+    audio_file.tag.comments.set("x" * 300)
+    second_result: TagWriteResult = tag_writer.write(audio_file.tag, "Song")
+
+    assert not second_result.rewritten and second_result.path == result.path
+    assert eyed3.load(result.path).tag.comments[0].text == "x" * 300
+    assert audio(Path(result.path)) == AUDIO
+
+
+def test_taken_name_gets_a_suffix(song: Path):
+    (song.parent / "Song.mp3").write_bytes(b"another song")
+    audio_file = eyed3.load(str(song))
+
+    result: TagWriteResult = TagWriter().write(audio_file.tag, "Song")
+
+    assert result.path == str(song.parent / "Song (2).mp3")
+    assert (song.parent / "Song.mp3").read_bytes() == b"another song"
+    assert audio(Path(result.path)) == AUDIO
+    assert sorted(path.name for path in song.parent.iterdir()) == ["Song (2).mp3", "Song.mp3"]
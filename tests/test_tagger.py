@@ -0,0 +1,67 @@
+import asyncio
+from asyncio import Task
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession
+
+from api import API
+from models import Song
+from tagger import race_databases
+
+
+class FakeProvider(API):
+    def __init__(self, song: Optional[Song] = None, similarity: float = 0, delay: float = 0,
+                 error: Optional[Exception] = None, priority: int = 0):
+        super().__init__(priority=priority)
+        self.song = song
+        self.similarity = similarity
+        self.delay = delay
+        self.error = error
+        self.cancelled = False
+
+    def query(self, user_query: str, session: ClientSession) -> Task:
+        return asyncio.ensure_future(asyncio.sleep(0, {'query': user_query}))
+
+    async def album(self, response_list: List[Optional[Dict[str, Any]]], initial_query: str, best_similarity: float,
+                    session: ClientSession) -> Tuple[float, Optional[Song]]:
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+        # Like VGMDB.album and GENIUS.album on a response they do not expect
+        if self.error is not None:
+            raise self.error
+
+        return self.similarity, self.song
+
+    def url_encode(self, url: str) -> str:
+        return url
+
+
+def race(providers: List[FakeProvider]) -> List[Tuple[float, int, Song]]:
+    async def run() -> List[Tuple[float, int, Song]]:
+        try:
+            return await race_databases("Song Artist", ["Song Artist"], providers, -1)
+        finally:
+            for provider in providers:
+                await provider.close()
+
+    return asyncio.run(run())
+
+
+def test_provider_that_cannot_parse_its_response_counts_as_no_result():
+    song: Song = Song(song_name="Song", artists="Artist", album_art=None, album_name="Album")
+    broken: FakeProvider = FakeProvider(error=KeyError("picture_full"), priority=1)
+    working: FakeProvider = FakeProvider(song, similarity=0.6, delay=0.01)
+
+    assert race([broken, working]) == [(0.6, 0, song)]
+
+
+def test_slower_provider_is_cancelled_once_a_match_is_good_enough():
+    song: Song = Song(song_name="Song", artists="Artist", album_art=None, album_name="Album")
+    slow: FakeProvider = FakeProvider(song, similarity=0.5, delay=5)
+
+    assert race([FakeProvider(song, similarity=0.9), slow]) == [(0.9, 0, song)]
+    assert slow.cancelled
@@ -0,0 +1,40 @@
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+from utils.workspace import OWNER_FILE, WorkspaceManager
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+
+    return process.pid
+
+
+def test_only_workspaces_of_exited_processes_are_orphans(tmp_path: Path):
+    manager: WorkspaceManager = WorkspaceManager(tmp_path)
+    own = manager.acquire()
+
+    crashed: Path = tmp_path / "crashed"
+    crashed.mkdir()
+    (crashed / OWNER_FILE).write_text(f"{socket.gethostname()} {dead_pid()}")
+
+    # Another server sharing the root is still running, or lives on another machine
+    running: Path = tmp_path / "running"
+    running.mkdir()
+    (running / OWNER_FILE).write_text(f"{socket.gethostname()} {os.getppid()}")
+    remote: Path = tmp_path / "remote"
+    remote.mkdir()
+    (remote / OWNER_FILE).write_text(f"{socket.gethostname()}-other {dead_pid()}")
+
+    # Being created right now, the marker is not written yet
+    (tmp_path / "unmarked").mkdir()
+
+    assert manager.remove_orphans() == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([own.name, "remote", "running", "unmarked"])
+
+    manager.release(own)
+    assert not own.path.exists()
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+import fetchvids
+from api.youtube import YOUTUBE
+from tests.youtube_stub import YouTubeStub
+from utils.database import DatabaseHandler
+from utils.video_ids import video_url
+
+VIDEO_IDS: List[str] = [f"video{index:06d}" for index in range(120)]
+
+
+def check(stub: YouTubeStub, video_ids: List[str], runs: int = 1) -> Dict[str, Optional[bool]]:
+    async def run() -> Dict[str, Optional[bool]]:
+        runner: web.AppRunner = await stub.start()
+        youtube: YOUTUBE = YOUTUBE("stub-key", videos_url=stub.url(runner))
+        try:
+            health: Dict[str, Optional[bool]] = {}
+            for _ in range(runs):
+                health = await youtube.check(video_ids)
+
+            return health
+        finally:
+            await youtube.close()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_ids_are_checked_in_batches_of_50():
+    stub: YouTubeStub = YouTubeStub(set(VIDEO_IDS[::2]), latency=0)
+
+    health: Dict[str, Optional[bool]] = check(stub, VIDEO_IDS + VIDEO_IDS[:10])
+
+    assert sorted(len(batch) for batch in stub.batches) == [20, 50, 50]
+    assert sorted(video_id for batch in stub.batches for video_id in batch) == VIDEO_IDS
+    assert health == {video_id: index % 2 == 0 for index, video_id in enumerate(VIDEO_IDS)}
+
+
+def test_known_health_is_served_from_the_cache():
+    stub: YouTubeStub = YouTubeStub(set(VIDEO_IDS), latency=0)
+
+    check(stub, VIDEO_IDS, runs=2)
+
+    assert stub.requests == 3
+
+
+def test_failed_batch_leaves_health_unknown():
+    stub: YouTubeStub = YouTubeStub(set(VIDEO_IDS), latency=0)
+
+    async def run() -> Dict[str, Optional[bool]]:
+        runner: web.AppRunner = await stub.start()
+        youtube: YOUTUBE = YOUTUBE(None, videos_url=stub.url(runner).replace("/videos", "/missing"))
+        try:
+            return await youtube.check(VIDEO_IDS[:5])
+        finally:
+            await youtube.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == {video_id: None for video_id in VIDEO_IDS[:5]}
+
+
+def test_select_vids_checks_every_candidate(monkeypatch, database: DatabaseHandler):
+    # Every third video is gone, the first one is already downloaded and the second one blacklisted
+    stub: YouTubeStub = YouTubeStub({video_id for index, video_id in enumerate(VIDEO_IDS) if index % 3 != 2},
+                                    latency=0)
+    urls: List[str] = [video_url(video_id) for video_id in VIDEO_IDS[:12]]
+    database.add_many_to_downloaded([urls[0]], ["Downloaded"])
+    database.add_many_to_blacklist([urls[1]])
+
+    async def run() -> Tuple[List[str], List[str]]:
+        runner: web.AppRunner = await stub.start()
+        monkeypatch.setenv("YOUTUBE_KEY", "stub-key")
+        monkeypatch.setenv("YOUTUBE_VIDEOS_URL", stub.url(runner))
+        try:
+            # select_vids runs its own event loop
+            return await asyncio.get_event_loop().run_in_executor(None, fetchvids.select_vids, urls, database, 3)
+        finally:
+            await runner.cleanup()
+
+    download_urls, to_blacklist = asyncio.run(run())
+
+    assert download_urls == [urls[3], urls[4], urls[6]]
+    # Unavailable videos past the limit are blacklisted as well
+    assert to_blacklist == [urls[2], urls[5], urls[8], urls[11]]
+    assert stub.batches == [[video_id for video_id in VIDEO_IDS[2:12]]]
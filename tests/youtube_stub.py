@@ -0,0 +1,48 @@
+import asyncio
+from typing import List, Set
+
+from aiohttp import web
+
+from api.youtube import YOUTUBE
+
+VIDEOS_PATH = "/youtube/v3/videos"
+
+
+class YouTubeStub:
+    # Answers like youtube/v3/videos: every id that exists is returned as an item, the others are left out
+    def __init__(self, available_ids: Set[str], latency: float = 0.05):
+        self.available_ids = available_ids
+        self.latency = latency
+        self.requests = 0
+        self.batches: List[List[str]] = []
+
+    async def videos(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+        if request.query.get("key") is None:
+            return web.json_response({"error": {"code": 403, "message": "missing key"}}, status=403)
+
+        video_ids: List[str] = request.query.get("id", "").split(",")
+        self.batches.append(video_ids)
+        if len(video_ids) > YOUTUBE.MAX_BATCH_SIZE:
+            return web.json_response({"error": {"code": 400, "message": "too many ids"}}, status=400)
+
+        return web.json_response({
+            "kind": "youtube#videoListResponse",
+            "items": [{"kind": "youtube#video", "id": video_id} for video_id in video_ids
+                      if video_id in self.available_ids]
+        })
+
+    async def start(self, port: int = 0) -> web.AppRunner:
+        app: web.Application = web.Application()
+        app.router.add_get(VIDEOS_PATH, self.videos)
+        runner: web.AppRunner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+        return runner
+
+    @staticmethod
+    def url(runner: web.AppRunner) -> str:
+        return f"http://127.0.0.1:{runner.addresses[0][1]}{VIDEOS_PATH}"
@@ -37,24 +37,30 @@ else:
         print(s)
 
 
-def aidmatch(filename, API_KEY):
+# Errors are reported and re-raised so that a single file never takes the whole batch down
+def fingerprint(filename):
     try:
-        results = acoustid.match(API_KEY, filename)
+        return acoustid.fingerprint_file(filename)
     except acoustid.NoBackendError:
         print("chromaprint library/tool not found", file=sys.stderr)
-        sys.exit(1)
+        raise
     except acoustid.FingerprintGenerationError:
         print("fingerprint could not be calculated", file=sys.stderr)
-        sys.exit(1)
+        raise
+
+
+def lookup(fp, duration, API_KEY):
+    try:
+        results = acoustid.parse_lookup_result(acoustid.lookup(API_KEY, fp, duration))
+        return [{'score': s, 'rid': r, 'title': t, 'artist': a} for s, r, t, a in results]
     except acoustid.WebServiceError as exc:
         print("web service request failed:", exc.message, file=sys.stderr)
-        sys.exit(1)
+        raise
+
 
-    first = True
-    x = []
-    for s, r, t, a in results:
-        x.append({'score':s, 'rid':r, 'title':t, 'artist':a})
-    return x
+def aidmatch(filename, API_KEY):
+    duration, fp = fingerprint(filename)
+    return lookup(fp, duration, API_KEY)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import io
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from aiohttp import ClientSession, TCPConnector, client_exceptions
+from pydantic import BaseModel
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class AlbumArt(BaseModel):
+    data: bytes
+    mime_type: str
+
+
+def shrink(art: AlbumArt, max_dimension: int) -> AlbumArt:
+    if Image is None:
+        return art
+
+    try:
+        image = Image.open(io.BytesIO(art.data))
+        if max(image.size) <= max_dimension:
+            return art
+
+        image.thumbnail((max_dimension, max_dimension))
+        encoded = io.BytesIO()
+        image.convert("RGB").save(encoded, format="JPEG", quality=90, optimize=True)
+    except (OSError, ValueError) as exception:
+        print(f"Could not resize album art: {exception}")
+        return art
+
+    # Re-encoding can make an already well compressed image bigger
+    if encoded.tell() >= len(art.data):
+        return art
+
+    return AlbumArt(data=encoded.getvalue(), mime_type="image/jpeg")
+
+
+class ArtCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_dimension: Optional[int] = None,
+                 max_concurrency: int = 4):
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self.max_concurrency = max_concurrency
+        self.session: Optional[ClientSession] = None
+        # Several urls can serve the same picture, it is only kept once
+        self.digests: Dict[str, str] = {}
+        self.images: "OrderedDict[str, AlbumArt]" = OrderedDict()
+        self.size = 0
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def open(self) -> ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(connector=TCPConnector(limit_per_host=self.max_concurrency))
+
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self, url: str) -> Optional[AlbumArt]:
+        session: ClientSession = await self.open()
+
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    print(f"Error: Could not request url. State Code {response.status}")
+                    return None
+
+                data: bytes = await response.read()
+                mime_type: str = response.content_type if response.content_type.startswith("image/") \
+                    else "image/jpeg"
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as exception:
+            print(f"Could not download album art {url}: {exception}")
+            return None
+
+        art: AlbumArt = AlbumArt(data=data, mime_type=mime_type)
+        if self.max_dimension is not None:
+            art = await asyncio.get_event_loop().run_in_executor(None, shrink, art, self.max_dimension)
+
+        return art
+
+    def lookup(self, url: str) -> Optional[AlbumArt]:
+        digest: Optional[str] = self.digests.get(url)
+        if digest is None or digest not in self.images:
+            return None
+
+        self.images.move_to_end(digest)
+        return self.images[digest]
+
+    def store(self, url: str, art: AlbumArt):
+        digest: str = hashlib.blake2b(art.data, digest_size=16).hexdigest()
+        self.digests[url] = digest
+
+        if digest in self.images:
+            self.images.move_to_end(digest)
+            return
+
+        if len(art.data) > self.max_bytes:
+            return
+
+        self.images[digest] = art
+        self.size += len(art.data)
+
+        # Least recently used pictures make room for new ones
+        while self.size > self.max_bytes:
+            _, evicted = self.images.popitem(last=False)
+            self.size -= len(evicted.data)
+
+    async def get(self, url: str) -> Optional[AlbumArt]:
+        cached_art: Optional[AlbumArt] = self.lookup(url)
+        if cached_art is not None:
+            self.hits += 1
+            return cached_art
+
+        # Tracks of the same album are tagged at the same time, they wait for one download
+        if url in self.in_flight:
+            self.hits += 1
+            return await asyncio.shield(self.in_flight[url])
+
+        self.misses += 1
+        future: asyncio.Future = asyncio.get_event_loop().create_future()
+        self.in_flight[url] = future
+
+        art: Optional[AlbumArt] = None
+        try:
+            art = await self.fetch(url)
+            if art is not None:
+                self.store(url, art)
+        finally:
+            del self.in_flight[url]
+            future.set_result(art)
+
+        return art
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'images': len(self.images),
+            'bytes': self.size
+        }
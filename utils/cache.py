@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from os import getenv
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import CacheOptions
+
+# Credentials never change the response, so they are not part of the key
+IGNORED_PARAMETERS = frozenset(["access_token", "key"])
+
+SCHEMA_VERSION = 2
+ACCESS_FLUSH_SIZE = 100
+
+
+def normalize_url(url: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    path: str = urllib.parse.quote(urllib.parse.unquote(parts.path))
+    parameters: List[Tuple[str, str]] = sorted(
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if key not in IGNORED_PARAMETERS
+    )
+
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path,
+                                    urllib.parse.urlencode(parameters), ''))
+
+
+class ResponseCache:
+    def __init__(self, options: CacheOptions):
+        self.options = options
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.pid: Optional[int] = None
+        # Access times of hits are written together instead of committing on every get
+        self.accessed: Dict[str, float] = {}
+        self.unflushed_hits = 0
+
+    def connect(self) -> sqlite3.Connection:
+        # A connection must not be shared with forked worker processes
+        if self.connection is None or self.pid != os.getpid():
+            path: Path = Path(self.options.path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # Older caches stored the value in front of the small columns, starting over is cheaper
+                self.connection.execute("DROP TABLE IF EXISTS responses")
+                self.connection.execute("DROP TABLE IF EXISTS meta")
+
+            # The value goes last, so reading the size or the expiry never touches its overflow pages
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, size INTEGER, "
+                                    "expires REAL, accessed REAL, value TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('total_size', "
+                                    "(SELECT COALESCE(SUM(size), 0) FROM responses))")
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.connection.commit()
+            self.pid = os.getpid()
+
+        return self.connection
+
+    def get(self, url: str) -> Optional[Any]:
+        key: str = normalize_url(url)
+        now: float = time.time()
+
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None or row[1] < now:
+                if row is not None:
+                    self.remove(connection, "key = ?", (key,))
+                    connection.commit()
+
+                self.misses += 1
+                return None
+
+            self.accessed[key] = now
+            self.unflushed_hits += 1
+            if self.unflushed_hits >= ACCESS_FLUSH_SIZE:
+                self.flush_accessed(connection)
+                connection.commit()
+
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def set(self, url: str, value: Any, ttl: int):
+        self.set_many([(url, value)], ttl)
+
+    def set_many(self, items: List[Tuple[str, Any]], ttl: int):
+        rows: List[Tuple[str, str]] = [(normalize_url(url), json.dumps(value)) for url, value in items]
+        now: float = time.time()
+
+        with self.lock:
+            connection = self.connect()
+            # Pending hits go out with the commit this write needs anyway
+            self.flush_accessed(connection)
+            for key, serialized in rows:
+                self.remove(connection, "key = ?", (key,))
+                connection.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)",
+                                   (key, len(serialized), now + ttl, now, serialized))
+
+            connection.execute("UPDATE meta SET value = value + ? WHERE name = 'total_size'",
+                               (sum(len(serialized) for _, serialized in rows),))
+
+            # The running total is a single row, the table itself is only scanned when it is over budget
+            if self.total_size(connection) > self.options.max_bytes:
+                self.evict(connection)
+
+            connection.commit()
+
+    @staticmethod
+    def total_size(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    @staticmethod
+    def remove(connection: sqlite3.Connection, condition: str, parameters: Tuple[Any, ...]):
+        freed: int = connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM responses WHERE {condition}",
+                                        parameters).fetchone()[0]
+        if freed == 0:
+            return
+
+        connection.execute(f"DELETE FROM responses WHERE {condition}", parameters)
+        connection.execute("UPDATE meta SET value = value - ? WHERE name = 'total_size'", (freed,))
+
+    def flush_accessed(self, connection: sqlite3.Connection):
+        connection.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                               [(accessed, key) for key, accessed in self.accessed.items()])
+        self.accessed = {}
+        self.unflushed_hits = 0
+
+    def evict(self, connection: sqlite3.Connection):
+        self.remove(connection, "expires < ?", (time.time(),))
+        excess: int = self.total_size(connection) - self.options.max_bytes
+        if excess <= 0:
+            return
+
+        # Drop least recently used entries until the cache fits again
+        self.flush_accessed(connection)
+        evicted: List[Tuple[str]] = []
+        freed: int = 0
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if freed >= excess:
+                break
+
+            evicted.append((key,))
+            freed += size
+
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        connection.execute("UPDATE meta SET value = value - ? WHERE name = 'total_size'", (freed,))
+
+    def clear(self):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("DELETE FROM responses")
+            connection.execute("UPDATE meta SET value = 0 WHERE name = 'total_size'")
+            connection.commit()
+            self.accessed = {}
+            self.unflushed_hits = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global response_cache
+
+    if response_cache is None:
+        overrides: Dict[str, Optional[str]] = {
+            'path': getenv("CACHE_PATH"),
+            'max_bytes': getenv("CACHE_MAX_BYTES"),
+            'search_ttl': getenv("CACHE_SEARCH_TTL"),
+            'detail_ttl': getenv("CACHE_DETAIL_TTL")
+        }
+        options: CacheOptions = CacheOptions(**{key: value for key, value in overrides.items() if value is not None})
+        response_cache = ResponseCache(options)
+
+    return response_cache
@@ -27,4 +27,16 @@ def command_line_parser(arguments: List[str]) -> CommandLineOptions:
     if "progress" in expand_flags_without_duplicates:
         my_options.progress = True
 
+    if "profile-imports" in expand_flags_without_duplicates:
+        my_options.profile_imports = True
+
+    if "incremental" in expand_flags_without_duplicates:
+        my_options.incremental = True
+
+    # Files tagged with less confidence than --retag-below=<threshold> are tagged again
+    for flag in expand_flags_without_duplicates:
+        if flag.startswith("retag-below="):
+            my_options.incremental = True
+            my_options.retag_below = float(flag.split("=", 1)[1])
+
     return my_options
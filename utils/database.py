@@ -1,12 +1,35 @@
-from typing import List, Dict, Optional
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Set, Tuple
 
 import pymongo
-from pymongo import database
+import pymongo.errors
+from pymongo import UpdateOne, database
 from pymongo.collection import Collection
+from pymongo.results import BulkWriteResult
 
 from models import DatabaseOptions
-from utils.text_processing import calculate_similarity, clean_string, calculate_tfidf
+from utils.search_index import SearchIndex
+from utils.text_processing import clean_string
+from utils.video_ids import video_id
 from bson.objectid import ObjectId
+from pydantic import BaseModel
+
+search_indexes: Dict[str, SearchIndex] = {}
+indexed_databases: Set[str] = set()
+
+BACKFILL_MIGRATION = "video_id_and_name_key"
+
+
+def name_key(name: str) -> str:
+    return clean_string(name).strip()
+
+
+class RenameReport(BaseModel):
+    renamed: List[Tuple[str, str]] = []
+    unmatched: List[Tuple[str, str]] = []
 
 
 class DatabaseHandler:
@@ -23,38 +46,70 @@ class DatabaseHandler:
         self.download_collection = self.database["downloaded"]
         self.blacklist_collection = self.database["blacklist"]
         self.playlist_collection = self.database["playlists"]
+        self.ensure_indexes()
 
-    @staticmethod
-    def search_collection_by_name(name: str, collection: Collection):
-        downloaded_songs: List[Dict[str, str]] = list(collection.find({}))
-        song_names = [(index, song["new_name"]) for index, song in enumerate(downloaded_songs) if song.get("new_name") is not None]
-        song_old_names = [(index, song["name"]) for index, song in enumerate(downloaded_songs)]
-
-        results = calculate_tfidf(name, song_names)
-        filtered_results = {index: result for index, result in enumerate(results) if result > 0.5}
-        old_results = calculate_tfidf(name, song_old_names)
-        filtered_old_results = {index: result for index, result in enumerate(old_results) if result > 0.5}
-        combined_results = set(list(filtered_old_results.keys()) + list(filtered_results.keys()))
-        search_result: List[Dict[str, Optional[str]]] = []
-
-        for index, song in enumerate(downloaded_songs):
-            if index in combined_results:
-                similarity = max(filtered_results.get(index, 0), filtered_old_results.get(index, 0))
-            elif song.get("new_name") is not None:
-                similarity = max(calculate_similarity(name, song["new_name"]), calculate_similarity(name, song['name']))
-            else:
-                similarity = calculate_similarity(name, song['name'])
-
-            if similarity >= 0.5:
-                search_result.append({
-                    'name': song['name'],
-                    'url': song['url'],
-                    'new_name': song.get('new_name'),
-                    'similarity': similarity,
-                    'id': str(song['_id'])
-                })
+    def ensure_indexes(self):
+        # A handler is created for every job, the indexes only need to be looked at once per process
+        if self.database.name in indexed_databases:
+            return
 
-        return search_result
+        for collection in (self.download_collection, self.blacklist_collection, self.playlist_collection):
+            try:
+                collection.create_index('url', unique=True)
+            except pymongo.errors.OperationFailure as exception:
+                # Older databases can hold the same url twice, lookups still get an index
+                print(f"{collection.name} has duplicate urls, its url index is not unique: {exception}")
+                collection.create_index('url')
+
+        # The backfill scans can not use an index, they run once per database and are remembered there
+        migrations: Collection = self.database["migrations"]
+        if migrations.find_one({'_id': BACKFILL_MIGRATION}) is None:
+            self.backfill()
+            migrations.update_one({'_id': BACKFILL_MIGRATION}, {'$set': {'done': True}}, upsert=True)
+
+        for collection in (self.download_collection, self.blacklist_collection):
+            collection.create_index('video_id', unique=True, sparse=True)
+
+        self.download_collection.create_index('name_key')
+        indexed_databases.add(self.database.name)
+
+    def backfill(self):
+        for collection in (self.download_collection, self.blacklist_collection):
+            # Documents written before video ids existed get theirs now, duplicates of an id are left without one
+            missing_elements: List[Dict[str, Any]] = list(collection.find({'video_id': {'$exists': False}}, {'url': 1}))
+
+            if len(missing_elements) > 0:
+                known_ids: Set[str] = set(element['video_id'] for element in
+                                          collection.find({'video_id': {'$exists': True}}, {'video_id': 1, '_id': 0}))
+
+                for element in missing_elements:
+                    element_video_id: str = video_id(element['url'])
+                    if element_video_id in known_ids:
+                        continue
+
+                    collection.update_one({'_id': element['_id']}, {'$set': {'video_id': element_video_id}})
+                    known_ids.add(element_video_id)
+
+        # Renames look songs up by their cleaned name
+        unkeyed_downloads: List[Dict[str, Any]] = list(self.download_collection.find(
+            {'name': {'$exists': True}, 'name_key': {'$exists': False}}, {'name': 1}))
+        if len(unkeyed_downloads) > 0:
+            self.download_collection.bulk_write([
+                UpdateOne({'_id': download['_id']}, {'$set': {'name_key': name_key(download['name'])}})
+                for download in unkeyed_downloads
+            ], ordered=False)
+
+    def get_search_index(self, collection: Collection) -> SearchIndex:
+        # Indexes are shared by every handler of the process, they are built on the first search
+        if collection.full_name not in search_indexes:
+            search_indexes[collection.full_name] = SearchIndex(
+                lambda: collection.find({'name': {'$exists': True}}, {'name': 1, 'url': 1, 'new_name': 1}))
+
+        return search_indexes[collection.full_name]
+
+    def search_collection_by_name(self, name: str, collection: Collection, limit: int = 20) \
+            -> List[Dict[str, Any]]:
+        return self.get_search_index(collection).search(name, limit)
 
     def get_download_by_id(self, oid: str):
         return self.download_collection.find_one({"_id": ObjectId(oid)})
@@ -62,95 +117,154 @@ class DatabaseHandler:
     def delete_from_downloaded(self, oid: str):
         self.download_collection.delete_one({"_id": ObjectId(oid)})
 
-    @staticmethod
-    def check_if_url_exists(url: str, collection: Collection) -> bool:
-        cursor: pymongo.cursor = collection.find({
-            'url': url
-        })
+        if self.download_collection.full_name in search_indexes:
+            search_indexes[self.download_collection.full_name].remove(oid)
 
-        documents: List[Dict[str, str]] = list(cursor)
+    def delete_all_downloaded(self):
+        self.download_collection.delete_many({})
 
-        return not (len(documents) < 1)
+        if self.download_collection.full_name in search_indexes:
+            search_indexes[self.download_collection.full_name].clear()
 
-    def add_to_blacklist(self, url: str):
-        if self.check_if_url_exists(url, self.blacklist_collection):
-            return
+    @staticmethod
+    def check_if_url_exists(url: str, collection: Collection) -> bool:
+        return collection.find_one({'url': url}, {'_id': 1}) is not None
 
-        self.blacklist_collection.insert_one({
-            'url': url
-        })
+    def add_to_blacklist(self, url: str) -> Optional[ObjectId]:
+        # Upserts make the existence check and the insert one round trip
+        return self.blacklist_collection.update_one({'video_id': video_id(url)}, {'$setOnInsert': {'url': url}},
+                                                    upsert=True).upserted_id
 
-    def add_to_playlists(self, url: str):
-        if self.check_if_url_exists(url, self.playlist_collection):
-            return
+    def add_to_playlists(self, url: str) -> Optional[ObjectId]:
+        return self.playlist_collection.update_one({'url': url}, {'$setOnInsert': {'url': url}},
+                                                   upsert=True).upserted_id
 
-        self.playlist_collection.insert_one({
-            'url': url
-        })
+    @staticmethod
+    def find_video_ids(video_ids: List[str], collection: Collection) -> Set[str]:
+        return set(element['video_id'] for element in
+                   collection.find({'video_id': {'$in': video_ids}}, {'video_id': 1, '_id': 0}))
 
     def add_many_to_blacklist(self, urls: List[str]):
-        urls_not_added_yet: List[str] = []
-
-        for url in urls:
-            if not self.check_if_url_exists(url, self.blacklist_collection):
-                urls_not_added_yet.append(url)
+        # Several urls can point at the same video, only one document per video is kept
+        urls_by_id: Dict[str, str] = {video_id(url): url for url in urls}
 
-        if len(urls_not_added_yet) < 1:
+        if len(urls_by_id) < 1:
             return
 
-        self.blacklist_collection.insert_many([
-            {"url": url} for url in urls_not_added_yet
-        ])
+        self.blacklist_collection.bulk_write([
+            UpdateOne({'video_id': url_video_id}, {'$setOnInsert': {'url': url}}, upsert=True)
+            for url_video_id, url in urls_by_id.items()
+        ], ordered=False)
 
     def add_many_to_downloaded(self, urls: List[str], names: List[str]):
-        urls_not_added_yet: List[str] = []
+        names_by_id: Dict[str, Tuple[str, str]] = {video_id(url): (url, name) for url, name in zip(urls, names)}
 
-        for url in urls:
-            if not self.check_if_url_exists(url, self.download_collection):
-                urls_not_added_yet.append(url)
+        if len(names_by_id) < 1:
+            return
 
-        self.download_collection.insert_many([
+        documents: List[Dict[str, Any]] = [
 
             {
                 'url': url,
-                'name': name
+                'video_id': url_video_id,
+                'name': name,
+                'name_key': name_key(name)
             }
 
-            for url, name in zip(urls, names)
-        ])
+            for url_video_id, (url, name) in names_by_id.items()
+        ]
+        result: BulkWriteResult = self.download_collection.bulk_write([
+            UpdateOne({'video_id': document['video_id']}, {'$setOnInsert': document}, upsert=True)
+            for document in documents
+        ], ordered=False)
+
+        # Only newly inserted documents get an _id back, videos that were already downloaded are left alone
+        if self.download_collection.full_name in search_indexes:
+            for index, document_id in result.upserted_ids.items():
+                search_indexes[self.download_collection.full_name].add({**documents[index], '_id': document_id})
+
+    def rename_downloaded(self, renames: List[Tuple[str, str]]) -> RenameReport:
+        new_names_by_key: Dict[str, Tuple[str, str]] = {name_key(old_name): (old_name, new_name)
+                                                        for old_name, new_name in renames}
+        report: RenameReport = RenameReport()
+
+        if len(new_names_by_key) < 1:
+            return report
+
+        ids_by_key: Dict[str, ObjectId] = {}
+        for download in self.download_collection.find({'name_key': {'$in': list(new_names_by_key)}},
+                                                      {'name_key': 1}):
+            ids_by_key.setdefault(download['name_key'], download['_id'])
+
+        for old_name_key, (old_name, new_name) in new_names_by_key.items():
+            if old_name_key in ids_by_key:
+                report.renamed.append((old_name, new_name))
+            else:
+                report.unmatched.append((old_name, new_name))
 
-    def update_downloaded(self, old_name: str, new_name: str):
-        downloads = self.download_collection.find({})
-        for download in downloads:
-            if clean_string(old_name) == clean_string(download['name']):
-                result = self.download_collection.find_one_and_update({'_id': download['_id']}, {'$set': {'new_name': new_name}})
+        if len(report.renamed) < 1:
+            return report
 
-                if result is not None:
-                    return
+        # Every rename of a tagging run is applied in one round trip
+        self.download_collection.bulk_write([
+            UpdateOne({'_id': ids_by_key[name_key(old_name)]}, {'$set': {'new_name': new_name}})
+            for old_name, new_name in report.renamed
+        ], ordered=False)
 
-        print("Trying to update something that doesn't exist")
+        if self.download_collection.full_name in search_indexes:
+            for old_name, new_name in report.renamed:
+                search_indexes[self.download_collection.full_name].rename(str(ids_by_key[name_key(old_name)]),
+                                                                          new_name)
 
-    def remove_from_blacklist_with_url(self, url: str):
-        if not self.check_if_url_exists(url, self.blacklist_collection):
-            return
+        return report
 
-        self.blacklist_collection.delete_many({
-            'url': url
-        })
+    def update_downloaded(self, old_name: str, new_name: str) -> bool:
+        return len(self.rename_downloaded([(old_name, new_name)]).renamed) > 0
 
-    def remove_from_playlists_with_url(self, url: str):
-        if not self.check_if_url_exists(url, self.playlist_collection):
-            return
+    def remove_from_blacklist_with_url(self, url: str) -> Optional[int]:
+        deleted_count: int = self.blacklist_collection.delete_many({
+            '$or': [{'url': url}, {'video_id': video_id(url)}]
+        }).deleted_count
+
+        return deleted_count if deleted_count > 0 else None
 
-        self.playlist_collection.delete_many({
+    def remove_from_playlists_with_url(self, url: str) -> Optional[int]:
+        deleted_count: int = self.playlist_collection.delete_many({
             'url': url
-        })
+        }).deleted_count
+
+        return deleted_count if deleted_count > 0 else None
 
     def get_all_blacklist_urls(self) -> List[str]:
-        return [element['url'] for element in self.blacklist_collection.find({})]
+        return [element['url'] for element in self.blacklist_collection.find({}, {'url': 1, '_id': 0})]
 
     def get_all_downloaded_urls(self) -> List[str]:
-        return [element['url'] for element in self.download_collection.find({})]
+        return [element['url'] for element in self.download_collection.find({}, {'url': 1, '_id': 0})]
 
     def get_all_playlist_urls(self) -> List[str]:
-        return [element['url'] for element in self.playlist_collection.find({})]
+        return [element['url'] for element in self.playlist_collection.find({}, {'url': 1, '_id': 0})]
+
+    def get_playlist_last_seen(self, url: str) -> Set[str]:
+        playlist: Optional[Dict[str, Any]] = self.playlist_collection.find_one({'url': url}, {'last_seen': 1})
+        return set(playlist.get('last_seen', [])) if playlist is not None else set()
+
+    def set_playlist_last_seen(self, url: str, video_ids: Set[str]):
+        self.playlist_collection.update_one({'url': url}, {'$set': {'last_seen': sorted(video_ids)}})
+
+
+class AsyncDatabaseHandler:
+    # The calls of DatabaseHandler as coroutines, pymongo runs on a thread pool the way motor does it
+    def __init__(self, handler: DatabaseHandler, workers: int = 8):
+        self.handler = handler
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers)
+
+    def __getattr__(self, attribute: str) -> Any:
+        handler_attribute: Any = getattr(self.handler, attribute)
+        if not inspect.ismethod(handler_attribute) and not inspect.isfunction(handler_attribute):
+            return handler_attribute
+
+        async def run_in_executor(*args: Any, **kwargs: Any) -> Any:
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, functools.partial(handler_attribute, *args, **kwargs))
+
+        return run_in_executor
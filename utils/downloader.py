@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+import shutil
+from asyncio.subprocess import PIPE
+from multiprocessing import cpu_count
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from utils.video_ids import video_id
+
+DOWNLOAD_SCRIPT = "scripts/download_vid.sh"
+
+
+class DownloadResult(BaseModel):
+    url: str
+    id: str
+    title: Optional[str] = None
+    path: Optional[Path] = None
+    duration: Optional[float] = None
+    bytes: int = 0
+    error: Optional[str] = None
+
+
+def parse_info(output: str) -> Dict[str, Any]:
+    for line in output.splitlines():
+        try:
+            return json.loads(line)
+        except json.decoder.JSONDecodeError:
+            continue
+
+    return {}
+
+
+class Downloader:
+    def __init__(self, workers: int = cpu_count()):
+        # Every download transcodes in its own ffmpeg process, so this is also how many cores transcoding can use
+        self.workers = workers
+
+    async def download(self, url: str, download_path: Path) -> DownloadResult:
+        result: DownloadResult = DownloadResult(url=url, id=video_id(url))
+
+        # Every video gets its own directory so concurrent downloads can tell their files apart
+        song_directory: Path = download_path / result.id
+        os.makedirs(str(song_directory), exist_ok=True)
+
+        try:
+            download = await asyncio.create_subprocess_exec("sh", DOWNLOAD_SCRIPT, url,
+                                                            str(song_directory.absolute()) + "/%(title)s.%(ext)s",
+                                                            stdout=PIPE, stderr=PIPE)
+            stdout, stderr = await download.communicate()
+        except OSError as exception:
+            result.error = str(exception)
+            shutil.rmtree(str(song_directory), ignore_errors=True)
+            return result
+
+        info: Dict[str, Any] = parse_info(stdout.decode("utf-8", errors="replace"))
+        result.id = info.get("id", result.id)
+        result.title = info.get("title")
+        result.duration = info.get("duration")
+
+        downloaded_files: List[Path] = sorted(song_directory.glob("*.mp3"))
+        if download.returncode == 0 and len(downloaded_files) > 0:
+            result.path = downloaded_files[0]
+            result.bytes = result.path.stat().st_size
+            return result
+
+        error_lines: List[str] = [line for line in stderr.decode("utf-8", errors="replace").splitlines()
+                                  if len(line.strip()) > 0]
+        result.error = error_lines[-1] if len(error_lines) > 0 else f"youtube-dl exited with {download.returncode}"
+        shutil.rmtree(str(song_directory), ignore_errors=True)
+
+        return result
+
+    async def download_many(self, url_list: List[str], download_path: Path) -> List[DownloadResult]:
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(self.workers)
+
+        async def limited_download(url: str) -> DownloadResult:
+            async with semaphore:
+                return await self.download(url, download_path)
+
+        return list(await asyncio.gather(*[limited_download(url) for url in url_list]))
@@ -0,0 +1,254 @@
+import hashlib
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from pydantic import BaseModel
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+ProgressCallback = Callable[[int], None]
+
+
+class DriveFile(BaseModel):
+    id: str
+    title: str
+    md5: Optional[str] = None
+
+
+class UploadResult(BaseModel):
+    title: str
+    file_id: Optional[str] = None
+    bytes: int = 0
+    seconds: float = 0
+    skipped: bool = False
+    error: Optional[str] = None
+
+
+class UploadSession:
+    # One resumable upload, the backend keeps whatever it needs to carry on from the acknowledged offset
+    def __init__(self, path: Path, parent_id: str, request: Any = None):
+        self.path = path
+        self.parent_id = parent_id
+        self.request = request
+        self.uploaded = 0
+        self.file_id: Optional[str] = None
+
+
+def file_md5(path: Path) -> str:
+    digest = hashlib.md5()
+    with open(str(path), "rb") as local_file:
+        for chunk in iter(lambda: local_file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class DriveBackend(ABC):
+    @abstractmethod
+    def list_folder(self, parent_id: str) -> List[DriveFile]:
+        pass
+
+    @abstractmethod
+    def start_upload(self, path: Path, parent_id: str) -> UploadSession:
+        pass
+
+    @abstractmethod
+    def upload_chunk(self, session: UploadSession):
+        pass
+
+    @abstractmethod
+    def trash(self, file_id: str):
+        pass
+
+
+class PyDriveBackend(DriveBackend):
+    def __init__(self, gauth: Any, drive: Any, chunk_size: int = CHUNK_SIZE):
+        self.gauth = gauth
+        self.drive = drive
+        self.chunk_size = chunk_size
+        self.local = threading.local()
+
+    def http(self) -> Any:
+        # httplib2 connections are not thread safe, every upload thread gets its own
+        if getattr(self.local, "http", None) is None:
+            self.local.http = self.gauth.Get_Http_Object()
+
+        return self.local.http
+
+    def list_folder(self, parent_id: str) -> List[DriveFile]:
+        file_list = self.drive.ListFile({
+            'q': f"'{parent_id}' in parents and trashed=false"
+        }).GetList()
+
+        return [DriveFile(id=file['id'], title=file['title'], md5=file.get('md5Checksum')) for file in file_list]
+
+    def start_upload(self, path: Path, parent_id: str) -> UploadSession:
+        from googleapiclient.http import MediaFileUpload
+
+        media = MediaFileUpload(str(path.absolute()), mimetype="audio/mpeg", chunksize=self.chunk_size,
+                                resumable=True)
+        request = self.gauth.service.files().insert(body={
+            'title': path.name,
+            'parents': [{
+                'kind': 'drive#childList',
+                'id': parent_id
+            }]
+        }, media_body=media)
+
+        return UploadSession(path, parent_id, request)
+
+    def upload_chunk(self, session: UploadSession):
+        # After a failure the same request first asks the server how much it kept and continues from there
+        status, response = session.request.next_chunk(http=self.http())
+        if status is not None:
+            session.uploaded = status.resumable_progress
+
+        if response is not None:
+            session.uploaded = session.path.stat().st_size
+            session.file_id = response['id']
+
+    def trash(self, file_id: str):
+        self.gauth.service.files().trash(fileId=file_id).execute(http=self.http())
+
+
+class FakeDriveBackend(DriveBackend):
+    # Keeps "Drive" folders in a local directory so that syncing can be exercised offline
+    def __init__(self, root: Path, chunk_size: int = CHUNK_SIZE, fail_chunks: Optional[Set[int]] = None):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.files: Dict[str, DriveFile] = {}
+        self.parents: Dict[str, str] = {}
+        self.trashed: List[str] = []
+        self.list_calls = 0
+        # Calls to upload_chunk, counted from 1, that fail as if the connection dropped
+        self.fail_chunks: Set[int] = fail_chunks if fail_chunks is not None else set()
+        self.chunk_calls = 0
+        self.sent_bytes = 0
+
+    def list_folder(self, parent_id: str) -> List[DriveFile]:
+        with self.lock:
+            self.list_calls += 1
+            return [file for file_id, file in self.files.items() if self.parents[file_id] == parent_id]
+
+    def start_upload(self, path: Path, parent_id: str) -> UploadSession:
+        destination: Path = self.root / parent_id / uuid.uuid4().hex
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.touch()
+
+        return UploadSession(path, parent_id, destination)
+
+    def upload_chunk(self, session: UploadSession):
+        with open(str(session.path), "rb") as source:
+            source.seek(session.uploaded)
+            chunk: bytes = source.read(self.chunk_size)
+
+        with self.lock:
+            self.sent_bytes += len(chunk)
+            self.chunk_calls += 1
+            failing: bool = self.chunk_calls in self.fail_chunks
+
+        if failing:
+            # The chunk was sent but never acknowledged, the server keeps what it had before
+            raise ConnectionError(f"chunk {self.chunk_calls} was interrupted")
+
+        with open(str(session.request), "r+b") as target:
+            target.seek(session.uploaded)
+            target.write(chunk)
+        session.uploaded += len(chunk)
+
+        if session.uploaded < session.path.stat().st_size:
+            return
+
+        file_id: str = session.request.name
+        with self.lock:
+            self.files[file_id] = DriveFile(id=file_id, title=session.path.name, md5=file_md5(session.request))
+            self.parents[file_id] = session.parent_id
+
+        session.file_id = file_id
+
+    def trash(self, file_id: str):
+        with self.lock:
+            self.files.pop(file_id)
+            self.trashed.append(file_id)
+            (self.root / self.parents.pop(file_id) / file_id).unlink()
+
+
+class DriveSync:
+    def __init__(self, backend: DriveBackend, workers: int = 4, attempts: int = 5, backoff: float = 1):
+        self.backend = backend
+        self.workers = workers
+        self.attempts = attempts
+        self.backoff = backoff
+        self.index: Dict[str, List[DriveFile]] = {}
+        self.index_lock = threading.Lock()
+
+    def load_index(self, parent_id: str):
+        # The destination is listed once, every later lookup is a dictionary access
+        self.index = {}
+        for file in self.backend.list_folder(parent_id):
+            self.index.setdefault(file.title, []).append(file)
+
+    def upload(self, path: Path, parent_id: str) -> UploadResult:
+        size: int = path.stat().st_size
+        existing_files: List[DriveFile] = self.index.get(path.name, [])
+
+        if any(file.md5 is not None and file.md5 == file_md5(path) for file in existing_files):
+            print(f"{path.name} is already up to date")
+            return UploadResult(title=path.name, bytes=size, skipped=True)
+
+        reported: List[int] = [0]
+
+        def progress(uploaded: int):
+            # Report every quarter of the file
+            if size > 0 and uploaded * 4 // size > reported[0]:
+                reported[0] = uploaded * 4 // size
+                print(f"Uploading {path.name}: {uploaded * 100 // size}%")
+
+        start: float = time.perf_counter()
+        try:
+            session: UploadSession = self.backend.start_upload(path, parent_id)
+
+            # Only the chunk that failed is retried, the session resumes from the acknowledged offset
+            upload_chunk = retry(stop=stop_after_attempt(self.attempts), wait=wait_exponential(multiplier=self.backoff),
+                                 reraise=True)(self.backend.upload_chunk)
+            while session.file_id is None:
+                upload_chunk(session)
+                progress(session.uploaded)
+
+            file_id: str = session.file_id
+
+            # Older copies are only removed once the new one is safely uploaded
+            for file in existing_files:
+                self.backend.trash(file.id)
+        except Exception as exception:
+            print(f"Could not upload {path.name}: {exception}")
+            return UploadResult(title=path.name, error=str(exception))
+
+        seconds: float = time.perf_counter() - start
+        with self.index_lock:
+            self.index[path.name] = [DriveFile(id=file_id, title=path.name)]
+
+        print(f"Uploaded {path.name} ({size / 1024 / 1024:.1f} MB in {seconds:.1f}s)")
+        return UploadResult(title=path.name, file_id=file_id, bytes=size, seconds=seconds)
+
+    def sync_dir(self, directory: Path, parent_id: str) -> List[UploadResult]:
+        self.load_index(parent_id)
+        file_paths: List[Path] = sorted(file for file in directory.iterdir() if file.is_file())
+
+        start: float = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results: List[UploadResult] = list(executor.map(lambda path: self.upload(path, parent_id), file_paths))
+
+        elapsed: float = time.perf_counter() - start
+        uploaded_bytes: int = sum(result.bytes for result in results if not result.skipped and result.error is None)
+        print(f"Synced {len(results)} files in {elapsed:.1f}s "
+              f"({uploaded_bytes / 1024 / 1024 / max(elapsed, 1e-9):.2f} MB/s)")
+
+        return results
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from os import getenv
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+CHUNK_SIZE = 1024 * 1024
+LOOKUP_TTL = 30 * 24 * 60 * 60
+
+
+class FingerprintRecord(BaseModel):
+    content_hash: str
+    duration: float
+    fingerprint: bytes
+    results: Optional[List[Dict[str, Any]]]
+
+
+def audio_bounds(path: Union[str, Path]) -> Tuple[int, int]:
+    # The audio frames sit between an optional ID3v2 header and an optional ID3v1 trailer
+    size: int = os.path.getsize(str(path))
+    start: int = 0
+    end: int = size
+
+    with open(str(path), "rb") as audio_file:
+        header: bytes = audio_file.read(10)
+        if len(header) == 10 and header[:3] == b"ID3":
+            tag_size: int = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            footer_size: int = 10 if header[5] & 0x10 else 0
+            start = min(size, 10 + tag_size + footer_size)
+
+        if end - start >= 128:
+            audio_file.seek(end - 128)
+            if audio_file.read(3) == b"TAG":
+                end -= 128
+
+    return start, end
+
+
+def audio_hash(path: Union[str, Path]) -> str:
+    start, end = audio_bounds(path)
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(str(path), "rb") as audio_file:
+        audio_file.seek(start)
+        remaining: int = end - start
+        while remaining > 0:
+            chunk: bytes = audio_file.read(min(CHUNK_SIZE, remaining))
+            if len(chunk) == 0:
+                break
+
+            digest.update(chunk)
+            remaining -= len(chunk)
+
+    return digest.hexdigest()
+
+
+class FingerprintStore:
+    def __init__(self, path: Union[str, Path], lookup_ttl: int = LOOKUP_TTL):
+        self.path = Path(path)
+        self.lookup_ttl = lookup_ttl
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.pid: Optional[int] = None
+
+    def connect(self) -> sqlite3.Connection:
+        # Fingerprinting runs in worker processes, each of them needs its own connection
+        if self.connection is None or self.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints (content_hash TEXT PRIMARY KEY, "
+                                    "duration REAL, fingerprint BLOB, results TEXT, looked_up REAL)")
+            self.connection.commit()
+            self.pid = os.getpid()
+
+        return self.connection
+
+    def get(self, content_hash: str) -> Optional[FingerprintRecord]:
+        with self.lock:
+            row = self.connect().execute("SELECT duration, fingerprint, results, looked_up FROM fingerprints "
+                                         "WHERE content_hash = ?", (content_hash,)).fetchone()
+
+        if row is None:
+            return None
+
+        duration, fingerprint, results, looked_up = row
+
+        # Lookup results go stale as the AcoustID database grows, the fingerprint itself never does
+        if results is not None and looked_up + self.lookup_ttl < time.time():
+            results = None
+
+        return FingerprintRecord(content_hash=content_hash, duration=duration, fingerprint=fingerprint,
+                                 results=json.loads(results) if results is not None else None)
+
+    def set(self, record: FingerprintRecord):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)",
+                               (record.content_hash, record.duration, record.fingerprint,
+                                json.dumps(record.results) if record.results is not None else None, time.time()))
+            connection.commit()
+
+
+fingerprint_store: Optional[FingerprintStore] = None
+
+
+def get_fingerprint_store() -> FingerprintStore:
+    global fingerprint_store
+
+    if fingerprint_store is None:
+        fingerprint_store = FingerprintStore(getenv("FINGERPRINT_STORE_PATH", ".cache/fingerprints.sqlite"))
+
+    return fingerprint_store
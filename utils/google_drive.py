@@ -4,6 +4,8 @@ from typing import Optional, List
 from pydrive.auth import GoogleAuth
 from pydrive.drive import GoogleDrive
 
+from utils.drive_sync import DriveSync, PyDriveBackend, UploadResult
+
 
 class DriveHandler:
     def __init__(self):
@@ -38,14 +40,11 @@ class DriveHandler:
         file.SetContentFile(str(file_path.absolute()))
         file.Upload()
 
-    def copy_dir(self, directory: Path, parent_id: str):
-        file_paths: List[Path] = []
-        for file in directory.iterdir():
-            if file.is_file():
-                file_paths.append(file)
+    def get_sync(self, workers: int = 4) -> DriveSync:
+        return DriveSync(PyDriveBackend(self.gauth, self.drive), workers=workers)
 
-        for file in file_paths:
-            self.upload_file(file, parent_id)
+    def copy_dir(self, directory: Path, parent_id: str, workers: int = 4) -> List[UploadResult]:
+        return self.get_sync(workers).sync_dir(directory, parent_id)
 
     def delete_file(self, file_name: str, parent_id: str) -> bool:
         search_result = self.search_file(file_name, parent_id)
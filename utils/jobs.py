@@ -0,0 +1,238 @@
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from utils.video_ids import video_id
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+PROGRESS_SAVE_INTERVAL = 1.0
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    url: Optional[str] = None
+    number: Optional[int] = None
+    fcm_token: Optional[str] = None
+    status: str = QUEUED
+    progress: Dict[str, int] = {}
+    result: List[str] = []
+    error: Optional[str] = None
+    created: float
+    updated: float
+
+
+ProgressCallback = Callable[[str], None]
+JobRunner = Callable[[Job, ProgressCallback, threading.Event], List[str]]
+
+
+def job_key(kind: str, url: Optional[str]) -> Tuple[str, Optional[str]]:
+    # Two requests for the same video are the same job, however the url was written
+    return kind, video_id(url) if url is not None else None
+
+
+class JobStore:
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, "
+                                    "created REAL, value TEXT)")
+            self.connection.commit()
+
+        return self.connection
+
+    def save(self, job: Job):
+        job.updated = time.time()
+
+        with self.lock:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)",
+                               (job.id, job.status, job.created, job.json()))
+            connection.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            row = self.connect().execute("SELECT value FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        return Job.parse_raw(row[0]) if row is not None else None
+
+    def list(self, statuses: Optional[Tuple[str, ...]] = None, limit: int = 100) -> List[Job]:
+        with self.lock:
+            if statuses is None:
+                rows = self.connect().execute("SELECT value FROM jobs ORDER BY created DESC LIMIT ?",
+                                              (limit,)).fetchall()
+            else:
+                rows = self.connect().execute(f"SELECT value FROM jobs WHERE status IN "
+                                              f"({', '.join('?' for _ in statuses)}) ORDER BY created DESC LIMIT ?",
+                                              (*statuses, limit)).fetchall()
+
+        return [Job.parse_raw(row[0]) for row in rows]
+
+
+class JobQueue:
+    def __init__(self, store: JobStore, runner: JobRunner, workers: int = 2):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.pending: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.active: Dict[Tuple[str, Optional[str]], Job] = {}
+        self.cancel_events: Dict[str, threading.Event] = {}
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        # Jobs that a previous process accepted but did not finish are run again
+        for job in sorted(self.store.list(ACTIVE_STATES, limit=-1), key=lambda unfinished_job: unfinished_job.created):
+            job.status = QUEUED
+            job.progress = {}
+            self.enqueue(job)
+
+        for _ in range(self.workers):
+            thread: threading.Thread = threading.Thread(target=self.work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def snapshot(self, job: Job) -> Job:
+        # Only called under self.lock, the worker keeps changing the job while others read the copy
+        job.updated = time.time()
+        return job.copy(deep=True)
+
+    def find(self, job_id: str) -> Optional[Job]:
+        # Only called under self.lock
+        for job in self.active.values():
+            if job.id == job_id:
+                return job
+
+        return None
+
+    def enqueue(self, job: Job) -> Job:
+        with self.lock:
+            self.active[job_key(job.kind, job.url)] = job
+            self.cancel_events.setdefault(job.id, threading.Event())
+            snapshot: Job = self.snapshot(job)
+
+        self.store.save(snapshot)
+        self.pending.put(job.id)
+
+        return snapshot
+
+    def submit(self, kind: str, url: Optional[str] = None, number: Optional[int] = None,
+               fcm_token: Optional[str] = None) -> Tuple[Job, bool]:
+        with self.lock:
+            existing_job: Optional[Job] = self.active.get(job_key(kind, url))
+            if existing_job is not None:
+                return existing_job.copy(deep=True), False
+
+            now: float = time.time()
+            job: Job = Job(id=uuid.uuid4().hex, kind=kind, url=url, number=number, fcm_token=fcm_token, created=now,
+                           updated=now)
+            self.active[job_key(kind, url)] = job
+            self.cancel_events[job.id] = threading.Event()
+
+        return self.enqueue(job), True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            job: Optional[Job] = self.find(job_id)
+            if job is not None:
+                return job.copy(deep=True)
+
+        return self.store.get(job_id)
+
+    def running(self) -> List[Job]:
+        with self.lock:
+            return [job.copy(deep=True) for job in self.active.values() if job.status == RUNNING]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        # Queued jobs are skipped, running ones stop taking new songs and finish the ones in flight
+        with self.lock:
+            job: Optional[Job] = self.find(job_id)
+            if job is not None:
+                cancelled: threading.Event = self.cancel_events[job_id]
+                cancelled.set()
+                if job.status != QUEUED:
+                    return job.copy(deep=True)
+
+                job.status = CANCELLED
+                self.active.pop(job_key(job.kind, job.url), None)
+                self.cancel_events.pop(job_id, None)
+                snapshot: Job = self.snapshot(job)
+
+        # Jobs that are no longer active are left as they were stored
+        if job is None:
+            return self.store.get(job_id)
+
+        self.store.save(snapshot)
+
+        return snapshot
+
+    def work(self):
+        while True:
+            job_id: str = self.pending.get()
+
+            # Claimed under the lock so that a job cancelled while queued is never started
+            with self.lock:
+                job: Optional[Job] = self.find(job_id)
+                cancelled: Optional[threading.Event] = self.cancel_events.get(job_id)
+                if job is None or cancelled is None or job.status != QUEUED:
+                    continue
+
+                job.status = RUNNING
+                snapshot: Job = self.snapshot(job)
+
+            self.store.save(snapshot)
+            self.run(job, snapshot, cancelled)
+
+    def run(self, job: Job, snapshot: Job, cancelled: threading.Event):
+        last_save: List[float] = [time.monotonic()]
+
+        def report(stage: str):
+            with self.lock:
+                job.progress[stage] = job.progress.get(stage, 0) + 1
+
+                # Called on the streaming event loop, so the store only gets a checkpoint now and then
+                if time.monotonic() - last_save[0] < PROGRESS_SAVE_INTERVAL:
+                    return
+
+                last_save[0] = time.monotonic()
+                progress_snapshot: Job = self.snapshot(job)
+
+            self.store.save(progress_snapshot)
+
+        try:
+            result: List[str] = self.runner(snapshot, report, cancelled)
+            with self.lock:
+                job.result = result
+                job.status = CANCELLED if cancelled.is_set() else DONE
+        except Exception as exception:
+            print(f"Job {job.id} failed: {exception}")
+            with self.lock:
+                job.error = str(exception)
+                job.status = FAILED
+        finally:
+            with self.lock:
+                self.active.pop(job_key(job.kind, job.url), None)
+                self.cancel_events.pop(job.id, None)
+                snapshot = self.snapshot(job)
+
+            self.store.save(snapshot)
@@ -0,0 +1,72 @@
+import unicodedata
+from functools import lru_cache
+from typing import Any, List, Optional
+
+ENGLISH = 1
+JAPANESE = 2
+OTHER = 3
+
+MEMO_SIZE = 16384
+
+
+def is_kana(char: str) -> bool:
+    return '぀' <= char <= 'ヿ' or 'ㇰ' <= char <= 'ㇿ' or 'ｦ' <= char <= 'ﾟ'
+
+
+def is_kanji(char: str) -> bool:
+    return '一' <= char <= '鿿' or '㐀' <= char <= '䶿'
+
+
+def classify_script(text: str) -> Optional[int]:
+    letters: List[str] = [char for char in text if char.isalpha()]
+
+    # Kanji without kana could be Chinese, but for anime songs it is nearly always Japanese
+    if any(is_kana(char) or is_kanji(char) for char in letters):
+        return JAPANESE
+
+    # Plain ASCII letters cover both English and romaji titles, which are searched the same way
+    if len(letters) > 0 and all(char.isascii() for char in letters):
+        return ENGLISH
+
+    # Accented Latin, other scripts or strings without letters need the real detector
+    return None
+
+
+@lru_cache(maxsize=1)
+def load_detector() -> Any:
+    import pycld2
+    from polyglot.detect import Detector
+    from polyglot.detect.base import UnknownLanguage
+
+    return Detector, (UnknownLanguage, pycld2.error)
+
+
+def detect_with_polyglot(text: str) -> Optional[int]:
+    detector_class, detector_errors = load_detector()
+
+    # Remove non printable characters
+    cleaned_string: str = ' '.join([char for char in text if char.isprintable()])
+    try:
+        detector = detector_class(cleaned_string)
+    except detector_errors:
+        return None
+
+    best_lang = max(detector.languages, key=lambda lang: lang.confidence)
+
+    if best_lang.name == "English":
+        return ENGLISH
+    elif best_lang.name == "Japanese":
+        return JAPANESE
+    else:
+        return OTHER
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def detect_language(text: str) -> Optional[int]:
+    folded: str = unicodedata.normalize("NFKC", text)
+    script_language: Optional[int] = classify_script(folded)
+
+    if script_language is not None:
+        return script_language
+
+    return detect_with_polyglot(text)
@@ -0,0 +1,58 @@
+import importlib
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+# Entry points import this module first, so this is roughly when their own imports started
+STARTED_AT: float = time.perf_counter()
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.name = name
+        self.module: Optional[ModuleType] = None
+        self.load_time: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        if self.module is None:
+            with self.lock:
+                if self.module is None:
+                    start: float = time.perf_counter()
+                    self.module = importlib.import_module(self.name)
+                    self.load_time = time.perf_counter() - start
+
+        return self.module
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.load(), attribute)
+
+
+registry: Dict[str, LazyModule] = {}
+
+
+def lazy_import(name: str) -> LazyModule:
+    if name not in registry:
+        registry[name] = LazyModule(name)
+
+    return registry[name]
+
+
+def profile_report(load_all: bool = True) -> List[str]:
+    lines: List[str] = [f"startup imports: {time.perf_counter() - STARTED_AT:.3f}s"]
+
+    for name, lazy_module in sorted(registry.items()):
+        already_loaded: bool = lazy_module.module is not None
+        if not already_loaded and not load_all:
+            lines.append(f"  {name}: deferred")
+            continue
+
+        lazy_module.load()
+        state: str = "loaded on use" if already_loaded else "deferred"
+        lines.append(f"  {name}: {lazy_module.load_time:.3f}s ({state})")
+
+    lines.append(f"modules in memory: {len(sys.modules)}")
+
+    return lines
@@ -0,0 +1,58 @@
+import re
+import string
+import unicodedata
+from functools import lru_cache
+from os import getenv
+from typing import FrozenSet, Iterable, List
+
+DEFAULT_STOPWORDS: FrozenSet[str] = frozenset([
+    "amv",
+    "hd",
+    "lyrics"
+])
+
+# NFKC already folds full-width ASCII punctuation, these are the Japanese marks it leaves alone
+JAPANESE_PUNCTUATION: str = "「」『』【】〈〉《》〔〕、。・〜"
+
+PUNCTUATION_TABLE = str.maketrans({char: ' ' for char in string.punctuation + JAPANESE_PUNCTUATION})
+ASCII_PUNCTUATION_TABLE = str.maketrans({char: ' ' for char in string.punctuation})
+MULTIPLE_SPACES = re.compile(' +')
+MEMO_SIZE = 65536
+
+
+def load_stopwords() -> FrozenSet[str]:
+    extra_stopwords: List[str] = [word.strip().lower() for word in getenv("EXTRA_STOPWORDS", "").split(",")]
+    return DEFAULT_STOPWORDS | frozenset(word for word in extra_stopwords if len(word) > 0)
+
+
+stopwords: FrozenSet[str] = load_stopwords()
+
+
+def extend_stopwords(words: Iterable[str]):
+    global stopwords
+
+    stopwords = stopwords | frozenset(word.lower() for word in words)
+    normalize.cache_clear()
+
+
+def remove_punctuation(text: str) -> str:
+    return text.translate(ASCII_PUNCTUATION_TABLE)
+
+
+def collapse_spaces(text: str) -> str:
+    return MULTIPLE_SPACES.sub(' ', text)
+
+
+def remove_stopwords(text: str) -> str:
+    return ' '.join(word for word in text.split(' ') if word not in stopwords)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def normalize(text: str) -> str:
+    folded: str = text if text.isascii() else unicodedata.normalize("NFKC", text)
+    return remove_stopwords(collapse_spaces(folded.translate(PUNCTUATION_TABLE).lower()))
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def strip_slashes(text: str) -> str:
+    return collapse_spaces(text.replace('/', '').replace(r'\\', '').translate(ASCII_PUNCTUATION_TABLE))
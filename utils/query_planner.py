@@ -0,0 +1,107 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Set, Tuple
+
+from utils.text_processing import clean_string
+
+# Words that describe the upload rather than the song
+NOISE_TOKENS = frozenset([
+    "official", "video", "music", "mv", "pv", "full", "ver", "version", "tv", "size", "opening", "ending", "op",
+    "ed", "ost", "cover", "sub", "subbed", "eng", "english", "romaji", "kanji", "lyric", "1080p", "720p", "hq",
+    "creditless", "nc", "ncop", "nced", "remastered", "audio", "feat", "ft", "by"
+])
+
+QUOTED_PATTERN = re.compile(r'"([^"]+)"|“([^”]+)”|「([^」]+)」|『([^』]+)』|【([^】]+)】|\(([^)]+)\)|\[([^\]]+)\]')
+
+
+def is_searchable(query: str) -> bool:
+    tokens: List[str] = [token for token in query.split(" ") if len(token) > 0]
+    return len(tokens) > 0 and not all(len(token) < 3 for token in tokens)
+
+
+def get_all_possible_subs(query: List[str], length: int) -> List[List[str]]:
+    subs: List[List[str]] = []
+    query_length: int = len(query)
+
+    assert query_length >= length
+    for start_index in range(query_length - length + 1):
+        subs.append(query[start_index:start_index + length])
+
+    return subs
+
+
+class QueryPlanner(ABC):
+    @abstractmethod
+    def plan(self, query: str) -> List[List[str]]:
+        pass
+
+
+class ExhaustivePlanner(QueryPlanner):
+    # Every window of every length, longest first
+    def plan(self, query: str) -> List[List[str]]:
+        tokens: List[str] = [token for token in clean_string(query).split(" ") if len(token) > 0]
+        batches: List[List[str]] = []
+
+        for length in range(len(tokens), 0, -1):
+            batch: List[str] = [' '.join(sub) for sub in get_all_possible_subs(tokens, length)]
+            batch = [sub for sub in batch if is_searchable(sub)]
+
+            if len(batch) > 0:
+                batches.append(batch)
+
+        return batches
+
+
+class BestFirstPlanner(QueryPlanner):
+    def __init__(self, batch_size: int = 4):
+        self.batch_size = batch_size
+
+    @staticmethod
+    def quoted_titles(query: str) -> Set[str]:
+        titles: Set[str] = set()
+        for match in QUOTED_PATTERN.finditer(query):
+            title: str = next(group for group in match.groups() if group is not None)
+            cleaned_title: str = ' '.join(token for token in clean_string(title).split(" ")
+                                          if len(token) > 0 and token not in NOISE_TOKENS)
+
+            if is_searchable(cleaned_title):
+                titles.add(cleaned_title)
+
+        return titles
+
+    def plan(self, query: str) -> List[List[str]]:
+        tokens: List[str] = [token for token in clean_string(query).split(" ")
+                             if len(token) > 0 and token not in NOISE_TOKENS]
+        quoted_titles: Set[str] = self.quoted_titles(query)
+        ranks: Dict[str, Tuple[int, int, int]] = {}
+
+        # Quoted titles first, then longer windows, then windows closer to the start
+        for title in quoted_titles:
+            ranks[title] = (0, -len(title.split(" ")), 0)
+
+        for length in range(len(tokens), 0, -1):
+            for start_index, sub in enumerate(get_all_possible_subs(tokens, length)):
+                candidate: str = ' '.join(sub)
+
+                # The same words can show up at several window lengths, only search them once
+                if candidate in ranks or not is_searchable(candidate):
+                    continue
+
+                contains_title: bool = any(title in candidate for title in quoted_titles)
+                ranks[candidate] = (1 if contains_title else 2, -length, start_index)
+
+        ranked_candidates: List[str] = sorted(ranks, key=lambda candidate: ranks[candidate])
+        batches: List[List[str]] = [ranked_candidates[index:index + self.batch_size]
+                                    for index in range(0, len(ranked_candidates), self.batch_size)]
+
+        return batches
+
+
+PLANNERS = {
+    'best-first': BestFirstPlanner,
+    'exhaustive': ExhaustivePlanner
+}
+
+
+def get_planner(name: str) -> QueryPlanner:
+    return PLANNERS[name]()
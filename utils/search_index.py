@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, DefaultDict, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from utils.similarity import BatchScorer
+from utils.text_processing import clean_string
+
+GRAM_SIZE = 3
+SEARCHED_FIELDS = ("name", "new_name")
+
+FieldKey = Tuple[str, str]
+
+
+def char_grams(text: str) -> FrozenSet[str]:
+    padded: str = f" {clean_string(text).strip()} "
+    return frozenset(padded[index:index + GRAM_SIZE] for index in range(max(1, len(padded) - GRAM_SIZE + 1)))
+
+
+class SearchIndex:
+    def __init__(self, loader: Callable[[], Iterable[Dict[str, Any]]], max_age: Optional[float] = 600):
+        self.loader = loader
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.postings: DefaultDict[str, Set[FieldKey]] = defaultdict(set)
+        self.grams: Dict[FieldKey, FrozenSet[str]] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.built_at: Optional[float] = None
+
+    def build(self):
+        with self.lock:
+            self.postings = defaultdict(set)
+            self.grams = {}
+            self.documents = {}
+
+            for document in self.loader():
+                self.add(document)
+
+            self.built_at = time.time()
+
+    def ensure_built(self):
+        # Other processes (the tagger CLI) can write to the collection too, so the index is rebuilt now and then
+        if self.built_at is None or (self.max_age is not None and time.time() - self.built_at > self.max_age):
+            self.build()
+
+    def add(self, document: Dict[str, Any]):
+        if document.get("name") is None:
+            return
+
+        document_id: str = str(document["_id"])
+
+        with self.lock:
+            self.remove(document_id)
+            self.documents[document_id] = {
+                'name': document['name'],
+                'url': document.get('url'),
+                'new_name': document.get('new_name')
+            }
+
+            for field in SEARCHED_FIELDS:
+                if document.get(field) is None:
+                    continue
+
+                grams: FrozenSet[str] = char_grams(document[field])
+                self.grams[(document_id, field)] = grams
+                for gram in grams:
+                    self.postings[gram].add((document_id, field))
+
+    def remove(self, document_id: str):
+        with self.lock:
+            if self.documents.pop(document_id, None) is None:
+                return
+
+            for field in SEARCHED_FIELDS:
+                grams: Optional[FrozenSet[str]] = self.grams.pop((document_id, field), None)
+                if grams is None:
+                    continue
+
+                for gram in grams:
+                    self.postings[gram].discard((document_id, field))
+                    if len(self.postings[gram]) == 0:
+                        del self.postings[gram]
+
+    def rename(self, document_id: str, new_name: str):
+        with self.lock:
+            document: Optional[Dict[str, Any]] = self.documents.get(document_id)
+            if document is None:
+                return
+
+            self.add({**document, '_id': document_id, 'new_name': new_name})
+
+    def clear(self):
+        with self.lock:
+            self.postings = defaultdict(set)
+            self.grams = {}
+            self.documents = {}
+
+    def search(self, query: str, limit: int = 20, threshold: float = 0.5) -> List[Dict[str, Any]]:
+        self.ensure_built()
+        query_grams: FrozenSet[str] = char_grams(query)
+        overlaps: DefaultDict[FieldKey, int] = defaultdict(int)
+
+        with self.lock:
+            # Only fields sharing at least one n-gram with the query are ever looked at
+            for gram in query_grams:
+                for field_key in self.postings.get(gram, ()):
+                    overlaps[field_key] += 1
+
+            similarities: Dict[str, float] = {}
+            for field_key, overlap in overlaps.items():
+                dice: float = 2 * overlap / (len(query_grams) + len(self.grams[field_key]))
+                similarities[field_key[0]] = max(similarities.get(field_key[0], 0), dice)
+
+            candidates: List[Tuple[str, float]] = sorted(similarities.items(), key=lambda item: item[1],
+                                                         reverse=True)[:limit * 4]
+            documents: Dict[str, Dict[str, Any]] = {document_id: self.documents[document_id]
+                                                    for document_id, _ in candidates}
+
+        # The n-gram score only pre-selects, the best few are scored like the rest of the tagger does
+        scorer: BatchScorer = BatchScorer(query)
+        search_result: List[Dict[str, Any]] = []
+        for document_id, dice in candidates:
+            document: Dict[str, Any] = documents[document_id]
+            names: List[str] = [document[field] for field in SEARCHED_FIELDS if document.get(field) is not None]
+            similarity: float = max([dice] + scorer.score_many(names))
+
+            if similarity >= threshold:
+                search_result.append({
+                    'name': document['name'],
+                    'url': document['url'],
+                    'new_name': document['new_name'],
+                    'similarity': similarity,
+                    'id': document_id
+                })
+
+        search_result.sort(key=lambda result: result['similarity'], reverse=True)
+        return search_result[:limit]
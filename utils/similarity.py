@@ -0,0 +1,50 @@
+from difflib import SequenceMatcher
+from os import getenv
+from typing import Dict, List, Optional, Sequence
+
+from utils.text_processing import clean_string
+
+try:
+    from rapidfuzz import fuzz
+except ImportError:
+    fuzz = None
+
+BACKENDS = ("difflib", "rapidfuzz")
+
+
+def default_backend() -> str:
+    # rapidfuzz is faster but scores unrelated candidates slightly differently, the thresholds were tuned on difflib
+    backend: str = getenv("SIMILARITY_BACKEND", "difflib")
+    assert backend in BACKENDS
+
+    return backend
+
+
+class BatchScorer:
+    def __init__(self, query: str, backend: Optional[str] = None):
+        self.query: str = clean_string(query)
+        self.backend: str = backend if backend is not None else default_backend()
+
+        if self.backend == "rapidfuzz" and fuzz is None:
+            raise ImportError("rapidfuzz is not installed")
+
+        # SequenceMatcher only indexes its second sequence, so the query is indexed once for every candidate
+        self.matcher: SequenceMatcher = SequenceMatcher(None)
+        self.matcher.set_seq2(self.query)
+
+    def score_cleaned(self, cleaned_candidate: str) -> float:
+        if self.backend == "rapidfuzz":
+            return fuzz.ratio(cleaned_candidate, self.query) / 100
+
+        self.matcher.set_seq1(cleaned_candidate)
+        return self.matcher.ratio()
+
+    def score(self, candidate: str) -> float:
+        return self.score_cleaned(clean_string(candidate))
+
+    def score_many(self, candidates: Sequence[str]) -> List[float]:
+        cleaned_candidates: List[str] = [clean_string(candidate) for candidate in candidates]
+
+        # Candidates repeat a lot (the same album shows up for several queries), score each one once
+        scores: Dict[str, float] = {cleaned: self.score_cleaned(cleaned) for cleaned in set(cleaned_candidates)}
+        return [scores[cleaned] for cleaned in cleaned_candidates]
@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+import time
+from os import getenv
+from pathlib import Path
+from typing import Optional, Union
+
+import eyed3
+from eyed3.id3 import Tag
+from pydantic import BaseModel
+
+from utils.fingerprint_store import audio_hash
+
+MATCHER_FRAME = "ANIMETAGGER_MATCHER"
+CONFIDENCE_FRAME = "ANIMETAGGER_CONFIDENCE"
+
+
+class Provenance(BaseModel):
+    matcher: str
+    confidence: float
+
+
+class ManifestEntry(BaseModel):
+    path: str
+    size: int
+    mtime: float
+    audio_hash: str
+    matcher: str
+    confidence: float
+    tagged: float
+
+
+def write_provenance(tag: Tag, provenance: Provenance):
+    tag.user_text_frames.set(provenance.matcher, MATCHER_FRAME)
+    tag.user_text_frames.set(f"{provenance.confidence:.3f}", CONFIDENCE_FRAME)
+
+
+def read_provenance(path: Union[str, Path]) -> Optional[Provenance]:
+    audio_file = eyed3.load(str(path))
+    if audio_file is None or audio_file.tag is None:
+        return None
+
+    matcher_frame = audio_file.tag.user_text_frames.get(MATCHER_FRAME)
+    confidence_frame = audio_file.tag.user_text_frames.get(CONFIDENCE_FRAME)
+    if matcher_frame is None or confidence_frame is None:
+        return None
+
+    try:
+        return Provenance(matcher=matcher_frame.text, confidence=float(confidence_frame.text))
+    except ValueError:
+        return None
+
+
+class TagManifest:
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                                    "mtime REAL, audio_hash TEXT, matcher TEXT, confidence REAL, tagged REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS files_audio_hash ON files (audio_hash)")
+            self.connection.commit()
+
+        return self.connection
+
+    def get(self, path: Union[str, Path]) -> Optional[ManifestEntry]:
+        with self.lock:
+            row = self.connect().execute("SELECT * FROM files WHERE path = ?", (str(path),)).fetchone()
+
+        return self.entry(row)
+
+    def find(self, content_hash: str) -> Optional[ManifestEntry]:
+        with self.lock:
+            row = self.connect().execute("SELECT * FROM files WHERE audio_hash = ? ORDER BY tagged DESC LIMIT 1",
+                                         (content_hash,)).fetchone()
+
+        return self.entry(row)
+
+    def set(self, entry: ManifestEntry):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (entry.path, entry.size, entry.mtime, entry.audio_hash, entry.matcher,
+                                entry.confidence, entry.tagged))
+            connection.commit()
+
+    def remove(self, path: Union[str, Path]):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("DELETE FROM files WHERE path = ?", (str(path),))
+            connection.commit()
+
+    @staticmethod
+    def entry(row) -> Optional[ManifestEntry]:
+        if row is None:
+            return None
+
+        path, size, mtime, content_hash, matcher, confidence, tagged = row
+        return ManifestEntry(path=path, size=size, mtime=mtime, audio_hash=content_hash, matcher=matcher,
+                             confidence=confidence, tagged=tagged)
+
+    def record(self, path: Path, provenance: Provenance, content_hash: Optional[str] = None,
+               tagged: Optional[float] = None) -> ManifestEntry:
+        stat: os.stat_result = path.stat()
+        entry: ManifestEntry = ManifestEntry(path=str(path.resolve()), size=stat.st_size, mtime=stat.st_mtime,
+                                             audio_hash=content_hash if content_hash is not None else audio_hash(path),
+                                             matcher=provenance.matcher, confidence=provenance.confidence,
+                                             tagged=tagged if tagged is not None else time.time())
+        self.set(entry)
+
+        return entry
+
+    def lookup(self, path: Path) -> Optional[ManifestEntry]:
+        # Only a stat is needed for files that have not been touched since they were recorded
+        stat: os.stat_result = path.stat()
+        entry: Optional[ManifestEntry] = self.get(path.resolve())
+        if entry is not None and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            return entry
+
+        content_hash: str = audio_hash(path)
+        if entry is not None:
+            # Same audio with edited tags is still the same song, different audio has to be tagged again
+            if entry.audio_hash != content_hash:
+                return None
+        else:
+            # The file was moved or renamed since it was tagged, a copy that left the original behind is not adopted
+            entry = self.find(content_hash)
+            if entry is not None:
+                if Path(entry.path).exists():
+                    entry = None
+                else:
+                    self.remove(entry.path)
+
+        if entry is not None:
+            return self.record(path, Provenance(matcher=entry.matcher, confidence=entry.confidence), content_hash,
+                               entry.tagged)
+
+        # Tagged on another machine or before the manifest was lost, the file carries its own marker
+        provenance: Optional[Provenance] = read_provenance(path)
+        if provenance is None:
+            return None
+
+        return self.record(path, provenance, content_hash)
+
+    def needs_tagging(self, path: Path, matcher: str, retag_below: Optional[float] = None) -> bool:
+        try:
+            entry: Optional[ManifestEntry] = self.lookup(path)
+        except OSError:
+            # Whatever is wrong with the file is reported when it is tagged
+            return True
+
+        # Songs tagged by an older matcher get the benefit of its improvements
+        if entry is None or entry.matcher != matcher:
+            return True
+
+        return retag_below is not None and entry.confidence < retag_below
+
+
+tag_manifest: Optional[TagManifest] = None
+
+
+def get_tag_manifest() -> TagManifest:
+    global tag_manifest
+
+    if tag_manifest is None:
+        tag_manifest = TagManifest(getenv("TAG_MANIFEST_PATH", ".cache/manifest.sqlite"))
+
+    return tag_manifest
@@ -0,0 +1,118 @@
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from eyed3.id3 import ID3_V2, ID3_V2_4, Tag
+from eyed3.id3.tag import FileInfo
+from pydantic import BaseModel
+
+from utils.fingerprint_store import audio_bounds
+
+HEADER_SIZE = 10
+COPY_BUFFER = 1024 * 1024
+
+
+class TagWriteResult(BaseModel):
+    path: str
+    rewritten: bool
+
+
+def syncsafe(size: int) -> bytes:
+    return bytes([(size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f])
+
+
+def claim_name(directory: Path, stem: str, suffix: str) -> Path:
+    # Creating the file exclusively is atomic, two workers can never be given the same name
+    index: int = 1
+    while True:
+        target: Path = directory / (f"{stem}{suffix}" if index == 1 else f"{stem} ({index}){suffix}")
+        try:
+            os.close(os.open(str(target), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return target
+        except FileExistsError:
+            index += 1
+
+
+def place(written: Path, original: Path, stem: str) -> Path:
+    target: Path = original.parent / f"{stem}{original.suffix}"
+
+    if target == original:
+        if written != original:
+            os.replace(str(written), str(original))
+        return original
+
+    target = claim_name(original.parent, stem, original.suffix)
+    os.replace(str(written), str(target))
+    if written != original:
+        os.remove(str(original))
+
+    return target
+
+
+class TagWriter:
+    def __init__(self, padding: int = 4096):
+        self.padding = padding
+
+    @staticmethod
+    def rendered_size(scratch: Path) -> int:
+        # The frames end where the padding starts, eyed3 finds that point while parsing the tag back
+        rendered: Tag = Tag()
+        if not rendered.parse(str(scratch), ID3_V2):
+            return 0
+
+        return rendered.file_info.tag_size - rendered.file_info.tag_padding_size
+
+    def write(self, tag: Tag, stem: str) -> TagWriteResult:
+        original_info: FileInfo = tag.file_info
+        original: Path = Path(original_info.name)
+        stem = stem.strip() or original.stem
+        version = tag.version if tag.version[0] == 2 and tag.version[1] != 2 else ID3_V2_4
+
+        # The space in front of the audio frames is what the new tag can use without moving them
+        audio_start, _ = audio_bounds(original)
+
+        # The extended header records the padding size, it is not worth keeping
+        tag.header.extended = False
+
+        scratch: Path = original.parent / f".{uuid.uuid4().hex}.part"
+        try:
+            # Saving to a new file renders only the tag, followed by some padding
+            tag.save(filename=str(scratch), version=version)
+            tag_size: int = self.rendered_size(scratch)
+
+            if 0 < tag_size <= audio_start:
+                with open(str(scratch), "rb") as scratch_file:
+                    tag_data: bytes = scratch_file.read(tag_size)
+
+                with open(str(original), "r+b") as audio_file:
+                    audio_file.write(tag_data[:6] + syncsafe(audio_start - HEADER_SIZE) + tag_data[HEADER_SIZE:])
+                    audio_file.write(b"\x00" * (audio_start - tag_size))
+
+                scratch.unlink()
+                path: Path = place(original, original, stem)
+                tag.file_info = FileInfo(str(path), audio_start, audio_start - tag_size)
+
+                return TagWriteResult(path=str(path), rewritten=False)
+
+            # The tag outgrew its space, the audio is copied once behind it with room for later edits
+            with open(str(scratch), "r+b") as scratch_file, open(str(original), "rb") as audio_file:
+                scratch_file.seek(6)
+                scratch_file.write(syncsafe(tag_size + self.padding - HEADER_SIZE))
+                scratch_file.seek(tag_size)
+                scratch_file.truncate()
+                scratch_file.write(b"\x00" * self.padding)
+                audio_file.seek(audio_start)
+                shutil.copyfileobj(audio_file, scratch_file, COPY_BUFFER)
+
+            path = place(scratch, original, stem)
+            tag.file_info = FileInfo(str(path), tag_size + self.padding, self.padding)
+
+            return TagWriteResult(path=str(path), rewritten=True)
+        finally:
+            # Saving pointed the tag at the scratch file, a failed write leaves it on the original
+            if tag.file_info is not None and Path(tag.file_info.name) == scratch:
+                tag.file_info = original_info
+
+            if scratch.exists():
+                scratch.unlink()
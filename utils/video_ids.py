@@ -0,0 +1,16 @@
+import urllib.parse
+from typing import List
+
+
+def video_id(url: str) -> str:
+    # youtu.be/<id>, youtube.com/watch?v=<id>, youtube.com/shorts/<id> and bare ids all map to the same key
+    parts = urllib.parse.urlsplit(url.strip())
+    query_ids: List[str] = urllib.parse.parse_qs(parts.query).get("v", [])
+    if len(query_ids) > 0:
+        return query_ids[0]
+
+    return parts.path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def video_url(video_id: str) -> str:
+    return f"https://youtu.be/{video_id}"
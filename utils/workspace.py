@@ -0,0 +1,145 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from os import getenv
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+TMPFS_ROOT = Path("/dev/shm")
+OWNER_FILE = ".owner"
+
+
+def disk_usage(path: Path) -> int:
+    total: int = 0
+    for directory, _, files in os.walk(str(path)):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(directory, file)).st_size
+            except OSError:
+                continue
+
+    return total
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Owned by another user, but it exists
+        return True
+
+    return True
+
+
+def owner_gone(path: Path) -> bool:
+    # Only workspaces of a process on this machine that is known to have exited are safe to remove
+    try:
+        host, owner = (path / OWNER_FILE).read_text().split()
+        pid: int = int(owner)
+    except (OSError, ValueError):
+        return False
+
+    return host == socket.gethostname() and pid != os.getpid() and not process_alive(pid)
+
+
+class Workspace:
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self.references = 0
+
+    @property
+    def songs(self) -> Path:
+        return self.path / "songs"
+
+    def disk_usage(self) -> int:
+        return disk_usage(self.path)
+
+
+class WorkspaceManager:
+    def __init__(self, root: Optional[Path] = None, use_tmpfs: bool = False):
+        if root is None:
+            # Songs only live here between download and upload, so memory backed storage is an option
+            base: Path = TMPFS_ROOT if use_tmpfs and TMPFS_ROOT.is_dir() else Path(tempfile.gettempdir())
+            root = base / "animetagger"
+
+        self.root = root
+        self.lock = threading.Lock()
+        self.workspaces: Dict[str, Workspace] = {}
+
+    def acquire(self, name: Optional[str] = None) -> Workspace:
+        workspace_name: str = name if name is not None else uuid.uuid4().hex
+
+        with self.lock:
+            if workspace_name not in self.workspaces:
+                workspace: Workspace = Workspace(workspace_name, self.root / workspace_name)
+                workspace.songs.mkdir(parents=True, exist_ok=True)
+                (workspace.path / OWNER_FILE).write_text(f"{socket.gethostname()} {os.getpid()}")
+                self.workspaces[workspace_name] = workspace
+
+            self.workspaces[workspace_name].references += 1
+
+            return self.workspaces[workspace_name]
+
+    def release(self, workspace: Workspace):
+        # Whoever lets go last removes the directory
+        with self.lock:
+            workspace.references -= 1
+            if workspace.references > 0:
+                return
+
+            self.workspaces.pop(workspace.name, None)
+
+        shutil.rmtree(str(workspace.path), ignore_errors=True)
+
+    @contextmanager
+    def workspace(self, name: Optional[str] = None) -> Iterator[Workspace]:
+        workspace: Workspace = self.acquire(name)
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def get(self, name: str) -> Optional[Workspace]:
+        with self.lock:
+            return self.workspaces.get(name)
+
+    def usage(self) -> Dict[str, int]:
+        with self.lock:
+            workspaces = list(self.workspaces.values())
+
+        return {workspace.name: workspace.disk_usage() for workspace in workspaces}
+
+    def remove_orphans(self) -> int:
+        # Directories left behind by a process that did not shut down cleanly
+        if not self.root.is_dir():
+            return 0
+
+        with self.lock:
+            orphans = [path for path in self.root.iterdir()
+                       if path.name not in self.workspaces and owner_gone(path)]
+
+        for orphan in orphans:
+            shutil.rmtree(str(orphan), ignore_errors=True)
+
+        return len(orphans)
+
+
+workspace_manager: Optional[WorkspaceManager] = None
+
+
+def get_workspace_manager() -> WorkspaceManager:
+    global workspace_manager
+
+    if workspace_manager is None:
+        root: Optional[str] = getenv("WORKSPACE_ROOT")
+        workspace_manager = WorkspaceManager(Path(root) if root is not None else None,
+                                             getenv("WORKSPACE_TMPFS", "") == "1")
+
+    return workspace_manager